@@ -124,6 +124,25 @@ else:
     }
 
 
+# Cache
+# Invalidation (e.g. payment.pricing) only reaches every worker through a
+# shared backend; without REDIS_URL each process keeps its own memory cache.
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -177,4 +196,17 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
 
 # MEDIA_URL = '/media/'
-# MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+# MEDIA_ROOT = BASE_DIR / 'media'
+# Background export jobs (academies.ExportJob) write their files here
+EXPORT_ROOT = os.getenv("EXPORT_ROOT", BASE_DIR / "exports")
+
+# Payment gateway (player_payments.gateways). The simulator runs offline and
+# posts signed webhooks back to this app after LATENCY seconds.
+# Outside DEBUG there is no default webhook secret: without
+# PAYMENT_WEBHOOK_SECRET every webhook is rejected.
+PAYMENT_GATEWAY = {
+    "BACKEND": os.getenv("PAYMENT_GATEWAY_BACKEND", "player_payments.gateways.SimulatorGateway"),
+    "WEBHOOK_SECRET": os.getenv("PAYMENT_WEBHOOK_SECRET", "dev-webhook-secret" if DEBUG else ""),
+    "LATENCY": float(os.getenv("PAYMENT_SIMULATOR_LATENCY", "0")),
+    "FAILURE_RATE": float(os.getenv("PAYMENT_SIMULATOR_FAILURE_RATE", "0")),
+}
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Academy, Program, Session, SessionSlot, TrainingClass
+from .models import Academy, Program, Session, SessionSlot, TrainingClass, ExportJob
 from django.contrib import admin
 from .models import PlanType, SessionSkill, Position, SkillDefinition
 from django import forms
@@ -8,6 +8,7 @@ from django.urls import path
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.template.response import TemplateResponse
+from .forms import TrainerConflictMixin
 
 class ProgramInline(admin.TabularInline):
     model = Program
@@ -51,8 +52,15 @@ class ProgramAdmin(admin.ModelAdmin):
     search_fields = ("title",)
     # inlines = [SessionInline]
 
+class SessionAdminForm(TrainerConflictMixin, forms.ModelForm):
+    class Meta:
+        model = Session
+        fields = "__all__"
+
+
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
+    form = SessionAdminForm
     list_display = ("title", "program", "trainer", "level", "gender", "capacity", "start_datetime", "end_datetime", "generate_classes_link")
     list_filter = ("level", "gender")
     search_fields = ("title",)
@@ -107,10 +115,11 @@ class SessionAdmin(admin.ModelAdmin):
 
     def generate_training_classes(self, request, queryset):
         count = 0
-        for session in queryset:
-            session.generate_classes()
+        created = 0
+        for session in queryset.prefetch_related("slots"):
+            created += session.generate_classes()["created"]
             count += 1
-        self.message_user(request, f"تم توليد الحصص لـ {count} جلسة بنجاح ")
+        self.message_user(request, f"تم توليد الحصص لـ {count} جلسة بنجاح ({created} حصة جديدة)")
 
     generate_training_classes.short_description = "🔄 توليد الحصص (Training Classes) للجلسات المحددة"
 
@@ -121,8 +130,35 @@ class SessionAdmin(admin.ModelAdmin):
 
 
 
+class SessionSlotAdminForm(forms.ModelForm):
+    class Meta:
+        model = SessionSlot
+        fields = "__all__"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        session = cleaned_data.get("session")
+        if session and session.trainer and cleaned_data.get("weekday") and cleaned_data.get("start_time") and cleaned_data.get("end_time"):
+            from .scheduling import find_trainer_conflicts
+
+            slot = SessionSlot(
+                pk=self.instance.pk,
+                session=session,
+                weekday=cleaned_data["weekday"],
+                start_time=cleaned_data["start_time"],
+                end_time=cleaned_data["end_time"],
+            )
+            for conflict in find_trainer_conflicts(session.trainer, session, slots=[slot]):
+                raise forms.ValidationError(
+                    f"{session.trainer} is already coaching {conflict.other.title} "
+                    f"on {slot.get_weekday_display()} at that time."
+                )
+        return cleaned_data
+
+
 @admin.register(SessionSlot)
 class SessionSlotAdmin(admin.ModelAdmin):
+    form = SessionSlotAdminForm
     list_display = ("session", "weekday", "start_time", "end_time")
     list_filter = ("weekday", "session")
     
@@ -159,3 +195,11 @@ class TrainingClassAdmin(admin.ModelAdmin):
 class PlanTypeAdmin(admin.ModelAdmin):
     list_display = ("name", "description")
     search_fields = ("name",)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("academy", "kind", "file_format", "status", "rows_done", "rows_total", "created_at", "finished_at")
+    list_filter = ("status", "kind", "file_format")
+    search_fields = ("academy__name",)
+    readonly_fields = ("created_at", "started_at", "finished_at")
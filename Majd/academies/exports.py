@@ -0,0 +1,314 @@
+# academies/exports.py
+import csv
+import os
+import tempfile
+from datetime import timedelta
+
+import openpyxl
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils import timezone
+
+from player.models import PlayerProfile, PlayerSession, PlayerClassAttendance, Evaluation
+from .models import Session, ExportJob
+
+
+EXPORT_CHUNK_SIZE = 2000
+# a running job whose worker hasn't recorded progress for this long is considered abandoned
+EXPORT_JOB_LEASE = timedelta(hours=1)
+
+CSV_CONTENT_TYPE = "text/csv"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+PLAYER_HEADERS = ["Name", "Session", "Level", "Status", "Injury Risk"]
+ATTENDANCE_HEADERS = ["Player", "Session", "Class Date", "Start Time", "Status", "Notes"]
+EVALUATION_HEADERS = ["Player", "Coach", "Class Date", "Skill", "Score", "Skill Score", "Performance Score", "Feedback", "Created At"]
+PAYMENT_HEADERS = ["Transaction", "Child", "Plan", "Type", "Status", "Base", "VAT", "Amount", "Currency", "Created At", "Processed At"]
+
+LEVEL_LABELS = dict(Session.Level.choices)
+
+
+def injury_risk(avg_progress):
+    if avg_progress < 40:
+        return "High"
+    elif avg_progress < 70:
+        return "Medium"
+    return "Low"
+
+
+def with_first_session(players):
+    """
+    Annotate each player with the title and level of their first PlayerSession
+    (lowest pk, same as player.player_sessions.first()) as correlated subqueries.
+    """
+    first_session = PlayerSession.objects.filter(player=OuterRef("pk")).order_by("pk")
+    return players.annotate(
+        first_session_title=Subquery(first_session.values("session__title")[:1]),
+        first_session_level=Subquery(first_session.values("session__level")[:1]),
+    )
+
+
+def player_rows(players, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one export row per player, reading the queryset with a server-side
+    iterator so memory stays flat regardless of the number of players.
+    """
+    values = (
+        with_first_session(players.prefetch_related(None))
+        .order_by("pk")
+        .values_list(
+            "child__first_name",
+            "child__last_name",
+            "first_session_title",
+            "first_session_level",
+            "avg_progress",
+        )
+    )
+    for first_name, last_name, title, level, avg_progress in values.iterator(chunk_size=chunk_size):
+        yield [
+            f"{first_name} {last_name}",
+            title if title is not None else "N/A",
+            LEVEL_LABELS.get(level, level) if level is not None else "N/A",
+            "On Schedule" if title is not None else "Not Enrolled",
+            injury_risk(avg_progress),
+        ]
+
+
+def attendance_rows(attendances, chunk_size=EXPORT_CHUNK_SIZE):
+    values = attendances.order_by("pk").values_list(
+        "player__child__first_name",
+        "player__child__last_name",
+        "training_class__session__title",
+        "training_class__date",
+        "training_class__start_time",
+        "status",
+        "notes",
+    )
+    status_labels = dict(PlayerClassAttendance.Status.choices)
+    for first_name, last_name, session_title, day, start_time, status, notes in values.iterator(chunk_size=chunk_size):
+        yield [
+            f"{first_name} {last_name}",
+            session_title,
+            day.isoformat(),
+            start_time.strftime("%H:%M"),
+            status_labels.get(status, status),
+            notes or "",
+        ]
+
+
+def evaluation_rows(evaluations, chunk_size=EXPORT_CHUNK_SIZE):
+    values = evaluations.order_by("pk").values_list(
+        "player__child__first_name",
+        "player__child__last_name",
+        "coach__user__first_name",
+        "coach__user__last_name",
+        "training_class__date",
+        "skill__name",
+        "score",
+        "skill_score",
+        "performance_score",
+        "feedback",
+        "created_at",
+    )
+    for (first_name, last_name, coach_first, coach_last, day, skill, score,
+         skill_score, performance_score, feedback, created_at) in values.iterator(chunk_size=chunk_size):
+        yield [
+            f"{first_name} {last_name}",
+            f"{coach_first or ''} {coach_last or ''}".strip() or "N/A",
+            day.isoformat() if day else "N/A",
+            skill or "",
+            score,
+            skill_score if skill_score is not None else "",
+            performance_score if performance_score is not None else "",
+            feedback,
+            timezone.localtime(created_at).strftime("%Y-%m-%d %H:%M"),
+        ]
+
+
+def payment_rows(transactions, chunk_size=EXPORT_CHUNK_SIZE):
+    values = transactions.order_by("pk").values_list(
+        "pk",
+        "enrollment__child__first_name",
+        "enrollment__child__last_name",
+        "enrollment__subscription__title",
+        "transaction_type",
+        "status",
+        "base_amount",
+        "vat_amount",
+        "amount",
+        "currency",
+        "created_at",
+        "processed_at",
+    )
+    for (pk, first_name, last_name, plan, transaction_type, status, base_amount, vat_amount, amount,
+         currency, created_at, processed_at) in values.iterator(chunk_size=chunk_size):
+        yield [
+            pk,
+            f"{first_name} {last_name}",
+            plan,
+            transaction_type,
+            status,
+            str(base_amount) if base_amount is not None else "",
+            str(vat_amount) if vat_amount is not None else "",
+            str(amount),
+            currency,
+            timezone.localtime(created_at).strftime("%Y-%m-%d %H:%M"),
+            timezone.localtime(processed_at).strftime("%Y-%m-%d %H:%M") if processed_at else "",
+        ]
+
+
+def academy_players(academy):
+    return PlayerProfile.objects.filter(academy=academy)
+
+
+def academy_attendance(academy):
+    return PlayerClassAttendance.objects.filter(training_class__session__program__academy=academy)
+
+
+def academy_evaluations(academy):
+    return Evaluation.objects.filter(player__academy=academy)
+
+
+def academy_payments(academy):
+    from player_payments.models import PaymentTransaction
+
+    return PaymentTransaction.objects.filter(enrollment__subscription__academy=academy)
+
+
+# kind -> (sheet title, headers, source queryset, row generator)
+EXPORT_KINDS = {
+    ExportJob.Kind.PLAYERS: ("Players", PLAYER_HEADERS, academy_players, player_rows),
+    ExportJob.Kind.ATTENDANCE: ("Attendance", ATTENDANCE_HEADERS, academy_attendance, attendance_rows),
+    ExportJob.Kind.EVALUATIONS: ("Evaluations", EVALUATION_HEADERS, academy_evaluations, evaluation_rows),
+    ExportJob.Kind.PAYMENTS: ("Payments", PAYMENT_HEADERS, academy_payments, payment_rows),
+}
+
+
+class Echo:
+    """File-like object whose write() just hands the line back, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(file, headers, rows):
+    writer = csv.writer(file)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_xlsx(file, title, headers, rows):
+    """
+    Write rows to an .xlsx using openpyxl's write-only mode, which flushes each
+    row to disk instead of keeping the sheet in memory.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+def csv_response(filename, headers, rows):
+    response = StreamingHttpResponse(iter_csv(headers, rows), content_type=CSV_CONTENT_TYPE)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(filename, title, headers, rows):
+    # A zip container can't be produced incrementally, so the workbook is spooled
+    # to a temporary file and streamed back from disk.
+    tmp = tempfile.TemporaryFile()
+    write_xlsx(tmp, title, headers, rows)
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def export_path(file_name):
+    return os.path.join(settings.EXPORT_ROOT, file_name)
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running and return it, or None.
+    The conditional UPDATE makes it safe to run several workers side by side.
+    The running worker renews claimed_at with every progress update, so only
+    jobs whose worker has gone quiet for EXPORT_JOB_LEASE are claimed again
+    and start over.
+    """
+    now = timezone.now()
+    claimable = (
+        Q(status=ExportJob.Status.QUEUED)
+        | Q(status=ExportJob.Status.RUNNING, claimed_at__lt=now - EXPORT_JOB_LEASE)
+    )
+    for pk in ExportJob.objects.filter(claimable).order_by("created_at").values_list("pk", flat=True)[:10]:
+        claimed = ExportJob.objects.filter(claimable, pk=pk).update(
+            status=ExportJob.Status.RUNNING,
+            started_at=now,
+            claimed_at=now,
+            rows_done=0,
+        )
+        if claimed:
+            return ExportJob.objects.select_related("academy").get(pk=pk)
+    return None
+
+
+def _tracked(job, rows, every):
+    """Pass rows through, saving job.rows_done and renewing the claim every `every` rows."""
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % every == 0:
+            ExportJob.objects.filter(pk=job.pk).update(rows_done=done, claimed_at=timezone.now())
+    job.rows_done = done
+
+
+def run_export_job(job, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write the job's export to EXPORT_ROOT, chunk by chunk, recording progress
+    as it goes. Returns the job with its final status.
+    """
+    title, headers, source, row_generator = EXPORT_KINDS[job.kind]
+    queryset = source(job.academy)
+
+    job.rows_total = queryset.count()
+    ExportJob.objects.filter(pk=job.pk).update(rows_total=job.rows_total, claimed_at=timezone.now())
+
+    file_name = f"{job.academy_id}-{job.pk}-{job.download_name}"
+    path = export_path(file_name)
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+
+    try:
+        rows = _tracked(job, row_generator(queryset, chunk_size=chunk_size), chunk_size)
+        if job.file_format == ExportJob.Format.EXCEL:
+            with open(path, "wb") as file:
+                write_xlsx(file, title, headers, rows)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                write_csv(file, headers, rows)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        job.status = ExportJob.Status.FAILED
+        job.error_message = str(e)
+        job.finished_at = timezone.now()
+        # rows_done is left as the last progress update recorded it
+        job.save(update_fields=["status", "error_message", "finished_at"])
+        return job
+
+    job.status = ExportJob.Status.COMPLETED
+    job.file_name = file_name
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "file_name", "rows_done", "finished_at"])
+    return job
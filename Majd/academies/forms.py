@@ -1,6 +1,6 @@
 # academies/forms.py
 from django import forms
-from .models import Academy, Program, Session, SessionSlot
+from .models import Academy, Program, Session, SessionSlot, ExportJob
 from payment.models import SubscriptionPlan
 from accounts.models import TrainerProfile
 from django.contrib.auth.models import User
@@ -23,7 +23,36 @@ from django import forms
 from .models import Session
 from accounts.models import TrainerProfile
 
-class SessionForm(forms.ModelForm):
+class TrainerConflictMixin:
+    """
+    Reject a trainer who is already coaching at one of the session's slot
+    times. Used by the trainer-facing SessionForm and the admin's session form;
+    slots themselves are added through SessionSlotAdminForm, which runs the
+    same check. A session without slots yet can't clash.
+    """
+
+    def clean(self):
+        cleaned_data = super().clean()
+        trainer = cleaned_data.get("trainer")
+        if trainer and self.instance.pk:
+            from .scheduling import find_trainer_conflicts
+
+            conflicts = find_trainer_conflicts(
+                trainer,
+                self.instance,
+                cleaned_data.get("start_datetime"),
+                cleaned_data.get("end_datetime"),
+            )
+            for conflict in conflicts:
+                self.add_error(
+                    "trainer",
+                    f"{trainer} is already coaching {conflict.other.title} "
+                    f"on {conflict.slot.get_weekday_display()} at that time.",
+                )
+        return cleaned_data
+
+
+class SessionForm(TrainerConflictMixin, forms.ModelForm):
     class Meta:
         model = Session
         exclude = ("program", "enrolled") 
@@ -57,7 +86,14 @@ class SessionForm(forms.ModelForm):
         if instance.enrolled is None:
             instance.enrolled = 0
         if commit:
-            instance.save()
+            if instance.pk:
+                # enrolled is the seat counter kept by parents.seats; never write back a stale copy
+                instance.save(update_fields=[
+                    f.name for f in instance._meta.concrete_fields
+                    if not f.primary_key and f.name != "enrolled"
+                ])
+            else:
+                instance.save()
         return instance
 
 
@@ -117,4 +153,13 @@ class AdminTrainerDecisionForm(forms.Form):
         action = self.cleaned_data["action"]
         if action not in {"approve", "reject"}:
             raise forms.ValidationError("Invalid action.")
-        return action
\ No newline at end of file
+        return action
+
+class ExportJobForm(forms.ModelForm):
+    class Meta:
+        model = ExportJob
+        fields = ["kind", "file_format"]
+        widgets = {
+            "kind": forms.Select(attrs={"class": "form-select"}),
+            "file_format": forms.Select(attrs={"class": "form-select"}),
+        }
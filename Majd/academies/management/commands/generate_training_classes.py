@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from academies.models import Academy, Session
+from academies.scheduling import generate_session_classes
+
+
+class Command(BaseCommand):
+    help = 'Generate (or regenerate) TrainingClass rows from session slots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--academy-slug',
+            type=str,
+            help='Generate classes for the sessions of a specific academy (by slug)',
+        )
+        parser.add_argument(
+            '--all-academies',
+            action='store_true',
+            help='Generate classes for every session on the platform',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of sessions loaded (with their slots) per batch',
+        )
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.filter(
+            start_datetime__isnull=False,
+            end_datetime__isnull=False,
+        )
+
+        if options['academy_slug']:
+            try:
+                academy = Academy.objects.get(slug=options['academy_slug'])
+            except Academy.DoesNotExist:
+                self.stdout.write(
+                    self.style.ERROR(f'Academy with slug "{options["academy_slug"]}" not found.')
+                )
+                return
+            sessions = sessions.filter(program__academy=academy)
+        elif not options['all_academies']:
+            self.stdout.write(
+                self.style.ERROR('Use --academy-slug or --all-academies.')
+            )
+            return
+
+        sessions = sessions.order_by('pk').prefetch_related('slots')
+
+        totals = {"sessions": 0, "created": 0, "updated": 0, "deleted": 0}
+        for session in sessions.iterator(chunk_size=options['batch_size']):
+            result = generate_session_classes(session)
+            totals["sessions"] += 1
+            for key in ("created", "updated", "deleted"):
+                totals[key] += result[key]
+
+            if totals["sessions"] % options['batch_size'] == 0:
+                self.stdout.write(f'  processed {totals["sessions"]} sessions...')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nCompleted! {totals["sessions"]} sessions: created {totals["created"]}, '
+                f'updated {totals["updated"]}, deleted {totals["deleted"]} training classes.'
+            )
+        )
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from academies.exports import claim_next_job, run_export_job, EXPORT_CHUNK_SIZE
+from academies.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Process queued academy export jobs (players, attendance, evaluations, payments)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling for new jobs',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Rows fetched from the database per chunk',
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(f'Running {job}...')
+            job = run_export_job(job, chunk_size=options['chunk_size'])
+            processed += 1
+
+            if job.status == ExportJob.Status.COMPLETED:
+                self.stdout.write(self.style.SUCCESS(f'  ✓ {job.rows_done} rows written to {job.file_name}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  ✗ Export failed: {job.error_message}'))
+
+        self.stdout.write(self.style.SUCCESS(f'\nCompleted! Processed {processed} export jobs.'))
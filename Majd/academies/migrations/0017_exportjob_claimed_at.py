@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+def claim_running_jobs(apps, schema_editor):
+    """Start the lease of jobs already running from when they were started."""
+    ExportJob = apps.get_model("academies", "ExportJob")
+    ExportJob.objects.filter(status="running").update(claimed_at=models.F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academies', '0016_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(claim_running_jobs, migrations.RunPython.noop),
+    ]
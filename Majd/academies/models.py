@@ -42,6 +42,16 @@ class Academy(models.Model):
 
 
 
+class ProgramQuerySet(models.QuerySet):
+    def with_stats(self):
+        return self.annotate(
+            num_sessions=models.Count("sessions"),
+            num_players=models.Sum("sessions__enrolled"),
+            min_age=models.Min("sessions__age_min"),
+            max_age=models.Max("sessions__age_max"),
+        )
+
+
 class Program(models.Model):
 
     class SportType(models.TextChoices):
@@ -58,13 +68,17 @@ class Program(models.Model):
     image = CloudinaryField('program', folder='Majd/academies/programs', blank=True, null=True)
     sport_type = models.CharField(max_length=20, choices=SportType.choices, default=SportType.FOOTBALL)
 
+    objects = ProgramQuerySet.as_manager()
+
     def age_group_display(self):
-        sessions = self.sessions.all()
-        if not sessions.exists():
-            return None
+        if hasattr(self, "min_age"):
+            min_age, max_age = self.min_age, self.max_age
+        else:
+            ages = self.sessions.aggregate(min_age=models.Min("age_min"), max_age=models.Max("age_max"))
+            min_age, max_age = ages["min_age"], ages["max_age"]
 
-        min_age = min(s.age_min for s in sessions)
-        max_age = max(s.age_max for s in sessions)
+        if min_age is None:
+            return None
         return f"{min_age}-{max_age} years"
     
     def __str__(self):
@@ -73,10 +87,14 @@ class Program(models.Model):
     
     @property
     def sessions_count(self):
+        if hasattr(self, "num_sessions"):
+            return self.num_sessions
         return self.sessions.count()
 
     @property
     def players_count(self):
+        if hasattr(self, "num_players"):
+            return self.num_players or 0
         return self.sessions.aggregate(total=models.Sum("enrolled"))["total"] or 0
 
 
@@ -124,26 +142,14 @@ class Session(models.Model):
         return f"{months} month{'s' if months > 1 else ''}"
 
     def generate_classes(self):
-        from datetime import timedelta
-        from .models import TrainingClass  
-
-        current_date = self.start_datetime.date()
-        end_date = self.end_datetime.date()
-
-        while current_date <= end_date:
-            weekday_str = current_date.strftime("%a").lower()[:3] 
-            for slot in self.slots.all():
-                if slot.weekday == weekday_str:
-                    TrainingClass.objects.get_or_create(
-                        session=self,
-                        slot=slot,
-                        date=current_date,
-                        defaults={
-                            "start_time": slot.start_time,
-                            "end_time": slot.end_time,
-                        }
-                    )
-            current_date += timedelta(days=1)
+        from .scheduling import generate_session_classes
+
+        return generate_session_classes(self)
+
+    def next_occurrences(self, limit=1, after=None):
+        from .scheduling import next_occurrences
+
+        return next_occurrences(self, limit, after)
 
     def duration_weeks(self):
         if self.start_datetime and self.end_datetime:
@@ -224,3 +230,60 @@ class PlanType(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ExportJob(models.Model):
+    class Kind(models.TextChoices):
+        PLAYERS     = "players", "Players"
+        ATTENDANCE  = "attendance", "Attendance"
+        EVALUATIONS = "evaluations", "Evaluations"
+        PAYMENTS    = "payments", "Payments"
+
+    class Format(models.TextChoices):
+        CSV   = "csv", "CSV"
+        EXCEL = "excel", "Excel"
+
+    class Status(models.TextChoices):
+        QUEUED    = "queued", "Queued"
+        RUNNING   = "running", "Running"
+        COMPLETED = "completed", "Completed"
+        FAILED    = "failed", "Failed"
+
+    academy = models.ForeignKey(Academy, on_delete=models.CASCADE, related_name="export_jobs")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="export_jobs")
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.PLAYERS)
+    file_format = models.CharField(max_length=10, choices=Format.choices, default=Format.CSV)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED, db_index=True)
+
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    error_message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # renewed by the running worker on every progress update
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} export ({self.academy}) - {self.status}"
+
+    @property
+    def progress(self):
+        if self.status == self.Status.COMPLETED:
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(100, round(self.rows_done * 100 / self.rows_total))
+
+    @property
+    def extension(self):
+        return "xlsx" if self.file_format == self.Format.EXCEL else "csv"
+
+    @property
+    def download_name(self):
+        return f"{self.kind}.{self.extension}"
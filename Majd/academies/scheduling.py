@@ -0,0 +1,305 @@
+# academies/scheduling.py
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from heapq import merge
+from itertools import count, islice
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# SessionSlot.weekday codes -> date.weekday() (Monday == 0)
+WEEKDAY_INDEX = {
+    "mon": 0,
+    "tue": 1,
+    "wed": 2,
+    "thu": 3,
+    "fri": 4,
+    "sat": 5,
+    "sun": 6,
+}
+
+
+def first_weekday_on_or_after(start_date, weekday):
+    """
+    Return the first date >= start_date that falls on the given slot weekday code.
+    """
+    offset = (WEEKDAY_INDEX[weekday] - start_date.weekday()) % 7
+    return start_date + timedelta(days=offset)
+
+
+def slot_dates(slot, start_date, end_date):
+    """
+    Yield every date between start_date and end_date (inclusive) on which the slot occurs.
+    Computed arithmetically: one weekday offset, then 7-day steps.
+    """
+    current = first_weekday_on_or_after(start_date, slot.weekday)
+    week = timedelta(days=7)
+    while current <= end_date:
+        yield current
+        current += week
+
+
+def session_date_range(session):
+    if not session.start_datetime or not session.end_datetime:
+        return None
+    return session.start_datetime.date(), session.end_datetime.date()
+
+
+def planned_classes(session):
+    """
+    Map (slot_id, date) -> (start_time, end_time) for every class the session's slots imply.
+    Uses session.slots.all(), so a prefetch_related("slots") is honoured.
+    """
+    date_range = session_date_range(session)
+    if date_range is None:
+        return {}
+
+    start_date, end_date = date_range
+    planned = {}
+    for slot in session.slots.all():
+        for day in slot_dates(slot, start_date, end_date):
+            planned[(slot.id, day)] = (slot.start_time, slot.end_time)
+    return planned
+
+
+Occurrence = namedtuple("Occurrence", ["date", "start_time", "end_time", "slot"])
+
+
+def _slot_occurrences(slot, start_date, end_date):
+    for day in slot_dates(slot, start_date, end_date):
+        yield Occurrence(day, slot.start_time, slot.end_time, slot)
+
+
+def next_occurrences(session, limit=1, after=None):
+    """
+    Return the session's next `limit` occurrences on or after `after` (today by
+    default), ordered by date and start time.
+
+    Each slot contributes one arithmetic date sequence; the sequences are merged
+    lazily, so the cost is O(slots + limit) with no per-day scanning. Uses
+    session.slots.all(), so a prefetch_related("slots") is honoured.
+    """
+    date_range = session_date_range(session)
+    if date_range is None:
+        return []
+
+    start_date, end_date = date_range
+    start_date = max(start_date, after or timezone.localdate())
+    streams = [_slot_occurrences(slot, start_date, end_date) for slot in session.slots.all()]
+    ordered = merge(*streams, key=lambda o: (o.date, o.start_time))
+    return list(islice(ordered, limit))
+
+
+def next_occurrence(session, after=None):
+    """The session's next Occurrence on or after `after` (today by default), or None."""
+    occurrences = next_occurrences(session, 1, after)
+    return occurrences[0] if occurrences else None
+
+
+def _has_records(training_class):
+    return (
+        training_class.has_attendance
+        or training_class.has_evaluations
+        or training_class.has_notes
+        or training_class.has_plan
+    )
+
+
+@transaction.atomic
+def generate_session_classes(session):
+    """
+    Bring the session's generated TrainingClass rows in line with its slots.
+
+    - classes implied by a slot but missing are bulk-inserted (conflicts ignored)
+    - classes whose slot times changed are bulk-updated
+    - classes whose slot/date no longer exists are deleted, unless they already
+      carry attendance, evaluations, notes or a plan
+
+    Manually created classes (slot is NULL) are never touched; a planned class that
+    collides with one on (session, date, start_time) is skipped by the database, so
+    "created" counts the rows submitted for insert.
+    Returns a dict with created / updated / deleted counts.
+    """
+    from django.db.models import Exists, OuterRef
+    from .models import TrainingClass
+    from player.models import PlayerClassAttendance, Evaluation
+    from trainers.models import TrainingNote, ClassPlan
+
+    planned = planned_classes(session)
+
+    existing = (
+        TrainingClass.objects
+        .filter(session=session, slot__isnull=False)
+        .annotate(
+            has_attendance=Exists(PlayerClassAttendance.objects.filter(training_class=OuterRef("pk"))),
+            has_evaluations=Exists(Evaluation.objects.filter(training_class=OuterRef("pk"))),
+            has_notes=Exists(TrainingNote.objects.filter(training_class=OuterRef("pk"))),
+            has_plan=Exists(ClassPlan.objects.filter(training_class=OuterRef("pk"))),
+        )
+        .order_by()
+    )
+
+    to_update = []
+    to_delete = []
+    seen = set()
+    for training_class in existing:
+        key = (training_class.slot_id, training_class.date)
+        times = planned.get(key)
+        if times is None:
+            if not _has_records(training_class):
+                to_delete.append(training_class.pk)
+            continue
+
+        seen.add(key)
+        if (training_class.start_time, training_class.end_time) != times:
+            training_class.start_time, training_class.end_time = times
+            to_update.append(training_class)
+
+    if to_delete:
+        TrainingClass.objects.filter(pk__in=to_delete).delete()
+
+    if to_update:
+        TrainingClass.objects.bulk_update(to_update, ["start_time", "end_time"])
+
+    to_create = [
+        TrainingClass(
+            session=session,
+            slot_id=slot_id,
+            date=day,
+            start_time=start_time,
+            end_time=end_time,
+        )
+        for (slot_id, day), (start_time, end_time) in planned.items()
+        if (slot_id, day) not in seen
+    ]
+    created = 0
+    if to_create:
+        created = len(TrainingClass.objects.bulk_create(to_create, ignore_conflicts=True))
+
+    return {"created": created, "updated": len(to_update), "deleted": len(to_delete)}
+
+
+ScheduleConflict = namedtuple("ScheduleConflict", ["owner", "session", "slot", "other"])
+
+
+def date_ranges_overlap(a, b):
+    """Inclusive overlap of two (start_date, end_date) ranges; None means open-ended."""
+    if a is None or b is None:
+        return True
+    return a[0] <= b[1] and b[0] <= a[1]
+
+
+class WeeklyIndex:
+    """
+    Per-weekday sorted intervals of the slots of a set of sessions.
+
+    Lookups bisect on the slot end time, so only slots that start before the
+    probe ends are inspected.
+    """
+
+    def __init__(self):
+        self._by_weekday = defaultdict(list)
+        self._seq = count()
+
+    def add(self, session):
+        date_range = session_date_range(session)
+        for slot in session.slots.all():
+            insort(
+                self._by_weekday[slot.weekday],
+                (slot.start_time, slot.end_time, next(self._seq), date_range, session),
+            )
+
+    def conflicts(self, slots, date_range=None, exclude=None):
+        """
+        Return (slot, other_session) pairs for every indexed slot that overlaps one of
+        `slots` on the same weekday while the sessions' date ranges overlap.
+        Sessions with pk == exclude are ignored.
+        """
+        found = []
+        for slot in slots:
+            entries = self._by_weekday.get(slot.weekday, [])
+            stop = bisect_left(entries, (slot.end_time,))
+            for _, end_time, _, other_range, other in entries[:stop]:
+                if end_time <= slot.start_time or other.pk == exclude:
+                    continue
+                if date_ranges_overlap(date_range, other_range):
+                    found.append((slot, other))
+        return found
+
+
+def build_child_indexes(child_ids):
+    """
+    One WeeklyIndex per child, from the sessions of their active enrollments.
+    Costs two queries (sessions + slots prefetch) whatever the number of children.
+    """
+    from .models import Session
+
+    sessions = (
+        Session.objects
+        .filter(enrollments__child_id__in=child_ids, enrollments__is_active=True)
+        .annotate(enrolled_child_id=F("enrollments__child_id"))
+        .prefetch_related("slots")
+    )
+    indexes = defaultdict(WeeklyIndex)
+    for session in sessions:
+        indexes[session.enrolled_child_id].add(session)
+    return indexes
+
+
+def find_enrollment_conflicts(children, sessions):
+    """
+    Check whether enrolling `children` in `sessions` clashes with the children's
+    existing sessions, or with each other. Returns every ScheduleConflict found
+    (owner is the child); an empty list means the enrollment is clear.
+
+    `sessions` should have their slots prefetched.
+    """
+    children = list(children)
+    sessions = list(sessions)
+    indexes = build_child_indexes([child.pk for child in children])
+
+    conflicts = []
+    for child in children:
+        index = indexes[child.pk]
+        for session in sessions:
+            slots = session.slots.all()
+            for slot, other in index.conflicts(slots, session_date_range(session), exclude=session.pk):
+                conflicts.append(ScheduleConflict(child, session, slot, other))
+            index.add(session)
+    return conflicts
+
+
+def find_trainer_conflicts(trainer, session, start_datetime=None, end_datetime=None, slots=None):
+    """
+    Check whether `trainer` would be double-booked by `session`'s slots (or the
+    given unsaved `slots`) over the given dates (defaults to the session's own).
+    Returns a list of ScheduleConflict (owner is the trainer).
+    """
+    from .models import Session
+
+    if slots is None:
+        if session.pk is None:
+            return []
+        slots = session.slots.all()
+    if trainer is None:
+        return []
+
+    start_datetime = start_datetime or session.start_datetime
+    end_datetime = end_datetime or session.end_datetime
+    date_range = (start_datetime.date(), end_datetime.date()) if start_datetime and end_datetime else None
+
+    others = Session.objects.filter(trainer=trainer).exclude(pk=session.pk)
+    if date_range:
+        others = others.exclude(start_datetime__date__gt=date_range[1]).exclude(end_datetime__date__lt=date_range[0])
+
+    index = WeeklyIndex()
+    for other in others.prefetch_related("slots"):
+        index.add(other)
+
+    return [
+        ScheduleConflict(trainer, session, slot, other)
+        for slot, other in index.conflicts(slots, date_range)
+    ]
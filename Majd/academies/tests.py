@@ -1,3 +1,721 @@
+from datetime import date, time, datetime
+
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import AcademyAdminProfile, TrainerProfile, ParentProfile
+from parents.models import Child
+from player.models import PlayerProfile, PlayerSession
+from .models import Academy, Program, Session, SessionSlot, TrainingClass, ExportJob
+from .scheduling import slot_dates
+
+
+def make_academy(name="Test Academy"):
+    user = User.objects.create(username=f"admin-{name}")
+    owner = AcademyAdminProfile.objects.create(user=user)
+    return Academy.objects.create(name=name, description="Test", city="Riyadh", owner=owner)
+
+
+def make_trainer(academy, username):
+    user = User.objects.create(username=username)
+    return TrainerProfile.objects.create(
+        user=user, academy=academy, approval_status=TrainerProfile.ApprovalStatus.APPROVED
+    )
+
+
+def make_player(academy, first_name, parent=None):
+    if parent is None:
+        user = User.objects.create(username=f"parent-{first_name}")
+        parent = ParentProfile.objects.create(user=user)
+    child = Child.objects.create(parent=parent, first_name=first_name, date_of_birth=date(2015, 5, 1))
+    return PlayerProfile.objects.create(child=child, academy=academy)
+
+
+def make_session(program, start, end, **kwargs):
+    return Session.objects.create(
+        program=program,
+        title=kwargs.pop("title", "Session"),
+        start_datetime=timezone.make_aware(datetime.combine(start, time(8, 0))),
+        end_datetime=timezone.make_aware(datetime.combine(end, time(8, 0))),
+        **kwargs,
+    )
+
+
+class ClassGenerationTest(TestCase):
+    def setUp(self):
+        """Set up a session running through January 2025 with two weekly slots"""
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        # 2025-01-01 is a Wednesday
+        self.session = make_session(self.program, date(2025, 1, 1), date(2025, 1, 31))
+        self.sunday = SessionSlot.objects.create(
+            session=self.session, weekday="sun", start_time=time(16, 0), end_time=time(17, 0)
+        )
+        self.wednesday = SessionSlot.objects.create(
+            session=self.session, weekday="wed", start_time=time(18, 0), end_time=time(19, 0)
+        )
+
+    def test_slot_dates_are_weekly(self):
+        """Test that slot dates start on the first matching weekday and step by a week"""
+        days = list(slot_dates(self.sunday, date(2025, 1, 1), date(2025, 1, 31)))
+        self.assertEqual(days, [date(2025, 1, 5), date(2025, 1, 12), date(2025, 1, 19), date(2025, 1, 26)])
+
+    def test_generate_classes_creates_all_occurrences(self):
+        """Test that every slot occurrence becomes a training class"""
+        result = self.session.generate_classes()
+
+        self.assertEqual(result["created"], 9)
+        self.assertEqual(TrainingClass.objects.filter(session=self.session).count(), 9)
+        self.assertEqual(
+            TrainingClass.objects.filter(session=self.session, slot=self.wednesday).count(), 5
+        )
+
+    def test_generate_classes_is_idempotent(self):
+        """Test that a second run creates nothing"""
+        self.session.generate_classes()
+        result = self.session.generate_classes()
+
+        self.assertEqual(result, {"created": 0, "updated": 0, "deleted": 0})
+        self.assertEqual(TrainingClass.objects.filter(session=self.session).count(), 9)
+
+    def test_regenerate_after_slot_edit(self):
+        """Test that slot edits are diffed instead of recreating every class"""
+        self.session.generate_classes()
+
+        self.sunday.start_time = time(15, 0)
+        self.sunday.save()
+        self.wednesday.weekday = "thu"
+        self.wednesday.save()
+
+        result = self.session.generate_classes()
+
+        self.assertEqual(result["updated"], 4)
+        self.assertEqual(result["deleted"], 5)
+        self.assertEqual(result["created"], 5)
+        self.assertFalse(
+            TrainingClass.objects.filter(session=self.session, slot=self.sunday).exclude(start_time=time(15, 0)).exists()
+        )
+
+    def test_generate_classes_query_count(self):
+        """Test that generation cost does not grow with the number of days"""
+        session = Session.objects.prefetch_related("slots").get(pk=self.session.pk)
+        # savepoint, existing classes, one bulk insert, release
+        with self.assertNumQueries(4):
+            session.generate_classes()
+
+
+class NextOccurrenceTest(TestCase):
+    def setUp(self):
+        """Set up a January 2025 session meeting Sunday and Wednesday"""
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        self.session = make_session(self.program, date(2025, 1, 1), date(2025, 1, 31))
+        SessionSlot.objects.create(session=self.session, weekday="wed", start_time=time(18, 0), end_time=time(19, 0))
+        SessionSlot.objects.create(session=self.session, weekday="sun", start_time=time(16, 0), end_time=time(17, 0))
+        SessionSlot.objects.create(session=self.session, weekday="sun", start_time=time(9, 0), end_time=time(10, 0))
+
+    def test_occurrences_merge_slots_in_order(self):
+        """Test that occurrences from all slots come back ordered by date and start time"""
+        occurrences = self.session.next_occurrences(4, after=date(2025, 1, 2))
+
+        self.assertEqual(
+            [(o.date, o.start_time) for o in occurrences],
+            [
+                (date(2025, 1, 5), time(9, 0)),
+                (date(2025, 1, 5), time(16, 0)),
+                (date(2025, 1, 8), time(18, 0)),
+                (date(2025, 1, 12), time(9, 0)),
+            ],
+        )
+
+    def test_occurrences_stop_at_session_end(self):
+        """Test that nothing is returned past the session end or before it starts"""
+        from .scheduling import next_occurrence
+
+        self.assertEqual(next_occurrence(self.session, after=date(2024, 12, 1)).date, date(2025, 1, 1))
+        self.assertEqual(len(self.session.next_occurrences(10, after=date(2025, 1, 27))), 1)
+        self.assertIsNone(next_occurrence(self.session, after=date(2025, 2, 1)))
+
+    def test_prefetched_slots_need_no_queries(self):
+        """Test that the engine works purely from prefetched slots"""
+        session = Session.objects.prefetch_related("slots").get(pk=self.session.pk)
+
+        with self.assertNumQueries(0):
+            occurrences = session.next_occurrences(9, after=date(2025, 1, 1))
+        self.assertEqual(len(occurrences), 9)
+
+
+class ProgramStatsTest(TestCase):
+    def setUp(self):
+        """Set up two programs, one with sessions and one without"""
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        self.empty_program = Program.objects.create(academy=self.academy, title="Tennis")
+        make_session(self.program, date(2025, 1, 1), date(2025, 3, 1), age_min=8, age_max=12, enrolled=5)
+        make_session(self.program, date(2025, 1, 1), date(2025, 3, 1), age_min=6, age_max=10, enrolled=3)
+
+    def test_with_stats_annotations(self):
+        """Test that with_stats feeds the program properties"""
+        program = Program.objects.with_stats().get(pk=self.program.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(program.sessions_count, 2)
+            self.assertEqual(program.players_count, 8)
+            self.assertEqual(program.age_group_display(), "6-12 years")
+
+    def test_with_stats_matches_unannotated(self):
+        """Test that annotated and per-instance values agree"""
+        for program in Program.objects.with_stats():
+            plain = Program.objects.get(pk=program.pk)
+            self.assertEqual(program.sessions_count, plain.sessions_count)
+            self.assertEqual(program.players_count, plain.players_count)
+            self.assertEqual(program.age_group_display(), plain.age_group_display())
+
+    def test_program_listing_is_single_query(self):
+        """Test that listing programs with stats costs one query"""
+        with self.assertNumQueries(1):
+            rows = [
+                (p.sessions_count, p.players_count, p.age_group_display())
+                for p in self.academy.programs.with_stats().order_by("title")
+            ]
+        self.assertEqual(rows, [(2, 8, "6-12 years"), (0, 0, None)])
+
+
+class TrainerDashboardQueryTest(TestCase):
+    def setUp(self):
+        """Set up an academy admin and a program to hang trainer sessions on"""
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        self.client.force_login(self.academy.owner.user)
+        self.url = reverse("academies:trainer_dashboard")
+
+    def add_trainer_with_sessions(self, index, sessions=2, players=2):
+        trainer = make_trainer(self.academy, f"coach-{index}")
+        for s in range(sessions):
+            session = make_session(
+                self.program, date(2025, 1, 1), date(2025, 3, 1), title=f"S{index}-{s}", trainer=trainer
+            )
+            for p in range(players):
+                player = make_player(self.academy, f"p{index}-{s}-{p}")
+                PlayerSession.objects.create(player=player, session=session)
+        return trainer
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_counts(self):
+        """Test that player and enrolled counts come from the annotations"""
+        trainer = self.add_trainer_with_sessions(1, sessions=2, players=3)
+        response, _ = self.dashboard_queries()
+
+        (row_trainer, player_count, session_data), = response.context["trainer_data"]
+        self.assertEqual(row_trainer, trainer)
+        self.assertEqual(player_count, 6)
+        self.assertEqual([enrolled for _, enrolled in session_data], [3, 3])
+        self.assertEqual(response.context["total_trainers"], 1)
+
+    def test_query_count_is_constant(self):
+        """Test that the dashboard query count does not grow with trainers or sessions"""
+        self.add_trainer_with_sessions(1)
+        _, baseline = self.dashboard_queries()
+
+        for index in range(2, 8):
+            self.add_trainer_with_sessions(index, sessions=3)
+        _, queries = self.dashboard_queries()
+
+        self.assertEqual(queries, baseline)
+        # session + user + admin profile + academy, three header counts,
+        # annotated trainers, annotated sessions prefetch
+        self.assertEqual(queries, 9)
+
+
+class PlayerExportTest(TestCase):
+    def setUp(self):
+        """Set up players with and without a session"""
+        self.academy = make_academy()
+        self.client.force_login(self.academy.owner.user)
+        program = Program.objects.create(academy=self.academy, title="Football")
+        self.first = make_session(program, date(2025, 1, 1), date(2025, 3, 1), title="Morning", level="advanced")
+        second = make_session(program, date(2025, 1, 1), date(2025, 3, 1), title="Evening")
+
+        self.enrolled = make_player(self.academy, "Sara")
+        self.enrolled.avg_progress = 80
+        self.enrolled.save()
+        PlayerSession.objects.create(player=self.enrolled, session=self.first)
+        PlayerSession.objects.create(player=self.enrolled, session=second)
+        make_player(self.academy, "Omar")
+
+    def test_csv_export_streams_rows(self):
+        """Test that the CSV export is streamed and resolves the first session"""
+        with self.assertNumQueries(5):
+            # session + user + admin profile + academy, then one export query
+            response = self.client.get(reverse("academies:players_dashboard"), {"export": "csv"})
+            content = b"".join(response.streaming_content).decode()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            content.splitlines(),
+            [
+                "Name,Session,Level,Status,Injury Risk",
+                "Sara ,Morning,Advanced,On Schedule,Low",
+                "Omar ,N/A,N/A,Not Enrolled,High",
+            ],
+        )
+
+    def test_excel_export(self):
+        """Test that the Excel export contains the same rows"""
+        import io
+        import openpyxl
+
+        response = self.client.get(reverse("academies:players_dashboard"), {"export": "excel"})
+        workbook = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content)))
+        rows = list(workbook["Players"].iter_rows(values_only=True))
+
+        self.assertEqual(rows[0], ("Name", "Session", "Level", "Status", "Injury Risk"))
+        self.assertEqual(rows[1], ("Sara ", "Morning", "Advanced", "On Schedule", "Low"))
+        self.assertEqual(len(rows), 3)
+
+
+class ExportJobTest(TestCase):
+    def setUp(self):
+        """Set up an academy admin with a few players to export"""
+        import tempfile
+
+        self.export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.export_root.cleanup)
+        override = self.settings(EXPORT_ROOT=self.export_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.academy = make_academy()
+        self.client.force_login(self.academy.owner.user)
+        for name in ("Sara", "Omar", "Lina"):
+            make_player(self.academy, name)
+
+    def test_queue_run_and_download(self):
+        """Test that a queued export is processed in chunks and downloadable"""
+        from .exports import claim_next_job, run_export_job
+
+        response = self.client.post(reverse("academies:export_jobs"), {"kind": "players", "file_format": "csv"})
+        self.assertEqual(response.status_code, 302)
+        job = ExportJob.objects.get(academy=self.academy)
+        self.assertEqual(job.status, ExportJob.Status.QUEUED)
+
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(claim_next_job())
+
+        run_export_job(claimed, chunk_size=2)
+
+        status = self.client.get(reverse("academies:export_job_status", args=[job.pk])).json()
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual((status["rows_done"], status["rows_total"]), (3, 3))
+        self.assertEqual(status["progress"], 100)
+
+        response = self.client.get(status["download_url"])
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 4)
+
+    def test_abandoned_job_is_reclaimed(self):
+        """Test that a job left running by a crashed worker is claimed again after the lease"""
+        from datetime import timedelta
+        from .exports import claim_next_job, EXPORT_JOB_LEASE
+
+        job = ExportJob.objects.create(academy=self.academy)
+        self.assertEqual(claim_next_job().pk, job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(rows_done=2)
+        self.assertIsNone(claim_next_job())
+
+        ExportJob.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - EXPORT_JOB_LEASE - timedelta(seconds=1))
+        reclaimed = claim_next_job()
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.rows_done, 0)
+
+    def test_progress_renews_the_claim(self):
+        """Test that a job still recording progress after the lease is not claimed by another worker"""
+        from datetime import timedelta
+        from unittest import mock
+        from .exports import claim_next_job, run_export_job, write_csv, EXPORT_JOB_LEASE
+
+        ExportJob.objects.create(academy=self.academy)
+        job = claim_next_job()
+        ExportJob.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - EXPORT_JOB_LEASE - timedelta(seconds=1))
+
+        def write_then_poll(file, headers, rows):
+            write_csv(file, headers, rows)
+            # another worker looking for abandoned jobs
+            self.assertIsNone(claim_next_job())
+
+        with mock.patch("academies.exports.write_csv", side_effect=write_then_poll):
+            run_export_job(job, chunk_size=1)
+        self.assertEqual(job.status, ExportJob.Status.COMPLETED)
+
+    def test_failure_keeps_recorded_progress(self):
+        """Test that a failed job keeps the progress written while it ran"""
+        from unittest import mock
+        from .exports import run_export_job
+
+        job = ExportJob.objects.create(academy=self.academy)
+        ExportJob.objects.filter(pk=job.pk).update(rows_done=2)
+        with mock.patch("academies.exports.write_csv", side_effect=OSError("disk full")):
+            run_export_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.FAILED)
+        self.assertEqual(job.rows_done, 2)
+
+    def test_other_academy_cannot_poll(self):
+        """Test that jobs are scoped to the admin's academy"""
+        job = ExportJob.objects.create(academy=make_academy("Other Academy"))
+        response = self.client.get(reverse("academies:export_job_status", args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_every_kind_and_format(self):
+        """Test that every report kind can be produced in both formats"""
+        from .exports import run_export_job
+
+        for kind in ExportJob.Kind.values:
+            for file_format in ExportJob.Format.values:
+                job = ExportJob.objects.create(academy=self.academy, kind=kind, file_format=file_format)
+                run_export_job(job)
+                self.assertEqual(job.status, ExportJob.Status.COMPLETED, job.error_message)
+
+
+class ScheduleConflictTest(TestCase):
+    def setUp(self):
+        """Set up two children already enrolled in a Sunday afternoon session"""
+        from parents.models import Enrollment
+
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        self.other_program = Program.objects.create(academy=self.academy, title="Tennis")
+        self.existing = self.session_with_slot("Existing", "sun", time(16, 0), time(17, 0))
+
+        parent_user = User.objects.create(username="parent")
+        parent = ParentProfile.objects.create(user=parent_user)
+        self.children = [
+            Child.objects.create(parent=parent, first_name=name) for name in ("Sara", "Omar")
+        ]
+        for child in self.children:
+            enrollment = Enrollment.objects.create(child=child, program=self.other_program)
+            enrollment.sessions.add(self.existing)
+
+    def session_with_slot(self, title, weekday, start, end, start_date=date(2025, 1, 1), end_date=date(2025, 3, 1), **kwargs):
+        session = make_session(self.program, start_date, end_date, title=title, **kwargs)
+        SessionSlot.objects.create(session=session, weekday=weekday, start_time=start, end_time=end)
+        return session
+
+    def check(self, *sessions):
+        from .scheduling import find_enrollment_conflicts
+
+        sessions = Session.objects.filter(pk__in=[s.pk for s in sessions]).prefetch_related("slots")
+        return find_enrollment_conflicts(self.children, sessions)
+
+    def test_reports_every_conflict(self):
+        """Test that each overlapping child/session pair is reported"""
+        overlapping = self.session_with_slot("Overlap", "sun", time(16, 30), time(17, 30))
+        clear = self.session_with_slot("Monday", "mon", time(16, 0), time(17, 0))
+
+        conflicts = self.check(overlapping, clear)
+
+        self.assertEqual(len(conflicts), 2)
+        self.assertEqual({c.owner for c in conflicts}, set(self.children))
+        self.assertTrue(all(c.session == overlapping and c.other == self.existing for c in conflicts))
+
+    def test_touching_and_disjoint_dates_do_not_conflict(self):
+        """Test back-to-back slots and non-overlapping date ranges"""
+        after = self.session_with_slot("After", "sun", time(17, 0), time(18, 0))
+        later = self.session_with_slot(
+            "Later", "sun", time(16, 0), time(17, 0), start_date=date(2025, 4, 1), end_date=date(2025, 6, 1)
+        )
+        self.assertEqual(self.check(after, later), [])
+
+    def test_re_enrolling_same_session_is_not_a_conflict(self):
+        """Test that a session never conflicts with itself"""
+        self.assertEqual(self.check(self.existing), [])
+
+    def test_new_sessions_conflicting_with_each_other(self):
+        """Test that the selected sessions are checked against one another"""
+        first = self.session_with_slot("First", "tue", time(16, 0), time(17, 0))
+        second = self.session_with_slot("Second", "tue", time(16, 30), time(17, 30))
+        self.assertEqual(len(self.check(first, second)), 2)
+
+    def test_index_built_in_constant_queries(self):
+        """Test that building the per-child indexes costs two queries"""
+        from .scheduling import build_child_indexes
+
+        with self.assertNumQueries(2):
+            indexes = build_child_indexes([c.pk for c in self.children])
+        self.assertEqual(set(indexes), {c.pk for c in self.children})
+
+    def test_trainer_double_booking(self):
+        """Test that the session form rejects a trainer already busy at that time"""
+        from .forms import SessionForm
+
+        trainer = make_trainer(self.academy, "coach")
+        self.existing.trainer = trainer
+        self.existing.save()
+        busy = self.session_with_slot("Busy", "sun", time(16, 30), time(17, 30))
+
+        form = SessionForm(
+            data={
+                "title": busy.title,
+                "trainer": trainer.pk,
+                "age_min": 6,
+                "age_max": 16,
+                "gender": "mix",
+                "level": "beginner",
+                "capacity": 20,
+                "start_datetime": "2025-01-01T08:00",
+                "end_datetime": "2025-03-01T08:00",
+            },
+            academy=self.academy,
+            instance=busy,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("trainer", form.errors)
+
+    def test_trainer_double_booking_in_admin(self):
+        """Test that the admin rejects moving a session to a busy trainer, or a clashing slot"""
+        from django.contrib import admin
+        from django.forms.models import model_to_dict
+        from .admin import SessionSlotAdminForm
+
+        trainer = make_trainer(self.academy, "coach")
+        self.existing.trainer = trainer
+        self.existing.save()
+        busy = self.session_with_slot("Busy", "sun", time(16, 30), time(17, 30))
+
+        SessionAdminForm = admin.site._registry[Session].form
+        data = {**model_to_dict(busy), "trainer": trainer.pk}
+        data.update(start_datetime=busy.start_datetime, end_datetime=busy.end_datetime)
+        form = SessionAdminForm(data=data, instance=busy)
+        self.assertFalse(form.is_valid())
+        self.assertIn("trainer", form.errors)
+
+        other = self.session_with_slot("Other", "mon", time(16, 30), time(17, 30))
+        other.trainer = trainer
+        other.save()
+        slot = {"session": other.pk, "weekday": "sun", "start_time": "16:45", "end_time": "17:15"}
+        self.assertFalse(SessionSlotAdminForm(data=slot).is_valid())
+
+
+class JoinProgramEligibilityTest(TestCase):
+    def setUp(self):
+        """Set up a parent with children of different ages and enrollments"""
+        from parents.models import Enrollment
+
+        self.academy = make_academy()
+        self.program = Program.objects.create(academy=self.academy, title="Football")
+        make_session(self.program, date(2025, 1, 1), date(2025, 3, 1), age_min=6, age_max=10)
+        make_session(self.program, date(2025, 1, 1), date(2025, 3, 1), age_min=8, age_max=12)
+
+        other_academy = make_academy("Other Academy")
+        other_program = Program.objects.create(academy=other_academy, title="Swimming")
+
+        user = User.objects.create(username="parent")
+        self.parent = ParentProfile.objects.create(user=user)
+        today = timezone.localdate()
+
+        def child(name, age):
+            dob = date(today.year - age, 1, 1) if age is not None else None
+            return Child.objects.create(parent=self.parent, first_name=name, date_of_birth=dob)
+
+        self.eligible = child("Sara", 9)
+        self.too_old = child("Omar", 15)
+        self.no_dob = child("Lina", None)
+        self.enrolled_here = child("Adam", 9)
+        self.enrolled_elsewhere = child("Noor", 9)
+        Enrollment.objects.create(child=self.enrolled_here, program=self.program)
+        Enrollment.objects.create(child=self.enrolled_elsewhere, program=other_program)
+
+        self.client.force_login(user)
+        self.url = reverse("academies:join_program_view", args=[self.academy.slug, self.program.id])
+
+    def test_eligibility_annotations(self):
+        """Test that the single children query carries every eligibility flag"""
+        children = {
+            c.first_name: c
+            for c in Child.objects.filter(parent=self.parent).with_program_eligibility(self.program, 6, 12)
+        }
+
+        self.assertTrue(children["Sara"].is_eligible)
+        self.assertFalse(children["Sara"].already_enrolled)
+        self.assertFalse(children["Omar"].is_eligible)
+        self.assertTrue(children["Lina"].is_eligible)
+        self.assertTrue(children["Adam"].in_program)
+        self.assertEqual(children["Adam"].enrolled_academy_name, "Test Academy")
+        self.assertFalse(children["Noor"].in_program)
+        self.assertTrue(children["Noor"].already_enrolled)
+        self.assertEqual(children["Noor"].enrolled_academy_name, "Other Academy")
+
+    def test_get_query_count_is_independent_of_children(self):
+        """Test that the join page does not query per child"""
+        with CaptureQueriesContext(connection) as before:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["min_age"], 6)
+        self.assertEqual(response.context["max_age"], 12)
+
+        for i in range(5):
+            Child.objects.create(parent=self.parent, first_name=f"Extra{i}")
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(self.url)
+
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
+    def test_post_rejects_child_enrolled_elsewhere(self):
+        """Test that the POST path uses the same annotations"""
+        response = self.client.post(self.url, {"children": [self.enrolled_elsewhere.pk]})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertNotIn("selected_children", self.client.session)
+
+        response = self.client.post(self.url, {"children": [self.eligible.pk, self.no_dob.pk]})
+        self.assertEqual(self.client.session["selected_children"], [str(self.eligible.pk), str(self.no_dob.pk)])
+
+
+class RevenueRollupTest(TestCase):
+    def setUp(self):
+        """Set up an academy with two programs and a paid-for player enrollment"""
+        from decimal import Decimal
+        from player_payments.models import PlayerSubscription, PlayerEnrollment
+
+        self.academy = make_academy()
+        self.football = Program.objects.create(academy=self.academy, title="Football")
+        self.swimming = Program.objects.create(academy=self.academy, title="Swimming")
+        player = make_player(self.academy, "Sara")
+        subscription = PlayerSubscription.objects.create(
+            title="Monthly", academy=self.academy, price=Decimal("115.00"), billing_type="3m"
+        )
+        self.enrollment = PlayerEnrollment.objects.create(
+            subscription=subscription, child=player.child, parent=player.child.parent.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 4, 1), amount_paid=Decimal("115.00"),
+        )
+        self.client.force_login(self.academy.owner.user)
+
+    def pay(self, amount, program, status="completed", kind="initial", when=datetime(2025, 1, 15, 12, 0)):
+        from player_payments.models import PaymentTransaction
+
+        return PaymentTransaction.objects.create(
+            enrollment=self.enrollment, program=program, amount=amount, status=status,
+            transaction_type=kind, processed_at=timezone.make_aware(when),
+        )
+
+    def rollups(self):
+        from player_payments.models import RevenueRollup
+
+        return {
+            (r.program_id, r.month): (r.gross, r.vat, r.refunds, r.transactions)
+            for r in RevenueRollup.objects.filter(academy=self.academy) if r.transactions
+        }
+
+    def test_completed_transactions_are_rolled_up(self):
+        """Test that completed payments land in their program/month bucket and pending ones don't"""
+        from decimal import Decimal
+
+        self.pay(Decimal("115.00"), self.football)
+        self.pay(Decimal("230.00"), self.football)
+        self.pay(Decimal("115.00"), self.swimming, when=datetime(2025, 2, 3, 9, 0))
+        self.pay(Decimal("500.00"), self.swimming, status="pending")
+
+        self.assertEqual(self.rollups(), {
+            (self.football.pk, date(2025, 1, 1)): (Decimal("345.00"), Decimal("45.00"), Decimal("0.00"), 2),
+            (self.swimming.pk, date(2025, 2, 1)): (Decimal("115.00"), Decimal("15.00"), Decimal("0.00"), 1),
+        })
+
+    def test_status_changes_move_contributions(self):
+        """Test that completing, refunding and deleting a transaction keep the rollup in sync"""
+        from decimal import Decimal
+        from player_payments.models import PaymentTransaction
+
+        txn = self.pay(Decimal("115.00"), self.football, status="pending")
+        self.assertEqual(self.rollups(), {})
+
+        txn = PaymentTransaction.objects.get(pk=txn.pk)
+        txn.status = "completed"
+        txn.save()
+        key = (self.football.pk, date(2025, 1, 1))
+        self.assertEqual(self.rollups()[key], (Decimal("115.00"), Decimal("15.00"), Decimal("0.00"), 1))
+
+        txn.status = "refunded"
+        txn.save()
+        self.assertEqual(self.rollups()[key], (Decimal("115.00"), Decimal("15.00"), Decimal("115.00"), 1))
+
+        PaymentTransaction.objects.get(pk=txn.pk).delete()
+        self.assertEqual(self.rollups(), {})
+
+    def test_rebuild_matches_incremental_updates(self):
+        """Test that a from-scratch rebuild produces the same buckets"""
+        from decimal import Decimal
+        from player_payments.revenue import rebuild_rollups
+
+        self.pay(Decimal("115.00"), self.football)
+        self.pay(Decimal("230.00"), self.football, status="refunded")
+        self.pay(Decimal("230.00"), self.football, kind="refund")
+        self.pay(Decimal("115.00"), None, when=datetime(2025, 3, 1, 9, 0))
+        incremental = self.rollups()
+
+        rebuild_rollups(self.academy)
+
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_refund_is_counted_once(self):
+        """Test that a refunded sale and its refund transaction count the refund only once"""
+        from decimal import Decimal
+
+        self.pay(Decimal("115.00"), self.football, status="refunded")
+        refund = self.pay(Decimal("115.00"), self.football, kind="refund")
+        key = (self.football.pk, date(2025, 1, 1))
+
+        self.assertEqual(self.rollups()[key], (Decimal("115.00"), Decimal("15.00"), Decimal("115.00"), 1))
+        refund.delete()
+        self.assertEqual(self.rollups()[key], (Decimal("115.00"), Decimal("15.00"), Decimal("115.00"), 1))
+
+    def test_deleting_program_keeps_academy_revenue(self):
+        """Test that a deleted program's revenue moves to the academy's unassigned bucket"""
+        from decimal import Decimal
+        from django.db.models import Sum
+        from player_payments.models import RevenueRollup
+        from player_payments.revenue import rebuild_rollups
+
+        self.pay(Decimal("115.00"), self.football)
+        self.pay(Decimal("230.00"), self.football, status="refunded", when=datetime(2025, 2, 1, 9, 0))
+        self.pay(Decimal("50.00"), None)
+        self.pay(Decimal("230.00"), self.swimming)
+        rollups = RevenueRollup.objects.filter(academy=self.academy)
+        before = rollups.aggregate(Sum("gross"), Sum("refunds"))
+
+        self.football.delete()
+
+        self.assertEqual(rollups.aggregate(Sum("gross"), Sum("refunds")), before)
+        self.assertEqual(self.rollups()[(None, date(2025, 1, 1))], (Decimal("165.00"), Decimal("21.52"), Decimal("0.00"), 2))
+        merged = self.rollups()
+        rebuild_rollups(self.academy)
+        self.assertEqual(self.rollups(), merged)
+
+    def test_dashboard_reads_rollups_in_constant_queries(self):
+        """Test that the programs dashboard revenue doesn't depend on the number of transactions"""
+        from decimal import Decimal
+
+        self.pay(Decimal("115.00"), self.football)
+        with CaptureQueriesContext(connection) as before:
+            response = self.client.get(reverse("academies:programs"))
+        self.assertEqual(response.context["revenue"], Decimal("115.00"))
+
+        for _ in range(10):
+            self.pay(Decimal("115.00"), self.football)
+        self.pay(Decimal("115.00"), self.swimming, status="refunded")
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(reverse("academies:programs"))
 
-# Create your tests here.
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+        self.assertEqual(response.context["revenue"], Decimal("1265.00"))
+        self.assertEqual(response.context["revenue_totals"]["vat"], Decimal("180.00"))
+        by_program = {row["program__title"]: row["net"] for row in response.context["revenue_by_program"]}
+        self.assertEqual(by_program, {"Football": Decimal("1265.00"), "Swimming": Decimal("0.00")})
@@ -44,5 +44,10 @@ urlpatterns = [
     # Players
     path("dashboard/players/", views.players_dashboard, name="players_dashboard"),
 
+    # Exports
+    path("dashboard/exports/", views.export_jobs_view, name="export_jobs"),
+    path("dashboard/exports/<int:job_id>/status/", views.export_job_status, name="export_job_status"),
+    path("dashboard/exports/<int:job_id>/download/", views.export_job_download, name="export_job_download"),
+
 ]
 
@@ -1,13 +1,13 @@
 from django.shortcuts import render, get_object_or_404
-from networkx import reverse
-from .models import Academy, Program, Session
+from django.urls import reverse
+from .models import Academy, Program, Session, ExportJob
 from payment.models import SubscriptionPlan
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
-from .forms import ProgramForm, SessionForm, AcademyForm, SubscriptionPlanForm
+from .forms import ProgramForm, SessionForm, AcademyForm, SubscriptionPlanForm, ExportJobForm
 from accounts.models import TrainerProfile
 from .forms import ProgramForm, SessionForm, AcademyForm
 from accounts.models import TrainerProfile, AcademyAdminProfile
@@ -16,11 +16,15 @@ from player.models import PlayerProfile, PlayerSession
 from .forms import TrainerProfileForm
 from datetime import date
 from django.db.models import Q
-import csv
-import openpyxl
-from django.http import HttpResponse, HttpRequest
+from django.http import HttpResponse, HttpRequest, JsonResponse, FileResponse, Http404
+from . import exports
+from .scheduling import find_enrollment_conflicts
+from parents.seats import enroll_in_session, promote_waitlist, WAITLISTED
+from player_payments.models import RevenueRollup
+from player_payments.revenue import revenue_summary
 from payment.models import PlanType, SubscriptionPlan, Subscription
-from django.db.models import Sum
+from django.db.models import Sum, Count, Prefetch
+from django.core.paginator import Paginator
 
 def _academy(user):
     return user.academy_admin_profile.academy
@@ -113,17 +117,18 @@ def AcademyDetailView(request, slug):
     if request.user.is_authenticated and hasattr(request.user, 'parent_profile'):
         from parents.models import ParentSubscription
 
-        valid_subscriptions = ParentSubscription.objects.filter(
+        # expired rows are switched off by the expiry sweeper; the date check
+        # only covers the time since its last run
+        is_subscribed = ParentSubscription.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=timezone.now()),
             parent=request.user.parent_profile,
             academy=academy,
-            is_active=True
-        )
-
-        is_subscribed = any(sub.is_valid for sub in valid_subscriptions)
+            is_active=True,
+        ).exists()
     
     context = {
         "academy": academy,
-        "programs": academy.programs.all(),
+        "programs": academy.programs.with_stats(),
         "coaches": academy.trainers.all(), 
         "active_students": active_students,
         "fake_rating": 4.8,
@@ -200,16 +205,18 @@ def subscription_dashboard(request):
     academy_subscription_plans = SubscriptionPlan.objects.filter(academy=academy).order_by('-created_at')
     
 
-    subscriptions = Subscription.objects.filter(academy_name=academy.name).order_by('-created_at')
+    subscriptions = Subscription.objects.filter(academy=academy).select_related('plan_type').order_by('-created_at')
     
 
     active_subscription = subscriptions.filter(status=Subscription.Status.SUCCESSFUL).first()
     
+    history = Paginator(subscriptions, 5).get_page(request.GET.get("history_page"))
+    
     context = {
         "academy": academy,
         "plan_types": plan_types,
         "academy_subscription_plans": academy_subscription_plans,
-        "subscriptions": subscriptions,
+        "subscriptions": history,
         "active_subscription": active_subscription,
     }
     return render(request, "academies/subscription_dashboard.html", context)
@@ -317,14 +324,13 @@ def _academy(user):
 def program_dashboard(request):
     # Which programs to show
     if request.user.is_superuser:
-        programs = Program.objects.all().prefetch_related("sessions")
+        programs = Program.objects.all()
         academy = None
     else:
         academy = _academy(request.user)
         programs = (
             Program.objects
             .filter(academy=academy)
-            .prefetch_related("sessions")
         )
 
     # Sessions under those programs
@@ -346,17 +352,26 @@ def program_dashboard(request):
         .count()
     )
 
-    total_capacity = sessions.aggregate(total=Sum("capacity"))["total"] or 0
-    utilization = round((total_enrollment / total_capacity) * 100, 1) if total_capacity else 0
+    # Session.enrolled is the live seat counter, so utilization is seats taken / seats offered
+    seats = sessions.aggregate(capacity=Sum("capacity"), taken=Sum("enrolled"))
+    total_capacity = seats["capacity"] or 0
+    utilization = round(((seats["taken"] or 0) / total_capacity) * 100, 1) if total_capacity else 0
+
+    # Revenue comes from the rollup table, not from scanning transactions
+    rollups = RevenueRollup.objects.all() if academy is None else RevenueRollup.objects.filter(academy=academy)
+    revenue = revenue_summary(rollups)
 
     context = {
         "academy": academy,
-        "programs": programs,
+        "programs": programs.with_stats().prefetch_related("sessions"),
         "total_programs": total_programs,
         "total_sessions": total_sessions,
         "total_enrollment": total_enrollment,
         "utilization_pct": utilization,
-        "revenue": 60450, 
+        "revenue": revenue["totals"]["net"],
+        "revenue_totals": revenue["totals"],
+        "revenue_by_program": revenue["by_program"],
+        "revenue_by_month": revenue["by_month"],
         "total_capacity": total_capacity, 
     }
     return render(request, "academies/dashboard_programs.html", context)
@@ -445,6 +460,8 @@ def session_edit(request, pk):
         form = SessionForm(request.POST, academy=academy, instance=session)
         if form.is_valid():
             form.save()
+            # capacity may have grown; seat whoever is waiting
+            promote_waitlist(session.pk)
             messages.success(request, "Session updated successfully ")
             return redirect("academies:programs")
     else:
@@ -536,11 +553,23 @@ def trainer_dashboard(request):
 
     
     trainers_all = TrainerProfile.objects.filter(academy=academy)
-    trainers = trainers_all.filter(
-        approval_status=TrainerProfile.ApprovalStatus.APPROVED
-    ).prefetch_related("sessions", "sessions__program")
+    trainers = (
+        trainers_all
+        .filter(approval_status=TrainerProfile.ApprovalStatus.APPROVED)
+        .select_related("user")
+        .annotate(player_count=Count("sessions__attendances__player", distinct=True))
+        .prefetch_related(
+            Prefetch(
+                "sessions",
+                queryset=(
+                    Session.objects
+                    .select_related("program")
+                    .annotate(enrolled_count=Count("attendances__player", distinct=True))
+                ),
+            )
+        )
+    )
 
-    total_trainers = trainers.count()
     total_players = PlayerProfile.objects.filter(academy=academy).count()
     total_sessions = Session.objects.filter(program__academy=academy).count()
 
@@ -548,27 +577,15 @@ def trainer_dashboard(request):
         approval_status=TrainerProfile.ApprovalStatus.PENDING
     ).count()
 
-    trainer_data = []
-    for trainer in trainers:
-        player_count = (
-            PlayerProfile.objects
-            .filter(player_sessions__session__trainer=trainer)
-            .distinct()
-            .count()
+    trainer_data = [
+        (
+            trainer,
+            trainer.player_count,
+            [(session, session.enrolled_count) for session in trainer.sessions.all()],
         )
-
-        session_data = []
-        for session in trainer.sessions.all():
-            enrolled = (
-                PlayerSession.objects
-                .filter(session=session)
-                .values("player")
-                .distinct()
-                .count()
-            )
-            session_data.append((session, enrolled))
-
-        trainer_data.append((trainer, player_count, session_data))
+        for trainer in trainers
+    ]
+    total_trainers = len(trainer_data)
 
     context = {
         "academy": academy,
@@ -604,12 +621,6 @@ def add_trainer(request):
 
     return render(request, "academies/add_trainer.html", {"form": form, "academy": academy})
 
-def calculate_age(born):
-    today = date.today()
-    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
-
-
-
 @login_required
 def academy_pending_trainers_view(request: HttpRequest):
     academy_admin = getattr(request.user, "academy_admin_profile", None)
@@ -689,13 +700,12 @@ def players_dashboard(request):
         elif injury_filter == "high":
             players = players.filter(avg_progress__lt=40)
 
-    players = players.prefetch_related("player_sessions__session")
-
-
     export_type = request.GET.get("export")
     if export_type in ["csv", "excel"]:
         return export_players(players, export_type)
 
+    players = players.prefetch_related("player_sessions__session")
+
 
     total_players = players.count()
     active_players = players.filter(avg_progress__gte=50).count()
@@ -729,114 +739,102 @@ def players_dashboard(request):
 
 
 def export_players(players, export_type):
+    rows = exports.player_rows(players)
+
     if export_type == "csv":
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = 'attachment; filename="players.csv"'
+        return exports.csv_response("players.csv", exports.PLAYER_HEADERS, rows)
 
-        writer = csv.writer(response)
-        writer.writerow(["Name", "Session", "Level", "Status", "Injury Risk"])
+    elif export_type == "excel":
+        return exports.xlsx_response("players.xlsx", "Players", exports.PLAYER_HEADERS, rows)
 
-        for player in players:
-            session = player.player_sessions.first().session if player.player_sessions.exists() else None
-            session_title = session.title if session else "N/A"
-            level = session.get_level_display() if session else "N/A"
-            status = "On Schedule" if session else "Not Enrolled"
 
+@login_required
+def export_jobs_view(request):
+    academy_admin = getattr(request.user, "academy_admin_profile", None)
+    academy = getattr(academy_admin, "academy", None) if academy_admin else None
+    if not academy:
+        messages.error(request, "You must be an Academy Admin to export reports.")
+        return redirect("main:main_home_view")
 
-            if player.avg_progress < 40:
-                risk = "High"
-            elif player.avg_progress < 70:
-                risk = "Medium"
-            else:
-                risk = "Low"
+    if request.method == "POST":
+        form = ExportJobForm(request.POST)
+        if form.is_valid():
+            job = form.save(commit=False)
+            job.academy = academy
+            job.requested_by = request.user
+            job.save()
+            messages.success(request, f"{job.get_kind_display()} export queued. It will be ready to download shortly.")
+            return redirect("academies:export_jobs")
+    else:
+        form = ExportJobForm()
+
+    jobs = ExportJob.objects.filter(academy=academy)[:20]
 
-            writer.writerow([f"{player.child.first_name} {player.child.last_name}", session_title, level, status, risk])
+    return render(request, "academies/export_jobs.html", {
+        "academy": academy,
+        "form": form,
+        "jobs": jobs,
+    })
 
-        return response
 
-    elif export_type == "excel":
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Players"
+def _academy_export_job(request, job_id):
+    academy_admin = getattr(request.user, "academy_admin_profile", None)
+    academy = getattr(academy_admin, "academy", None) if academy_admin else None
+    if not academy:
+        raise Http404("No academy for this user.")
+    return get_object_or_404(ExportJob, id=job_id, academy=academy)
 
-        headers = ["Name", "Session", "Level", "Status", "Injury Risk"]
-        sheet.append(headers)
 
-        for player in players:
-            session = player.player_sessions.first().session if player.player_sessions.exists() else None
-            session_title = session.title if session else "N/A"
-            level = session.get_level_display() if session else "N/A"
-            status = "On Schedule" if session else "Not Enrolled"
+@login_required
+def export_job_status(request, job_id):
+    job = _academy_export_job(request, job_id)
+    return JsonResponse({
+        "id": job.id,
+        "status": job.status,
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "progress": job.progress,
+        "error": job.error_message,
+        "download_url": (
+            reverse("academies:export_job_download", args=[job.id])
+            if job.status == ExportJob.Status.COMPLETED else None
+        ),
+    })
 
-            if player.avg_progress < 40:
-                risk = "High"
-            elif player.avg_progress < 70:
-                risk = "Medium"
-            else:
-                risk = "Low"
 
-            sheet.append([f"{player.child.first_name} {player.child.last_name}", session_title, level, status, risk])
+@login_required
+def export_job_download(request, job_id):
+    job = _academy_export_job(request, job_id)
+    if job.status != ExportJob.Status.COMPLETED or not job.file_name:
+        raise Http404("Export is not ready.")
+
+    try:
+        file = open(exports.export_path(job.file_name), "rb")
+    except FileNotFoundError:
+        raise Http404("Export file is no longer available.")
 
-        response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        response["Content-Disposition"] = 'attachment; filename="players.xlsx"'
-        workbook.save(response)
-        return response
+    content_type = exports.XLSX_CONTENT_TYPE if job.file_format == ExportJob.Format.EXCEL else exports.CSV_CONTENT_TYPE
+    return FileResponse(file, as_attachment=True, filename=job.download_name, content_type=content_type)
 
 
 @login_required
 def join_program_view(request, academy_slug, program_id):
     academy = get_object_or_404(Academy, slug=academy_slug)
-    program = get_object_or_404(Program, id=program_id, academy=academy)
+    program = get_object_or_404(Program.objects.with_stats(), id=program_id, academy=academy)
 
     parent_profile = getattr(request.user, "parent_profile", None)
     if not parent_profile:
         messages.error(request, "Only parents can join programs.")
         return redirect("academies:detail", slug=academy.slug)
 
-    children = Child.objects.filter(parent=parent_profile)
-
-
-    sessions = program.sessions.all()
-    if sessions.exists():
-        min_age = min(s.age_min for s in sessions)
-        max_age = max(s.age_max for s in sessions)
-    else:
-        min_age = None
-        max_age = None
-
-
-    for child in children:
-        child.age = calculate_age(child.date_of_birth) if child.date_of_birth else None
-
-
-        if min_age is not None and max_age is not None and child.age is not None:
-            child.is_eligible = min_age <= child.age <= max_age
-        else:
-            child.is_eligible = True
-
-
-        existing_enrollments = (
-            Enrollment.objects.filter(child=child, is_active = True)
-            .select_related("program__academy")
-        )
-
-
-        if existing_enrollments.filter(program=program).exists():
-            child.already_enrolled = True
-            child.enrolled_academy = academy
-            child.enrolled_program = program
-
+    min_age = program.min_age
+    max_age = program.max_age
 
-        elif existing_enrollments.exclude(program__academy=academy).exists():
-            child.already_enrolled = True
-            active_enrollment = existing_enrollments.exclude(program__academy=academy).first()
-            child.enrolled_academy = active_enrollment.program.academy if active_enrollment else None
-            child.enrolled_program = None
-
-        else:
-            child.already_enrolled = False
-            child.enrolled_academy = None
-            child.enrolled_program = None
+    children = (
+        Child.objects
+        .filter(parent=parent_profile)
+        .with_program_eligibility(program, min_age, max_age)
+    )
 
     if request.method == "POST":
         selected_ids = request.POST.getlist("children")
@@ -844,19 +842,24 @@ def join_program_view(request, academy_slug, program_id):
             messages.warning(request, "Please select at least one child.")
             return redirect("academies:join_program_view", academy_slug=academy.slug, program_id=program.id)
 
-        for child_id in selected_ids:
-            child = get_object_or_404(Child, id=child_id, parent=parent_profile)
-            existing_enrollments = Enrollment.objects.filter(child=child, is_active = True).select_related("program__academy")
-
+        try:
+            selected_children = list(children.filter(id__in=selected_ids))
+        except ValueError:
+            selected_children = []
+        if len(selected_children) != len(set(selected_ids)):
+            raise Http404("No Child matches the given query.")
 
-            if existing_enrollments.filter(program=program).exists():
+        for child in selected_children:
+            if child.in_program:
                 messages.error(request, f"{child.first_name} is already enrolled in {program.title}.")
                 return redirect("academies:join_program_view", academy_slug=academy.slug, program_id=program.id)
 
+            if child.already_enrolled:
+                messages.error(request, f"{child.first_name} is already enrolled in {child.enrolled_academy_name}.")
+                return redirect("academies:join_program_view", academy_slug=academy.slug, program_id=program.id)
 
-            if existing_enrollments.exclude(program__academy=academy).exists():
-                other_academy = existing_enrollments.first().program.academy
-                messages.error(request, f"{child.first_name} is already enrolled in {other_academy.name}.")
+            if not child.is_eligible:
+                messages.error(request, f"{child.first_name} is not eligible for {program.title} (ages {min_age}–{max_age}).")
                 return redirect("academies:join_program_view", academy_slug=academy.slug, program_id=program.id)
 
 
@@ -987,39 +990,22 @@ def enrollment_details_view(request, academy_slug, program_id):
 
         
 
+        sessions = sessions.prefetch_related("slots")
+        conflicts = find_enrollment_conflicts(children, sessions)
+        if conflicts:
+            for conflict in conflicts:
+                messages.error(
+                    request,
+                    f"{conflict.owner.first_name} already has a session ({conflict.other.title}) "
+                    f"that overlaps with {conflict.session.title} on {conflict.slot.get_weekday_display()}.",
+                    extra_tags='alert-danger'
+                )
+            return redirect("academies:enrollment_sessions",
+                            academy_slug=academy.slug,
+                            program_id=program.id)
+
+        waitlisted = []
         for child in children:
-
-            existing_sessions = Session.objects.filter(
-                enrollments__child=child,
-                enrollments__is_active=True
-            ).prefetch_related("slots")
-
-            for new_session in sessions.prefetch_related("slots"):
-                for existing in existing_sessions:
-
-                    if not (
-                        new_session.end_datetime.date() < existing.start_datetime.date()
-                        or new_session.start_datetime.date() > existing.end_datetime.date()
-                    ):
-
-                        for new_slot in new_session.slots.all():
-                            for exist_slot in existing.slots.all():
-                                if new_slot.weekday == exist_slot.weekday:
-                                    if not (
-                                        new_slot.end_time <= exist_slot.start_time
-                                        or new_slot.start_time >= exist_slot.end_time
-                                    ):
-                                        messages.error(
-                                            request,
-                                            f"{child.first_name} already has a session ({existing.title}) "
-                                            f"that overlaps with {new_session.title} on {new_slot.get_weekday_display()}.",
-                                            extra_tags='alert-danger'
-                                        )
-                                        return redirect("academies:enrollment_sessions",
-                                                        academy_slug=academy.slug,
-                                                        program_id=program.id)
-
-
             enrollment, created = Enrollment.objects.get_or_create(
                 child=child,
                 program=program,
@@ -1035,9 +1021,6 @@ def enrollment_details_view(request, academy_slug, program_id):
                 enrollment.is_active = True
                 enrollment.save()
 
-            for session in sessions:
-                enrollment.sessions.add(session)
-
             # Link to PlayerProfile
             if hasattr(child, "player_profile"):
                 player = child.player_profile
@@ -1045,16 +1028,21 @@ def enrollment_details_view(request, academy_slug, program_id):
                     player.academy = academy
                     player.save()
 
-                for session in sessions:
-                    PlayerSession.objects.get_or_create(
-                        player=child.player_profile,
-                        session=session,
-                    )
+            # Seats are taken atomically; full sessions put the child on the waitlist
+            for session in sessions:
+                if enroll_in_session(enrollment, session) == WAITLISTED:
+                    waitlisted.append(f"{child.first_name} ({session.title})")
         
         request.session.pop("selected_children", None)
         request.session.pop("selected_sessions", None)
 
         messages.success(request, f"Enrollment completed for {len(children)} child(ren).", extra_tags='alert-success')
+        if waitlisted:
+            messages.warning(
+                request,
+                "Some sessions are full, so these children were added to the waitlist: " + ", ".join(waitlisted),
+                extra_tags='alert-warning',
+            )
         return redirect("academies:detail", slug=academy.slug)
 
     return render(request, "academies/enrollment_details.html", {
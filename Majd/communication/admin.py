@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import Conversation, Message, OutboxEmail
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ("id", "trainer", "parent", "created_at")
+    list_display = ("id", "trainer", "parent", "last_message_at", "trainer_unread_count", "parent_unread_count", "created_at")
     list_filter = ("trainer", "parent")
     search_fields = ("trainer__user__username", "parent__user__username")
 
@@ -14,3 +14,11 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ("id", "conversation", "sender", "body", "sent_at", "is_read")
     list_filter = ("conversation", "sender", "is_read")
     search_fields = ("body", "sender__username")
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "to", "last_error")
+    readonly_fields = ("claim_token", "locked_until", "created_at", "sent_at")
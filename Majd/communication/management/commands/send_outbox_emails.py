@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from communication.outbox import deliver_pending, OUTBOX_BATCH_SIZE, MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails in batches over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox and exit instead of polling for new emails',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when nothing is due',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help='Emails sent per SMTP connection',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=MAX_ATTEMPTS,
+            help='Attempts before an email is marked as failed',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        while True:
+            result = deliver_pending(options['batch_size'], options['max_attempts'])
+            if not any(result.values()):
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            for key in totals:
+                totals[key] += result[key]
+            self.stdout.write(
+                f"  Batch: {result['sent']} sent, {result['retrying']} retrying, {result['failed']} failed"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nCompleted! Sent {totals['sent']} emails "
+            f"({totals['retrying']} scheduled for retry, {totals['failed']} failed)."
+        ))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+
+
+def backfill_inbox(apps, schema_editor):
+    """Fill the last message and unread counters from the existing messages."""
+    Conversation = apps.get_model('communication', 'Conversation')
+    Message = apps.get_model('communication', 'Message')
+
+    conversations = Conversation.objects.annotate(
+        trainer_unread=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=models.F('trainer__user'))),
+        parent_unread=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=models.F('parent__user'))),
+        last_at=Subquery(
+            Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at', '-id').values('sent_at')[:1]
+        ),
+        last_body=Subquery(
+            Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at', '-id').values('body')[:1]
+        ),
+    ).filter(last_at__isnull=False)
+
+    for conversation in conversations.iterator(chunk_size=500):
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message_at=conversation.last_at,
+            last_message_preview=' '.join(conversation.last_body.split())[:120],
+            trainer_unread_count=conversation.trainer_unread,
+            parent_unread_count=conversation.parent_unread,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_remove_parentprofile_latitude_and_more'),
+        ('communication', '0003_message_conversation_sent_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='parent_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='trainer_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['trainer', '-last_message_at'], name='conversation_trainer_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['parent', '-last_message_at'], name='conversation_parent_inbox_idx'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
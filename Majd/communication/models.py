@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
 from accounts.models import TrainerProfile, ParentProfile
@@ -9,8 +11,18 @@ class Conversation(models.Model):
     parent = models.ForeignKey(ParentProfile, on_delete=models.CASCADE, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized for the inbox, kept up to date by communication.threads
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=120, blank=True)
+    trainer_unread_count = models.PositiveIntegerField(default=0)
+    parent_unread_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         unique_together = ('trainer', 'parent')
+        indexes = [
+            models.Index(fields=['trainer', '-last_message_at'], name='conversation_trainer_inbox_idx'),
+            models.Index(fields=['parent', '-last_message_at'], name='conversation_parent_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"{self.trainer.user.username} ↔ {self.parent.user.username}"
@@ -23,5 +35,57 @@ class Message(models.Model):
     sent_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'sent_at'], name='message_conversation_sent_idx'),
+        ]
+
     def __str__(self):
         return f"{self.sender.username}: {self.body[:30]}"
+
+
+class OutboxEmail(models.Model):
+    """
+    Durable queue of outgoing emails. Call sites only enqueue (see
+    communication.outbox); the send_outbox_emails worker delivers them.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        SENDING = "sending", "Sending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["next_attempt_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+            models.Index(fields=["claim_token"], name="outbox_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
+
+
+@receiver(post_save, sender=Message)
+def record_new_message(sender, instance, created, **kwargs):
+    if created:
+        from .threads import record_message
+
+        record_message(instance)
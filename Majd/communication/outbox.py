@@ -0,0 +1,163 @@
+# communication/outbox.py
+"""
+Email outbox.
+
+enqueue_email() stores the message in the caller's transaction and returns
+immediately; deliver_pending() (run by the send_outbox_emails worker) claims a
+batch, sends it over one SMTP connection and schedules failed messages for a
+retry with exponential backoff.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=1)
+# a claimed batch that isn't finished by then is considered abandoned
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def outbox_email(subject, body, to, html_body="", from_email=None):
+    """Build an unsaved OutboxEmail. `to` is an address or a list of addresses."""
+    recipients = [to] if isinstance(to, str) else list(to)
+    return OutboxEmail(
+        subject=subject,
+        body=body,
+        html_body=html_body or "",
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipients,
+    )
+
+
+def enqueue_email(subject, body, to, html_body="", from_email=None):
+    """Queue an email for delivery."""
+    email = outbox_email(subject, body, to, html_body=html_body, from_email=from_email)
+    email.save()
+    return email
+
+
+def enqueue_emails(emails, batch_size=500):
+    """Queue many unsaved OutboxEmail objects (see outbox_email) with bulk inserts."""
+    return OutboxEmail.objects.bulk_create(emails, batch_size=batch_size)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+
+
+def claim_batch(limit=OUTBOX_BATCH_SIZE):
+    """
+    Claim up to `limit` due emails for this worker and return them. The claim
+    is one conditional UPDATE tagged with a fresh token, so concurrent workers
+    never deliver the same email twice.
+    """
+    now = timezone.now()
+    due = (
+        Q(status=OutboxEmail.Status.QUEUED, next_attempt_at__lte=now)
+        | Q(status=OutboxEmail.Status.SENDING, locked_until__lt=now)
+    )
+    ids = list(OutboxEmail.objects.filter(due).order_by("next_attempt_at", "id").values_list("pk", flat=True)[:limit])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    OutboxEmail.objects.filter(due, pk__in=ids).update(
+        status=OutboxEmail.Status.SENDING,
+        claim_token=token,
+        locked_until=now + CLAIM_LEASE,
+    )
+    return list(OutboxEmail.objects.filter(claim_token=token, status=OutboxEmail.Status.SENDING).order_by("id"))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def deliver_pending(batch_size=OUTBOX_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Deliver one batch of due emails over a single connection.
+    Returns {"sent": n, "retrying": n, "failed": n}.
+    """
+    batch = claim_batch(batch_size)
+    result = {"sent": 0, "retrying": 0, "failed": 0}
+    if not batch:
+        return result
+
+    sent, retrying, failed = [], [], []
+    connection = get_connection()
+    try:
+        connection.open()
+        for email in batch:
+            try:
+                _message(email, connection).send()
+                sent.append(email.pk)
+            except Exception as e:
+                logger.warning(f"Outbox email {email.pk} failed: {e}")
+                email.attempts += 1
+                email.last_error = str(e)
+                if email.attempts >= max_attempts:
+                    email.status = OutboxEmail.Status.FAILED
+                    failed.append(email)
+                else:
+                    email.status = OutboxEmail.Status.QUEUED
+                    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                    retrying.append(email)
+    except Exception as e:
+        # could not connect at all: every unsent email in the batch is retried
+        logger.warning(f"Outbox connection failed: {e}")
+        done = set(sent) | {email.pk for email in retrying + failed}
+        for email in batch:
+            if email.pk not in done:
+                email.attempts += 1
+                email.last_error = str(e)
+                email.status = OutboxEmail.Status.QUEUED
+                email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                retrying.append(email)
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.filter(pk__in=sent).update(
+        status=OutboxEmail.Status.SENT, sent_at=timezone.now(), claim_token="", locked_until=None,
+    )
+    for email in retrying + failed:
+        email.claim_token = ""
+        email.locked_until = None
+    OutboxEmail.objects.bulk_update(
+        retrying + failed,
+        ["status", "attempts", "last_error", "next_attempt_at", "claim_token", "locked_until"],
+    )
+
+    result.update(sent=len(sent), retrying=len(retrying), failed=len(failed))
+    return result
+
+
+def deliver_all(batch_size=OUTBOX_BATCH_SIZE):
+    """Deliver batches until nothing is due. Returns the totals."""
+    totals = {"sent": 0, "retrying": 0, "failed": 0}
+    while True:
+        result = deliver_pending(batch_size)
+        for key in totals:
+            totals[key] += result[key]
+        if not any(result.values()):
+            return totals
@@ -1,3 +1,234 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import TrainerProfile, ParentProfile
+from .models import Conversation, Message, OutboxEmail
+from .outbox import enqueue_email, deliver_pending, deliver_all, claim_batch, retry_delay
+from .threads import message_page, mark_read
+
+
+class OutboxDeliveryTest(TestCase):
+    def test_enqueue_does_not_send(self):
+        """Enqueueing stores the email without touching the mail backend"""
+        email = enqueue_email("Hello", "Body", "parent@example.com", html_body="<p>Body</p>")
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(email.status, OutboxEmail.Status.QUEUED)
+        self.assertEqual(email.to, ["parent@example.com"])
+
+    def test_batch_delivered_over_one_connection(self):
+        """A batch is sent over a single connection and marked as sent"""
+        for i in range(3):
+            enqueue_email(f"Email {i}", "Body", ["parent@example.com"], html_body="<p>Body</p>")
+
+        with mock.patch("communication.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            result = deliver_pending(batch_size=10)
+
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(result, {"sent": 3, "retrying": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists())
+
+    def test_failed_send_is_retried_with_backoff(self):
+        """A failed send is rescheduled with exponential backoff, then marked failed"""
+        email = enqueue_email("Hello", "Body", "parent@example.com")
+
+        with mock.patch("communication.outbox.EmailMultiAlternatives.send", side_effect=OSError("SMTP down")):
+            before = timezone.now()
+            result = deliver_pending(max_attempts=2)
+            email.refresh_from_db()
+            self.assertEqual(result["retrying"], 1)
+            self.assertEqual(email.status, OutboxEmail.Status.QUEUED)
+            self.assertEqual(email.attempts, 1)
+            self.assertGreaterEqual(email.next_attempt_at, before + retry_delay(1))
+            self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+
+            # not due yet
+            self.assertEqual(deliver_pending(max_attempts=2)["retrying"], 0)
+
+            OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            result = deliver_pending(max_attempts=2)
+
+        email.refresh_from_db()
+        self.assertEqual(result["failed"], 1)
+        self.assertEqual(email.status, OutboxEmail.Status.FAILED)
+        self.assertEqual(email.last_error, "SMTP down")
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_expired_claim_is_reclaimed(self):
+        """Emails claimed by a worker that died are picked up again once the lease expires"""
+        enqueue_email("Hello", "Body", "parent@example.com")
+        self.assertEqual(len(claim_batch()), 1)
+        self.assertEqual(claim_batch(), [])
+
+        OutboxEmail.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_all()["sent"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class ConversationMessagesTest(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create(username="coach")
+        self.trainer_user.groups.add(Group.objects.create(name="trainer"))
+        self.parent_user = User.objects.create(username="mom")
+        self.parent_user.groups.add(Group.objects.create(name="parent"))
+        self.conversation = Conversation.objects.create(
+            trainer=TrainerProfile.objects.create(user=self.trainer_user),
+            parent=ParentProfile.objects.create(user=self.parent_user),
+        )
+
+    def send(self, count, sent_at=None):
+        sent_at = sent_at or timezone.now()
+        return [
+            Message.objects.create(conversation=self.conversation, sender=self.parent_user, body=f"Message {i}", sent_at=sent_at)
+            for i in range(count)
+        ]
+
+    def test_history_is_paged_backwards_by_keyset(self):
+        """Pages walk back over (sent_at, id), also through messages sharing a timestamp"""
+        sent = self.send(5)
+
+        with self.assertNumQueries(1):
+            page, cursor = message_page(self.conversation, page_size=2)
+        self.assertEqual(page, sent[3:])
+        self.assertEqual(cursor, sent[3].id)
+
+        page, cursor = message_page(self.conversation, before=cursor, page_size=2)
+        self.assertEqual(page, sent[1:3])
+
+        page, cursor = message_page(self.conversation, before=cursor, page_size=2)
+        self.assertEqual(page, sent[:1])
+        self.assertIsNone(cursor)
+
+    def test_poll_returns_only_newer_messages(self):
+        """The since endpoint returns the delta after the given id, for participants only"""
+        first, second, third = self.send(3)
+        url = reverse("communication:conversation_messages", args=[self.conversation.id])
+
+        self.client.force_login(self.trainer_user)
+        data = self.client.get(url, {"since": first.id}).json()
+        self.assertEqual([m["id"] for m in data["messages"]], [second.id, third.id])
+        self.assertEqual(data["last_id"], third.id)
+        self.assertFalse(data["messages"][0]["is_mine"])
+
+        data = self.client.get(url, {"since": third.id}).json()
+        self.assertEqual(data, {"messages": [], "last_id": third.id})
+
+        self.client.force_login(User.objects.create(username="stranger"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_post_from_chat_ui_returns_the_message(self):
+        """A JSON post creates the message and answers with it instead of redirecting"""
+        self.client.force_login(self.parent_user)
+        url = reverse("communication:parent_conversation_detail", args=[self.conversation.id])
+
+        response = self.client.post(url, {"body": "Hello coach"}, HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["body"], "Hello coach")
+        self.assertTrue(response.json()["is_mine"])
+        self.assertEqual(self.conversation.messages.count(), 1)
+
+        response = self.client.get(url)
+        self.assertContains(response, "Hello coach")
+        self.assertEqual(response.context["last_id"], self.conversation.messages.get().id)
+
+
+class ConversationInboxTest(TestCase):
+    def setUp(self):
+        self.trainer_user = User.objects.create(username="coach")
+        self.trainer_user.groups.add(Group.objects.create(name="trainer"))
+        self.trainer = TrainerProfile.objects.create(user=self.trainer_user)
+        self.parents = []
+        for i in range(3):
+            user = User.objects.create(username=f"parent-{i}", first_name=f"Parent {i}")
+            self.parents.append(ParentProfile.objects.create(user=user))
+        self.conversations = [
+            Conversation.objects.create(trainer=self.trainer, parent=parent) for parent in self.parents
+        ]
+
+    def test_new_message_updates_last_message_and_recipient_counter(self):
+        """Creating a message costs one extra UPDATE and only counts for the recipient"""
+        conversation = self.conversations[0]
+
+        with self.assertNumQueries(2):
+            Message.objects.create(conversation=conversation, sender=conversation.parent.user, body="Is   practice\ncancelled?")
+        Message.objects.create(conversation=conversation, sender=conversation.parent.user, body="Thanks")
+        Message.objects.create(conversation=conversation, sender=self.trainer_user, body="No, see you at 5")
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_preview, "No, see you at 5")
+        self.assertEqual(conversation.trainer_unread_count, 2)
+        self.assertEqual(conversation.parent_unread_count, 1)
+
+    def test_late_older_message_keeps_newest_preview(self):
+        """A message saved after a newer one is counted but does not become the last message"""
+        conversation = self.conversations[0]
+        now = timezone.now()
+
+        Message.objects.create(conversation=conversation, sender=conversation.parent.user, body="Newer", sent_at=now)
+        Message.objects.create(
+            conversation=conversation, sender=conversation.parent.user, body="Older", sent_at=now - timedelta(seconds=5),
+        )
+
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.last_message_at, conversation.last_message_preview), (now, "Newer"))
+        self.assertEqual(conversation.trainer_unread_count, 2)
+
+    def test_inbox_ordered_by_activity_in_constant_queries(self):
+        """The inbox lists the most recently active conversation first, without per-row queries"""
+        now = timezone.now()
+        for i, conversation in enumerate(self.conversations):
+            Message.objects.create(
+                conversation=conversation, sender=conversation.parent.user,
+                body=f"Hi {i}", sent_at=now - timedelta(hours=i),
+            )
+        self.client.force_login(self.trainer_user)
+        url = reverse("communication:trainer_conversations_view")
+
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as three:
+            self.client.get(url)
+        Conversation.objects.create(trainer=self.trainer, parent=ParentProfile.objects.create(user=User.objects.create(username="parent-x")))
+        with CaptureQueriesContext(connection) as four:
+            self.client.get(url)
+
+        page = response.context["conversations"]
+        self.assertEqual(list(page), self.conversations)
+        self.assertEqual(page[0].trainer_unread_count, 1)
+        self.assertContains(response, "Hi 0")
+        self.assertEqual(len(three), len(four))
+
+    def test_mark_all_read_is_one_update_per_table(self):
+        """Marking the whole inbox read flags messages and resets counters in two UPDATEs"""
+        for conversation in self.conversations:
+            Message.objects.create(conversation=conversation, sender=conversation.parent.user, body="Hi")
+            Message.objects.create(conversation=conversation, sender=self.trainer_user, body="Hello")
+
+        with self.assertNumQueries(2):
+            mark_read(Conversation.objects.filter(trainer=self.trainer), self.trainer_user, "trainer")
+
+        self.assertFalse(Message.objects.filter(sender__parent_profile__isnull=False, is_read=False).exists())
+        self.assertEqual(Message.objects.filter(sender=self.trainer_user, is_read=False).count(), 3)
+        self.assertEqual(set(Conversation.objects.values_list("trainer_unread_count", "parent_unread_count")), {(0, 1)})
+
+    def test_opening_conversation_marks_it_read(self):
+        """Viewing a conversation clears the viewer's unread counter for it"""
+        conversation = self.conversations[0]
+        Message.objects.create(conversation=conversation, sender=conversation.parent.user, body="Hi")
+        self.client.force_login(self.trainer_user)
+
+        self.client.get(reverse("communication:trainer_conversation_detail", args=[conversation.id]))
 
-# Create your tests here.
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.trainer_unread_count, 0)
+        self.assertTrue(conversation.messages.get().is_read)
@@ -0,0 +1,138 @@
+# communication/threads.py
+"""
+Reading a conversation's messages without loading the whole thread.
+
+History is served in keyset pages walking backwards over (sent_at, id), so
+each page is a bounded index range scan on (conversation, sent_at) no matter
+how deep the user scrolls. The chat UI then polls `messages_since` with the id
+of the newest message it has, and only the delta comes back.
+
+The inbox reads the last message and the unread counts straight off
+Conversation; `record_message` and `mark_read` keep those columns in step with
+the messages, each with a single UPDATE.
+"""
+
+from django.core.paginator import Paginator
+from django.db.models import Case, Count, Exists, F, OuterRef, PositiveIntegerField, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from accounts.models import TrainerProfile
+from .models import Conversation, Message
+
+PAGE_SIZE = 30
+POLL_LIMIT = 100
+INBOX_PAGE_SIZE = 20
+PREVIEW_LENGTH = 120
+
+UNREAD_FIELDS = {
+    "trainer": "trainer_unread_count",
+    "parent": "parent_unread_count",
+}
+
+
+def message_page(conversation, before=None, page_size=PAGE_SIZE):
+    """
+    Return (messages, older_cursor) for one page of history.
+
+    `messages` are in chronological order, ready to render. `before` is the
+    id of the oldest message already shown; `older_cursor` is the value to
+    pass as `before` for the next page, or None when there is nothing older.
+    """
+    qs = conversation.messages.select_related("sender")
+    if before:
+        anchor = Message.objects.filter(pk=before, conversation=conversation).values("sent_at")
+        qs = qs.filter(
+            Q(sent_at__lt=Subquery(anchor)) | Q(sent_at=Subquery(anchor), id__lt=before)
+        )
+
+    # one extra row tells us whether an older page exists
+    rows = list(qs.order_by("-sent_at", "-id")[:page_size + 1])
+    has_older = len(rows) > page_size
+    rows = rows[:page_size]
+    rows.reverse()
+
+    older_cursor = rows[0].id if has_older else None
+    return rows, older_cursor
+
+
+def messages_since(conversation, since_id, limit=POLL_LIMIT):
+    """Messages of the conversation newer than `since_id`, oldest first."""
+    return list(
+        conversation.messages
+        .select_related("sender")
+        .filter(id__gt=since_id or 0)
+        .order_by("sent_at", "id")[:limit]
+    )
+
+
+def serialize_message(message, user):
+    return {
+        "id": message.id,
+        "body": message.body,
+        "sender": message.sender.get_full_name() or message.sender.username,
+        "is_mine": message.sender_id == user.id,
+        "sent_at": message.sent_at.isoformat(),
+        "is_read": message.is_read,
+    }
+
+
+def record_message(message):
+    """
+    Move the conversation's last message forward and bump the recipient's
+    unread count. A message older than the current last one (saved late by a
+    concurrent request) still counts as unread but leaves the preview alone.
+    """
+    from_trainer = Exists(
+        TrainerProfile.objects.filter(pk=OuterRef("trainer_id"), user_id=message.sender_id)
+    )
+    is_newest = Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.sent_at)
+    Conversation.objects.filter(pk=message.conversation_id).update(
+        last_message_at=Case(
+            When(is_newest, then=Value(message.sent_at)),
+            default=F("last_message_at"),
+        ),
+        last_message_preview=Case(
+            When(is_newest, then=Value(" ".join(message.body.split())[:PREVIEW_LENGTH])),
+            default=F("last_message_preview"),
+        ),
+        parent_unread_count=Case(
+            When(from_trainer, then=F("parent_unread_count") + 1),
+            default=F("parent_unread_count"),
+            output_field=PositiveIntegerField(),
+        ),
+        trainer_unread_count=Case(
+            When(from_trainer, then=F("trainer_unread_count")),
+            default=F("trainer_unread_count") + 1,
+            output_field=PositiveIntegerField(),
+        ),
+    )
+
+
+def mark_read(conversations, user, side):
+    """
+    Mark everything the other side sent in `conversations` as read.
+
+    Works on one conversation or a whole inbox alike: one UPDATE flags the
+    messages, one resets `side`'s counters. The counter is recounted rather
+    than zeroed so a message arriving in between is not lost.
+    """
+    conversation_ids = conversations.values("id")
+    Message.objects.filter(conversation__in=conversation_ids, is_read=False).exclude(sender=user).update(is_read=True)
+
+    unread = (
+        Message.objects
+        .filter(conversation=OuterRef("pk"), is_read=False)
+        .exclude(sender=user)
+        .values("conversation")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Conversation.objects.filter(id__in=conversation_ids).update(
+        **{UNREAD_FIELDS[side]: Coalesce(Subquery(unread), Value(0), output_field=PositiveIntegerField())}
+    )
+
+
+def inbox_page(conversations, page_number, per_page=INBOX_PAGE_SIZE):
+    """One page of conversations, most recently active first."""
+    conversations = conversations.order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+    return Paginator(conversations, per_page).get_page(page_number)
@@ -13,6 +13,7 @@ urlpatterns = [
     path("parent/conversations/<int:conversation_id>/", views.parent_conversation_detail_view, name="parent_conversation_detail"),
     
     # Both
+    path("conversations/<int:conversation_id>/messages/", views.conversation_messages_view, name="conversation_messages"),
     path("start/", views.start_conversation_view, name="start_conversation"),
 
 ]
@@ -4,8 +4,21 @@ from .models import Conversation, Message
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import JsonResponse
+from .threads import message_page, messages_since, serialize_message, mark_read, inbox_page
 
 
+def _wants_json(request):
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def _int_param(request, name):
+    try:
+        return int(request.GET.get(name) or 0) or None
+    except ValueError:
+        return None
+
 
 
 
@@ -26,6 +39,12 @@ def trainer_conversations_view(request):
         .select_related("parent__user")
     )
 
+    if request.method == "POST" and request.POST.get("action") == "mark_all_read":
+        mark_read(conversations, user, "trainer")
+        return redirect("communication:trainer_conversations_view")
+
+    conversations = inbox_page(conversations, request.GET.get("page"))
+
     context = {
         "trainer": {
             "name": user.get_full_name() or user.username,
@@ -59,15 +78,20 @@ def trainer_conversation_detail_view(request, conversation_id):
     if request.method == "POST":
         body = request.POST.get("body", "").strip()
         if body:
-            Message.objects.create(
+            message = Message.objects.create(
                 conversation=conversation,
                 sender=user,
                 body=body,
                 sent_at=timezone.now()
             )
+            if _wants_json(request):
+                return JsonResponse(serialize_message(message, user), status=201)
             return redirect("communication:trainer_conversation_detail", conversation_id=conversation.id)
 
-    messages = conversation.messages.select_related("sender").order_by("sent_at")
+    if conversation.trainer_unread_count and not request.GET.get("before"):
+        mark_read(Conversation.objects.filter(pk=conversation.pk), user, "trainer")
+
+    messages, older_cursor = message_page(conversation, before=_int_param(request, "before"))
 
     context = {
         "trainer": {
@@ -77,6 +101,8 @@ def trainer_conversation_detail_view(request, conversation_id):
         },
         "conversation": conversation,
         "messages": messages,
+        "older_cursor": older_cursor,
+        "last_id": messages[-1].id if messages else 0,
         "hide_django_messages": True,
     }
 
@@ -101,6 +127,12 @@ def parent_conversations_view(request):
         .select_related("trainer__user")
     )
 
+    if request.method == "POST" and request.POST.get("action") == "mark_all_read":
+        mark_read(conversations, user, "parent")
+        return redirect("communication:parent_conversations_view")
+
+    conversations = inbox_page(conversations, request.GET.get("page"))
+
     context = {
         "parent": {
             "name": user.get_full_name() or user.username,
@@ -134,15 +166,20 @@ def parent_conversation_detail_view(request, conversation_id):
     if request.method == "POST":
         body = request.POST.get("body", "").strip()
         if body:
-            Message.objects.create(
+            message = Message.objects.create(
                 conversation=conversation,
                 sender=user,
                 body=body,
                 sent_at=timezone.now()
             )
+            if _wants_json(request):
+                return JsonResponse(serialize_message(message, user), status=201)
             return redirect("communication:parent_conversation_detail", conversation_id=conversation.id)
 
-    messages = conversation.messages.select_related("sender").order_by("sent_at")
+    if conversation.parent_unread_count and not request.GET.get("before"):
+        mark_read(Conversation.objects.filter(pk=conversation.pk), user, "parent")
+
+    messages, older_cursor = message_page(conversation, before=_int_param(request, "before"))
 
     context = {
         "parent": {
@@ -152,6 +189,8 @@ def parent_conversation_detail_view(request, conversation_id):
         },
         "conversation": conversation,
         "messages": messages,
+        "older_cursor": older_cursor,
+        "last_id": messages[-1].id if messages else 0,
         "hide_django_messages": True,
     }
 
@@ -204,4 +243,24 @@ def start_conversation_view(request):
             "trainers": trainers
         })
 
-    return redirect("accounts:login_view")
\ No newline at end of file
+    return redirect("accounts:login_view")
+
+
+@login_required
+def conversation_messages_view(request, conversation_id):
+    """JSON list of the messages newer than ?since=<id>, polled by the chat UI."""
+    conversation = get_object_or_404(
+        Conversation.objects.filter(Q(trainer__user=request.user) | Q(parent__user=request.user)).select_related("trainer"),
+        id=conversation_id,
+    )
+    since = _int_param(request, "since")
+    messages = messages_since(conversation, since)
+
+    if any(message.sender_id != request.user.id and not message.is_read for message in messages):
+        side = "trainer" if conversation.trainer.user_id == request.user.id else "parent"
+        mark_read(Conversation.objects.filter(pk=conversation.pk), request.user, side)
+
+    return JsonResponse({
+        "messages": [serialize_message(message, request.user) for message in messages],
+        "last_id": messages[-1].id if messages else since,
+    })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Child, Enrollment
+from .models import Child, Enrollment, SessionWaitlistEntry, ChildReport
 # Register your models here.
 admin.site.register(Child)
 
@@ -10,3 +10,17 @@ class EnrollmentAdmin(admin.ModelAdmin):
     def session_list(self, obj):
         return ", ".join(s.title for s in obj.sessions.all())
     session_list.short_description = "Sessions"
+
+
+@admin.register(SessionWaitlistEntry)
+class SessionWaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ("child", "session", "status", "created_at", "promoted_at")
+    list_filter = ("status",)
+    list_select_related = ("child", "session")
+
+
+@admin.register(ChildReport)
+class ChildReportAdmin(admin.ModelAdmin):
+    list_display = ("child", "version", "rendered_version", "generated_at")
+    list_select_related = ("child",)
+    readonly_fields = ("data", "html", "version", "rendered_version", "generated_at")
@@ -12,8 +12,8 @@ class EnrollmentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if parent:
-            self.fields['child'].queryset = Child.objects.filter(parent=parent)
-            self.fields['program'].queryset = Program.objects.filter(academy__isnull=False)
+            self.fields['child'].queryset = Child.objects.filter(parent=parent).select_related('parent__user')
+            self.fields['program'].queryset = Program.objects.filter(academy__isnull=False).select_related('academy')
 
         self.fields['child'].label = "Select Child"
         self.fields['child'].help_text = "Choose which child to enroll"
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from accounts.models import AcademyAdminProfile, ParentProfile
+from academies.models import Academy, Program, Session
+from parents.models import Child, Enrollment, SessionWaitlistEntry
+from parents.seats import enroll_in_session, SEATED, WAITLISTED
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test seat reservation: many concurrent enrollments into one session '
+        'on the configured database (SQLite runs in WAL mode), checking the session '
+        'is never oversubscribed and reporting throughput. Throwaway data is removed afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=500, help='Number of enrollment attempts')
+        parser.add_argument('--workers', type=int, default=16, help='Number of concurrent threads')
+        parser.add_argument('--capacity', type=int, default=20, help='Capacity of the contended session')
+        parser.add_argument(
+            '--min-throughput',
+            type=float,
+            default=0,
+            help='Fail if fewer attempts per second than this were completed',
+        )
+
+    def handle(self, *args, **options):
+        attempts, capacity = options['attempts'], options['capacity']
+        if capacity > attempts:
+            raise CommandError('--capacity must not exceed --attempts.')
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        self.stdout.write(f'Database: {connection.vendor}')
+
+        tag = uuid.uuid4().hex[:8]
+        academy, session, enrollments, users = self._fixtures(tag, attempts, capacity)
+        try:
+            start = threading.Event()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                futures = [pool.submit(self._attempt, enrollment, session, start) for enrollment in enrollments]
+                started = time.perf_counter()
+                start.set()
+                results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+
+            session.refresh_from_db()
+            seated = results.count(SEATED)
+            waitlisted = results.count(WAITLISTED)
+            waiting = SessionWaitlistEntry.objects.filter(session=session, status=SessionWaitlistEntry.Status.WAITING).count()
+            throughput = attempts / elapsed if elapsed else float('inf')
+
+            self.stdout.write(f'  seated: {seated}, waitlisted: {waitlisted}')
+            self.stdout.write(f'  {attempts} attempts in {elapsed:.2f}s ({throughput:.0f}/s)')
+
+            problems = []
+            if seated != capacity or session.enrolled != capacity or session.enrollments.count() != capacity:
+                problems.append(
+                    f'expected {capacity} seats, got {seated} seated, counter {session.enrolled}, '
+                    f'{session.enrollments.count()} enrollments'
+                )
+            if waitlisted != attempts - capacity or waiting != attempts - capacity:
+                problems.append(f'expected {attempts - capacity} waitlisted, got {waitlisted} ({waiting} entries)')
+            if throughput < options['min_throughput']:
+                problems.append(f'throughput {throughput:.0f}/s below {options["min_throughput"]:.0f}/s')
+        finally:
+            # Program.academy is SET_NULL, so the program has to go on its own
+            session.program.delete()
+            academy.delete()
+            User.objects.filter(pk__in=users).delete()
+
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS(f'\nCompleted! Session never exceeded its {capacity} seats.'))
+
+    def _fixtures(self, tag, attempts, capacity):
+        admin = User.objects.create(username=f'seat-load-admin-{tag}')
+        academy = Academy.objects.create(
+            name=f'Seat load test {tag}', description='Load test', city='Riyadh',
+            owner=AcademyAdminProfile.objects.create(user=admin),
+        )
+        program = Program.objects.create(academy=academy, title='Load test')
+        session = Session.objects.create(program=program, title='Load test', capacity=capacity)
+
+        parent_user = User.objects.create(username=f'seat-load-parent-{tag}')
+        parent = ParentProfile.objects.create(user=parent_user)
+        children = Child.objects.bulk_create([
+            Child(parent=parent, first_name=f'Child {i}') for i in range(attempts)
+        ])
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(child=child, program=program) for child in children
+        ])
+        return academy, session, enrollments, [admin.pk, parent_user.pk]
+
+    def _attempt(self, enrollment, session, start):
+        start.wait()
+        try:
+            # SQLite reports write contention as "locked" instead of blocking; retry
+            for _ in range(1000):
+                try:
+                    return enroll_in_session(enrollment, session)
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.005)
+            raise CommandError('could not acquire database lock')
+        finally:
+            connection.close()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from academies.models import Session
+from parents.seats import recount_seats
+
+
+class Command(BaseCommand):
+    help = 'Recompute every session\'s seat counter (Session.enrolled) from its enrollments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session-id',
+            type=int,
+            action='append',
+            help='Only recount this session (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if options['session_id']:
+            sessions = sessions.filter(pk__in=options['session_id'])
+
+        updated = recount_seats(sessions)
+
+        self.stdout.write(self.style.SUCCESS(f'\nCompleted! Recounted seats for {updated} sessions.'))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from academies.models import Academy
+from parents.models import Child
+from parents.reports import refresh_reports, report_children
+
+
+class Command(BaseCommand):
+    help = 'Pre-render parent progress reports for children'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--academy-slug',
+            type=str,
+            help='Refresh reports for the players of a specific academy (by slug)',
+        )
+        parser.add_argument(
+            '--all-academies',
+            action='store_true',
+            help='Refresh reports for every child on the platform',
+        )
+        parser.add_argument(
+            '--stale-only',
+            action='store_true',
+            help='Only refresh reports that are missing or out of date',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of children rendered per batch',
+        )
+
+    def handle(self, *args, **options):
+        children = Child.objects.all()
+
+        if options['academy_slug']:
+            try:
+                academy = Academy.objects.get(slug=options['academy_slug'])
+            except Academy.DoesNotExist:
+                self.stdout.write(
+                    self.style.ERROR(f'Academy with slug "{options["academy_slug"]}" not found.')
+                )
+                return
+            children = children.filter(player_profile__academy=academy)
+        elif not options['all_academies']:
+            self.stdout.write(
+                self.style.ERROR('Use --academy-slug or --all-academies.')
+            )
+            return
+
+        if options['stale_only']:
+            children = children.exclude(report__rendered_version__gte=F('report__version'))
+
+        batch, refreshed = [], 0
+        for child in report_children(children).iterator(chunk_size=options['batch_size']):
+            batch.append(child)
+            if len(batch) == options['batch_size']:
+                refreshed += len(refresh_reports(batch))
+                batch = []
+                self.stdout.write(f'  refreshed {refreshed} reports...')
+        if batch:
+            refreshed += len(refresh_reports(batch))
+
+        self.stdout.write(self.style.SUCCESS(f'\nCompleted! Refreshed {refreshed} child reports.'))
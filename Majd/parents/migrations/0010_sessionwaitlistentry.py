@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_enrolled(apps, schema_editor):
+    """Session.enrolled becomes the seat counter: one seat per enrollment linked to the session."""
+    Session = apps.get_model("academies", "Session")
+    Enrollment = apps.get_model("parents", "Enrollment")
+    counts = dict(
+        Enrollment.sessions.through.objects
+        .values_list("session_id")
+        .annotate(total=Count("id"))
+        .values_list("session_id", "total")
+    )
+    sessions = list(Session.objects.only("id", "enrolled"))
+    for session in sessions:
+        session.enrolled = counts.get(session.id, 0)
+    Session.objects.bulk_update(sessions, ["enrolled"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academies', '0016_exportjob'),
+        ('parents', '0009_merge_20250903_2322'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionWaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('promoted', 'Promoted'), ('cancelled', 'Cancelled')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('promoted_at', models.DateTimeField(blank=True, null=True)),
+                ('child', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='parents.child')),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='parents.enrollment')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='academies.session')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['session', 'status', 'created_at'], name='waitlist_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('session', 'child'), name='unique_waiting_child_per_session')],
+            },
+        ),
+        migrations.RunPython(backfill_enrolled, migrations.RunPython.noop),
+    ]
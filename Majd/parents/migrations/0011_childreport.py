@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parents', '0010_sessionwaitlistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChildReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('html', models.TextField(blank=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('rendered_version', models.PositiveIntegerField(default=0)),
+                ('generated_at', models.DateTimeField(blank=True, null=True)),
+                ('child', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='report', to='parents.child')),
+            ],
+        ),
+    ]
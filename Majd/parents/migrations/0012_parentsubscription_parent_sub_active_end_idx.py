@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parents', '0011_childreport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parentsubscription',
+            index=models.Index(fields=['is_active', 'end_date'], name='parent_sub_active_end_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.db.models.functions import ExtractYear, ExtractMonth, ExtractDay, Now
-from django.db.models import IntegerField, Case, When, Value, Q, F
+from django.db.models import IntegerField, BooleanField, CharField, Case, When, Value, Q, F, Exists, OuterRef, Subquery
 from academies.models import Program, Session, Academy
 from accounts.models import ParentProfile
 from cloudinary.models import CloudinaryField
@@ -31,6 +33,56 @@ class ChildQuerySet(models.QuerySet):
             )
         )
 
+    def with_program_eligibility(self, program, min_age=None, max_age=None):
+        """
+        Annotate children with what join_program_view needs to know about `program`,
+        in the same query:
+
+        - age: as in with_age()
+        - in_program: has an active enrollment in this program
+        - enrolled_academy_name: academy of the blocking active enrollment, if any
+          (this academy when in_program, otherwise the first other academy)
+        - already_enrolled: in this program, or actively enrolled at another academy
+        - is_eligible: age within [min_age, max_age]; children without a date of
+          birth, or programs without sessions, are eligible
+        """
+        active = Enrollment.objects.filter(child=OuterRef("pk"), is_active=True)
+        academy_name = program.academy.name if program.academy else None
+
+        if min_age is None or max_age is None:
+            is_eligible = Value(True)
+        else:
+            is_eligible = Case(
+                When(age__isnull=True, then=Value(True)),
+                When(age__gte=min_age, age__lte=max_age, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+
+        return (
+            self.with_age()
+            .annotate(
+                in_program=Exists(active.filter(program=program)),
+                other_academy_name=Subquery(
+                    active.exclude(program__academy=program.academy_id).values("program__academy__name")[:1]
+                ),
+            )
+            .annotate(
+                already_enrolled=Case(
+                    When(in_program=True, then=Value(True)),
+                    When(other_academy_name__isnull=False, then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                ),
+                enrolled_academy_name=Case(
+                    When(in_program=True, then=Value(academy_name)),
+                    default=F("other_academy_name"),
+                    output_field=CharField(),
+                ),
+                is_eligible=is_eligible,
+            )
+        )
+
 
 
 class Child(models.Model):
@@ -106,6 +158,9 @@ class ParentSubscription(models.Model):
     
     class Meta:
         unique_together = ("parent", "academy")
+        indexes = [
+            models.Index(fields=["is_active", "end_date"], name="parent_sub_active_end_idx"),
+        ]
     
     def __str__(self):
         return f"{self.parent.user.username} subscribed to {self.academy.name}"
@@ -123,4 +178,95 @@ class ParentSubscription(models.Model):
     def is_valid(self):
         """Check if subscription is valid (active and not expired)"""
         return self.is_active and not self.is_expired
-    
\ No newline at end of file
+    
+
+class SessionWaitlistEntry(models.Model):
+    """
+    FIFO queue of children waiting for a seat in a full session.
+    Entries are promoted in (created_at, id) order when a seat frees up.
+    """
+    class Status(models.TextChoices):
+        WAITING   = "waiting", "Waiting"
+        PROMOTED  = "promoted", "Promoted"
+        CANCELLED = "cancelled", "Cancelled"
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="waitlist_entries")
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="waitlist_entries")
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name="waitlist_entries")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    promoted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        indexes = [
+            models.Index(fields=["session", "status", "created_at"], name="waitlist_queue_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "child"],
+                condition=Q(status="waiting"),
+                name="unique_waiting_child_per_session",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.child.first_name} waiting for {self.session.title} ({self.status})"
+
+
+class ChildReport(models.Model):
+    """
+    Pre-rendered progress report for a child. `data` holds the computed numbers,
+    `html` the rendered card. Data changes bump `version`; the report is stale
+    until parents.reports re-renders it and records the version it rendered.
+    """
+    child = models.OneToOneField(Child, on_delete=models.CASCADE, related_name="report")
+    data = models.JSONField(default=dict, blank=True)
+    html = models.TextField(blank=True)
+    version = models.PositiveIntegerField(default=1)
+    rendered_version = models.PositiveIntegerField(default=0)
+    generated_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_stale(self):
+        return self.rendered_version < self.version
+
+    def __str__(self):
+        return f"Report<{self.child.first_name}> ({'stale' if self.is_stale else 'fresh'})"
+
+
+@receiver(post_save, sender=Child)
+def mark_child_report_stale(sender, instance, created, **kwargs):
+    if not created:
+        ChildReport.objects.filter(child=instance).update(version=F("version") + 1)
+
+
+@receiver(m2m_changed, sender=Enrollment.sessions.through)
+def track_session_seats(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Session.enrolled in step with sessions.add/remove/clear (admin edits included)."""
+    from .seats import linked_seats, seats_taken, seats_released
+
+    if action == "post_add" and pk_set:
+        seats_taken({instance.pk: len(pk_set)} if reverse else {pk: 1 for pk in pk_set})
+    elif action in ("pre_remove", "pre_clear"):
+        if reverse:
+            instance._released_seats = linked_seats(enrollment_ids=pk_set, session_ids=[instance.pk])
+        else:
+            instance._released_seats = linked_seats(enrollment_ids=[instance.pk], session_ids=pk_set)
+    elif action in ("post_remove", "post_clear"):
+        seats_released(instance.__dict__.pop("_released_seats", {}))
+
+
+@receiver(pre_delete, sender=Enrollment)
+def remember_enrollment_seats(sender, instance, **kwargs):
+    from .seats import linked_seats
+
+    instance._released_seats = linked_seats(enrollment_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Enrollment)
+def release_enrollment_seats(sender, instance, **kwargs):
+    """Deleting an Enrollment cascades its through rows; give their seats back."""
+    from .seats import seats_released
+
+    seats_released(instance.__dict__.pop("_released_seats", {}))
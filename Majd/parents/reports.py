@@ -0,0 +1,141 @@
+# parents/reports.py
+"""
+Parent progress reports.
+
+Reports are computed for many children at once (a fixed number of queries per
+batch) and stored pre-rendered on ChildReport. Data changes only bump the
+report's version (see the receivers in player.models); the reports page
+re-renders the stale ones in one batch and otherwise just reads stored HTML.
+"""
+from django.db.models import Avg, Count, Max
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from player.models import PlayerSkill, Evaluation
+from .models import Child, ChildReport
+
+
+# skill level as a percentage of its target
+STRENGTH_LEVEL = 75
+IMPROVEMENT_LEVEL = 60
+MAX_LISTED_SKILLS = 3
+
+REPORT_TEMPLATE = "main/partials/report_card.html"
+
+
+def skill_level(score, target_level):
+    if not target_level:
+        return 0
+    return min(100, round(100 * score / target_level))
+
+
+def build_report_data(children):
+    """
+    Compute report data for `children` (Child objects with player_profile and
+    its academy select_related). Returns {child_id: data}.
+    """
+    players = {}
+    for child in children:
+        player = getattr(child, "player_profile", None)
+        if player is not None:
+            players[player.pk] = player
+
+    skills_by_player = {}
+    skills = (
+        PlayerSkill.objects
+        .filter(player_id__in=players)
+        # only scored evaluations count; skill_score can be left blank
+        .annotate(eval_avg=Avg("skill_evaluations__skill_score"), eval_count=Count("skill_evaluations__skill_score"))
+        .values("player_id", "name", "current_level", "target_level", "eval_avg", "eval_count")
+    )
+    for skill in skills:
+        score = skill["eval_avg"] if skill["eval_count"] else skill["current_level"]
+        skills_by_player.setdefault(skill["player_id"], []).append({
+            "name": skill["name"],
+            "level": skill_level(score, skill["target_level"]),
+            "evaluations": skill["eval_count"],
+        })
+
+    evaluation_stats = {
+        row["player_id"]: row
+        for row in (
+            Evaluation.objects
+            .filter(player_id__in=players)
+            .values("player_id")
+            .annotate(count=Count("id"), last=Max("created_at"))
+            .order_by()
+        )
+    }
+
+    reports = {}
+    for child in children:
+        player = getattr(child, "player_profile", None)
+        skills = skills_by_player.get(player.pk, []) if player else []
+        stats = evaluation_stats.get(player.pk, {}) if player else {}
+        ranked = sorted(skills, key=lambda s: (-s["level"], s["name"]))
+
+        reports[child.pk] = {
+            "first_name": child.first_name,
+            "last_name": child.last_name,
+            "sport": child.primary_sport,
+            "academy_name": player.academy.name if player and player.academy else "Not Assigned",
+            "grade": player.current_grade if player else None,
+            "overall_progress": round(player.avg_progress) if player else 0,
+            "attendance_rate": round(player.attendance_rate) if player else 0,
+            "strengths": [s for s in ranked if s["level"] >= STRENGTH_LEVEL][:MAX_LISTED_SKILLS],
+            "areas_for_improvement": [s for s in reversed(ranked) if s["level"] < IMPROVEMENT_LEVEL][:MAX_LISTED_SKILLS],
+            "evaluations_count": stats.get("count", 0),
+            "last_evaluated": timezone.localtime(stats["last"]).date().isoformat() if stats.get("last") else None,
+        }
+    return reports
+
+
+def refresh_reports(children):
+    """
+    Rebuild and store the reports of `children` (as loaded by report_children()).
+    Returns {child_id: ChildReport}.
+    """
+    children = list(children)
+    if not children:
+        return {}
+
+    existing = {r.child_id: r for r in ChildReport.objects.filter(child__in=children)}
+    data = build_report_data(children)
+    now = timezone.now()
+
+    to_create, to_update = [], []
+    for child in children:
+        report = existing.get(child.pk) or ChildReport(child=child)
+        report.data = data[child.pk]
+        report.html = render_to_string(REPORT_TEMPLATE, {"report": report.data})
+        # render the version we read, so a change made meanwhile keeps it stale
+        report.rendered_version = report.version
+        report.generated_at = now
+        (to_update if report.pk else to_create).append(report)
+
+    ChildReport.objects.bulk_update(to_update, ["data", "html", "rendered_version", "generated_at"])
+    ChildReport.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    reports = dict(existing)
+    reports.update((r.child_id, r) for r in to_create)
+    return reports
+
+
+def report_children(children):
+    return children.select_related("player_profile__academy", "report").order_by("pk")
+
+
+def reports_for_parent(parent):
+    """
+    Return the parent's children's reports in child order, re-rendering only
+    missing or stale ones.
+    """
+    children = list(report_children(Child.objects.filter(parent=parent)))
+
+    def current(child):
+        report = getattr(child, "report", None)
+        return report if report is not None and not report.is_stale else None
+
+    stale = [child for child in children if current(child) is None]
+    refreshed = refresh_reports(stale)
+    return [current(child) or refreshed[child.pk] for child in children]
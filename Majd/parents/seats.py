@@ -0,0 +1,182 @@
+# parents/seats.py
+"""
+Seat reservation for session capacity.
+
+Session.enrolled is the seat counter: one seat per (Enrollment, Session) row in
+Enrollment.sessions. Seats are taken with a conditional UPDATE
+(enrolled < capacity), so parallel requests can never oversubscribe a session;
+a child that does not get a seat joins the session's FIFO waitlist and is
+promoted automatically when a seat is released.
+
+Through rows written elsewhere (Enrollment.sessions.add/remove/clear, admin
+edits, deleting an Enrollment) adjust the counter through the receivers in
+parents.models; `recount_seats` repairs a counter that drifted anyway.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from academies.models import Session
+from .models import Enrollment, SessionWaitlistEntry
+
+
+SEATED = "seated"
+ALREADY_SEATED = "already_seated"
+WAITLISTED = "waitlisted"
+
+
+def reserve_seat(session_id):
+    """Take one seat if any is left. Returns True when the seat was taken."""
+    return Session.objects.filter(pk=session_id, enrolled__lt=F("capacity")).update(enrolled=F("enrolled") + 1) == 1
+
+
+def _give_back_seat(session_id):
+    Session.objects.filter(pk=session_id, enrolled__gt=0).update(enrolled=F("enrolled") - 1)
+
+
+def linked_seats(enrollment_ids=None, session_ids=None):
+    """Counter of session_id -> seats held by the matching through rows."""
+    rows = Enrollment.sessions.through.objects.all()
+    if enrollment_ids is not None:
+        rows = rows.filter(enrollment_id__in=enrollment_ids)
+    if session_ids is not None:
+        rows = rows.filter(session_id__in=session_ids)
+    return Counter(rows.values_list("session_id", flat=True))
+
+
+def seats_taken(seats):
+    """Count seats (session_id -> n) taken outside enroll_in_session."""
+    for session_id, n in seats.items():
+        Session.objects.filter(pk=session_id).update(enrolled=F("enrolled") + n)
+
+
+def seats_released(seats):
+    """Give back seats (session_id -> n) released outside leave_session and seat the waitlist."""
+    for session_id, n in seats.items():
+        Session.objects.filter(pk=session_id).update(enrolled=Greatest(F("enrolled") - n, Value(0)))
+        transaction.on_commit(lambda session_id=session_id: promote_waitlist(session_id))
+
+
+def recount_seats(sessions=None):
+    """
+    Recompute Session.enrolled from the through table, for `sessions` (a
+    queryset) or every session. Returns the number of sessions updated.
+    """
+    seats = (
+        Enrollment.sessions.through.objects
+        .filter(session_id=OuterRef("pk"))
+        .values("session_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    sessions = Session.objects.all() if sessions is None else sessions
+    return sessions.update(enrolled=Coalesce(Subquery(seats), Value(0)))
+
+
+def _link_player(child, session):
+    from player.models import PlayerSession
+
+    player = getattr(child, "player_profile", None)
+    if player is not None:
+        PlayerSession.objects.get_or_create(player=player, session=session)
+
+
+def enroll_in_session(enrollment, session):
+    """
+    Add `session` to `enrollment` if a seat is free, otherwise put the child on
+    the session's waitlist. Returns SEATED, ALREADY_SEATED or WAITLISTED.
+    """
+    through = Enrollment.sessions.through
+    with transaction.atomic():
+        # serialise concurrent attempts for the same enrollment
+        Enrollment.objects.select_for_update().filter(pk=enrollment.pk).first()
+
+        if through.objects.filter(enrollment_id=enrollment.pk, session_id=session.pk).exists():
+            return ALREADY_SEATED
+
+        if reserve_seat(session.pk):
+            through.objects.create(enrollment_id=enrollment.pk, session_id=session.pk)
+            SessionWaitlistEntry.objects.filter(
+                session=session, child_id=enrollment.child_id, status=SessionWaitlistEntry.Status.WAITING
+            ).update(status=SessionWaitlistEntry.Status.CANCELLED)
+            _link_player(enrollment.child, session)
+            return SEATED
+
+    try:
+        with transaction.atomic():
+            SessionWaitlistEntry.objects.get_or_create(
+                session=session,
+                child_id=enrollment.child_id,
+                status=SessionWaitlistEntry.Status.WAITING,
+                defaults={"enrollment": enrollment},
+            )
+    except IntegrityError:
+        # a parallel request queued the same child first
+        pass
+    return WAITLISTED
+
+
+def leave_session(enrollment, session):
+    """
+    Remove `session` from `enrollment`, give the seat back and promote the
+    next waiting child. Returns True if the child held a seat.
+    """
+    through = Enrollment.sessions.through
+    with transaction.atomic():
+        removed, _ = through.objects.filter(enrollment_id=enrollment.pk, session_id=session.pk).delete()
+        if removed:
+            _give_back_seat(session.pk)
+        else:
+            SessionWaitlistEntry.objects.filter(
+                session=session, child_id=enrollment.child_id, status=SessionWaitlistEntry.Status.WAITING
+            ).update(status=SessionWaitlistEntry.Status.CANCELLED)
+
+    if removed:
+        promote_waitlist(session.pk)
+    return bool(removed)
+
+
+def promote_waitlist(session_id):
+    """
+    Seat waiting children in FIFO order while the session has free seats.
+    Returns the list of promoted entries.
+    """
+    through = Enrollment.sessions.through
+    promoted = []
+    while True:
+        with transaction.atomic():
+            entry = (
+                SessionWaitlistEntry.objects
+                .select_for_update(skip_locked=True)
+                .filter(session_id=session_id, status=SessionWaitlistEntry.Status.WAITING)
+                .select_related("enrollment", "child")
+                .order_by("created_at", "id")
+                .first()
+            )
+            if entry is None:
+                return promoted
+
+            claimed = SessionWaitlistEntry.objects.filter(
+                pk=entry.pk, status=SessionWaitlistEntry.Status.WAITING
+            )
+            if not entry.enrollment.is_active:
+                claimed.update(status=SessionWaitlistEntry.Status.CANCELLED)
+                continue
+
+            if not reserve_seat(session_id):
+                return promoted
+
+            if not claimed.update(status=SessionWaitlistEntry.Status.PROMOTED, promoted_at=timezone.now()):
+                # another worker took this entry; hand the seat back and retry
+                _give_back_seat(session_id)
+                continue
+
+            _, created = through.objects.get_or_create(enrollment_id=entry.enrollment_id, session_id=session_id)
+            if not created:
+                _give_back_seat(session_id)
+            session = Session.objects.get(pk=session_id)
+            _link_player(entry.child, session)
+            promoted.append(entry)
@@ -1,3 +1,580 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import AcademyAdminProfile, ParentProfile
+from academies.models import Academy, Program, Session
+from payment.models import SubscriptionPlan
+from payment.pricing import active_plans
+from player.models import PlayerProfile, PlayerSession
+from .models import Child, ChildReport, Enrollment, SessionWaitlistEntry
+from .reports import reports_for_parent
+from .seats import enroll_in_session, leave_session, promote_waitlist, SEATED, ALREADY_SEATED, WAITLISTED
+
+
+def make_program(name="Seat Academy"):
+    user = User.objects.create(username=f"admin-{name}")
+    owner = AcademyAdminProfile.objects.create(user=user)
+    academy = Academy.objects.create(name=name, description="Test", city="Riyadh", owner=owner)
+    return Program.objects.create(academy=academy, title="Football")
+
+
+def make_enrollments(program, count, parent=None):
+    if parent is None:
+        parent = ParentProfile.objects.create(user=User.objects.create(username="parent"))
+    enrollments = []
+    for i in range(count):
+        child = Child.objects.create(parent=parent, first_name=f"Child {i}", date_of_birth=date(2015, 1, 1))
+        enrollments.append(Enrollment.objects.create(child=child, program=program))
+    return enrollments
+
+
+class SeatReservationTest(TestCase):
+    def setUp(self):
+        """Set up a two-seat session and four enrollments"""
+        self.program = make_program()
+        self.session = Session.objects.create(program=self.program, title="U10", capacity=2)
+        self.enrollments = make_enrollments(self.program, 4)
+
+    def test_full_session_waitlists(self):
+        """Test that children beyond capacity are waitlisted instead of seated"""
+        results = [enroll_in_session(e, self.session) for e in self.enrollments]
+
+        self.assertEqual(results, [SEATED, SEATED, WAITLISTED, WAITLISTED])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.enrolled, 2)
+        self.assertEqual(self.session.enrollments.count(), 2)
+        self.assertEqual(
+            SessionWaitlistEntry.objects.filter(session=self.session, status="waiting").count(), 2
+        )
+
+    def test_enrolling_twice_does_not_take_a_second_seat(self):
+        """Test that re-enrolling a seated child is a no-op"""
+        enroll_in_session(self.enrollments[0], self.session)
+
+        self.assertEqual(enroll_in_session(self.enrollments[0], self.session), ALREADY_SEATED)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.enrolled, 1)
+
+    def test_waitlisting_twice_keeps_one_entry(self):
+        """Test that a waiting child is queued only once"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+        enroll_in_session(self.enrollments[3], self.session)
+
+        self.assertEqual(
+            SessionWaitlistEntry.objects.filter(child=self.enrollments[3].child, status="waiting").count(), 1
+        )
+
+    def test_leaving_promotes_first_in_line(self):
+        """Test that a freed seat goes to the oldest waitlist entry"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+        PlayerProfile.objects.create(child=self.enrollments[2].child, academy=self.program.academy)
+
+        self.assertTrue(leave_session(self.enrollments[0], self.session))
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.enrolled, 2)
+        seated = set(self.session.enrollments.values_list("pk", flat=True))
+        self.assertEqual(seated, {self.enrollments[1].pk, self.enrollments[2].pk})
+        entry = SessionWaitlistEntry.objects.get(child=self.enrollments[2].child)
+        self.assertEqual(entry.status, SessionWaitlistEntry.Status.PROMOTED)
+        self.assertIsNotNone(entry.promoted_at)
+        self.assertTrue(
+            PlayerSession.objects.filter(player__child=self.enrollments[2].child, session=self.session).exists()
+        )
+
+    def test_promotion_skips_inactive_enrollments(self):
+        """Test that paused enrollments lose their place in line"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+        Enrollment.objects.filter(pk=self.enrollments[2].pk).update(is_active=False)
+
+        leave_session(self.enrollments[0], self.session)
+
+        self.assertEqual(
+            SessionWaitlistEntry.objects.get(child=self.enrollments[2].child).status,
+            SessionWaitlistEntry.Status.CANCELLED,
+        )
+        self.assertTrue(self.session.enrollments.filter(pk=self.enrollments[3].pk).exists())
+
+    def test_capacity_increase_promotes_waitlist(self):
+        """Test that raising capacity seats waiting children up to the new limit"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+        Session.objects.filter(pk=self.session.pk).update(capacity=3)
+
+        promoted = promote_waitlist(self.session.pk)
+
+        self.assertEqual([p.child_id for p in promoted], [self.enrollments[2].child_id])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.enrolled, 3)
+
+    def test_unenroll_view_releases_seat(self):
+        """Test that unenrolling through the parent view frees the seat for the waitlist"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+        child = self.enrollments[0].child
+        self.client.force_login(child.parent.user)
+
+        self.client.get(reverse("parents:unenroll", args=[self.session.id, child.id]))
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.enrolled, 2)
+        self.assertTrue(self.session.enrollments.filter(pk=self.enrollments[2].pk).exists())
+
+
+class SeatCounterDriftTest(TestCase):
+    def setUp(self):
+        """Set up a two-seat session and three enrollments"""
+        self.program = make_program()
+        self.session = Session.objects.create(program=self.program, title="U10", capacity=2)
+        self.enrollments = make_enrollments(self.program, 3)
+
+    def enrolled(self):
+        self.session.refresh_from_db()
+        return self.session.enrolled
+
+    def test_orm_edits_move_the_counter(self):
+        """Test that sessions.add/remove/clear from either side keep the counter in step"""
+        self.enrollments[0].sessions.add(self.session)
+        self.session.enrollments.add(self.enrollments[1])
+        self.assertEqual(self.enrolled(), 2)
+
+        # removing a session the enrollment doesn't hold gives nothing back
+        self.enrollments[2].sessions.remove(self.session)
+        self.assertEqual(self.enrolled(), 2)
+
+        self.enrollments[0].sessions.remove(self.session)
+        self.assertEqual(self.enrolled(), 1)
+
+        self.session.enrollments.clear()
+        self.assertEqual(self.enrolled(), 0)
+
+    def test_deleting_enrollment_releases_seat_to_waitlist(self):
+        """Test that deleting a seated enrollment frees its seat for the next child in line"""
+        for e in self.enrollments:
+            enroll_in_session(e, self.session)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enrollments[0].delete()
+
+        self.assertEqual(self.enrolled(), 2)
+        self.assertTrue(self.session.enrollments.filter(pk=self.enrollments[2].pk).exists())
+
+    def test_recount_command_repairs_drift(self):
+        """Test that recount_session_seats recomputes the counter from the enrollments"""
+        from django.core.management import call_command
+
+        enroll_in_session(self.enrollments[0], self.session)
+        Session.objects.filter(pk=self.session.pk).update(enrolled=7)
+
+        call_command("recount_session_seats", stdout=StringIO())
+
+        self.assertEqual(self.enrolled(), 1)
+
+
+class ConcurrentSeatReservationTest(TransactionTestCase):
+    """Hammer one session from many threads and check it is never oversubscribed."""
+
+    CAPACITY = 5
+    ATTEMPTS = 60
+    WORKERS = 8
+
+    def setUp(self):
+        self.program = make_program()
+        self.session = Session.objects.create(program=self.program, title="U10", capacity=self.CAPACITY)
+        self.enrollments = make_enrollments(self.program, self.ATTEMPTS)
+
+    def _attempt(self, enrollment, start):
+        start.wait()
+        try:
+            # SQLite reports write contention as "locked" instead of blocking; retry
+            for _ in range(200):
+                try:
+                    return enroll_in_session(enrollment, self.session)
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    time.sleep(0.005)
+            raise AssertionError("could not acquire database lock")
+        finally:
+            connection.close()
+
+    def test_parallel_enrollment_never_exceeds_capacity(self):
+        start = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            futures = [pool.submit(self._attempt, e, start) for e in self.enrollments]
+            start.set()
+            results = [f.result() for f in futures]
+
+        self.session.refresh_from_db()
+        self.assertEqual(results.count(SEATED), self.CAPACITY)
+        self.assertEqual(results.count(WAITLISTED), self.ATTEMPTS - self.CAPACITY)
+        self.assertEqual(self.session.enrolled, self.CAPACITY)
+        self.assertEqual(self.session.enrollments.count(), self.CAPACITY)
+        self.assertEqual(
+            SessionWaitlistEntry.objects.filter(session=self.session, status="waiting").count(),
+            self.ATTEMPTS - self.CAPACITY,
+        )
+
+
+class SeatLoadTestCommandTest(TransactionTestCase):
+    def test_command_checks_capacity_and_cleans_up(self):
+        """The load-test command reports a clean run and removes its throwaway data"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("load_test_seats", attempts=40, workers=4, capacity=5, stdout=out)
+
+        self.assertIn("seated: 5, waitlisted: 35", out.getvalue())
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(Child.objects.exists())
+
+
+class ScheduleViewTest(TestCase):
+    def setUp(self):
+        """Set up a parent whose children are enrolled in a long-running session"""
+        from datetime import datetime, time, timedelta
+        from django.utils import timezone
+        from academies.models import SessionSlot
+
+        self.program = make_program()
+        today = timezone.localdate()
+        self.session = Session.objects.create(
+            program=self.program, title="U10",
+            start_datetime=timezone.make_aware(datetime.combine(today - timedelta(days=30), time(8, 0))),
+            end_datetime=timezone.make_aware(datetime.combine(today + timedelta(days=365), time(8, 0))),
+        )
+        # the only slot is tomorrow's weekday, so today never matches
+        weekday = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"][(today.weekday() + 1) % 7]
+        SessionSlot.objects.create(session=self.session, weekday=weekday, start_time=time(17, 0), end_time=time(18, 0))
+        self.tomorrow = today + timedelta(days=1)
+
+        self.enrollments = make_enrollments(self.program, 2)
+        self.parent = self.enrollments[0].child.parent
+        for enrollment in self.enrollments:
+            enrollment.sessions.add(self.session)
+        self.client.force_login(self.parent.user)
+
+    def test_schedule_lists_next_occurrence(self):
+        """Test that each child gets the session's next occurrence"""
+        response = self.client.get(reverse("parents:schedule"))
+
+        items = response.context["schedule_items"]
+        self.assertEqual(len(items), 2)
+        self.assertTrue(all(item["next_occurrence"].date == self.tomorrow for item in items))
+
+    def test_query_count_is_independent_of_children(self):
+        """Test that the schedule does not query per child, session or day"""
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse("parents:schedule"))
+
+        for enrollment in make_enrollments(self.program, 3, parent=self.parent):
+            enrollment.sessions.add(self.session)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(reverse("parents:schedule"))
+
+        self.assertEqual(len(response.context["schedule_items"]), 5)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
+
+class ParentDashboardQueryTest(TestCase):
+    def setUp(self):
+        """Set up a parent with enrolled children, some with player profiles"""
+        self.program = make_program()
+        self.session = Session.objects.create(program=self.program, title="U10")
+        self.parent = ParentProfile.objects.create(user=User.objects.create(username="parent"))
+        self.add_children(2)
+        self.client.force_login(self.parent.user)
+
+    def add_children(self, count):
+        other = Program.objects.create(academy=self.program.academy, title=f"Swimming {count}")
+        for enrollment in make_enrollments(self.program, count, parent=self.parent):
+            enrollment.sessions.add(self.session)
+            Enrollment.objects.create(child=enrollment.child, program=other)
+            PlayerProfile.objects.create(child=enrollment.child, academy=self.program.academy, attendance_rate=80)
+
+    def test_query_count_is_independent_of_children(self):
+        """Test that the overview runs a fixed number of queries"""
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse("parents:dashboard"))
+
+        self.add_children(4)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(reverse("parents:dashboard"))
+
+        self.assertEqual(response.context["children_count"], 6)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+        # session, user, parent profile, children, enrollments, enrollment sessions,
+        # payments total, payment due, recent activity, sessions this week
+        self.assertEqual(len(after.captured_queries), 10)
+
+    def test_recent_activity_is_limited_per_child(self):
+        """Test that recent activity keeps the latest three enrollments of each child"""
+        child = Child.objects.filter(parent=self.parent).first()
+        for i in range(3):
+            Enrollment.objects.create(
+                child=child, program=Program.objects.create(academy=self.program.academy, title=f"Extra {i}")
+            )
+
+        response = self.client.get(reverse("parents:dashboard"))
+
+        activities = response.context["recent_activities"]
+        self.assertEqual(sum(1 for a in activities if a.child_id == child.pk), 3)
+        self.assertEqual(len(activities), 5)
+        self.assertEqual(response.context["avg_attendance"], 80)
+
+
+class PlanPriceLookupTest(TestCase):
+    def setUp(self):
+        """Set up an enrolled child and academies with and without active plans"""
+        from django.core.cache import cache
+
+        cache.clear()
+        self.program = make_program()
+        self.academy = self.program.academy
+        self.plan = SubscriptionPlan.objects.create(academy=self.academy, title="Basic", price=Decimal("200.00"))
+        SubscriptionPlan.objects.create(academy=self.academy, title="Later", price=Decimal("999.00"))
+        self.enrollment = make_enrollments(self.program, 1)[0]
+        self.client.force_login(self.enrollment.child.parent.user)
+
+    def add_academies(self, count):
+        for i in range(count):
+            academy = make_program(f"Extra {i}").academy
+            if i % 2:
+                SubscriptionPlan.objects.create(academy=academy, title="Basic", price=Decimal("50.00"))
+
+    def test_active_plans_picks_first_active_plan(self):
+        """Test that each academy resolves to its first active plan, or None"""
+        other = make_program("No Plan").academy
+
+        plans = active_plans([self.academy.pk, other.pk])
+
+        self.assertEqual(plans, {self.academy.pk: self.plan, other.pk: None})
+        with self.assertNumQueries(0):
+            active_plans([self.academy.pk, other.pk])
+
+    def test_plan_save_invalidates_cache(self):
+        """Test that a saved plan is picked up on the next lookup"""
+        active_plans([self.academy.pk])
+
+        self.plan.price = Decimal("250.00")
+        self.plan.save()
+        self.assertEqual(active_plans([self.academy.pk])[self.academy.pk].price, Decimal("250.00"))
+
+        self.plan.is_active = False
+        self.plan.save()
+        self.assertEqual(active_plans([self.academy.pk])[self.academy.pk].price, Decimal("999.00"))
+
+    def test_views_query_count_is_independent_of_academies(self):
+        """Test that subscriptions and payments pages don't query per academy or enrollment"""
+        urls = [reverse("parents:subscriptions"), reverse("parents:payments")]
+        before = {}
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            before[url] = len(queries.captured_queries)
+
+        self.add_academies(4)
+        for academy in Academy.objects.exclude(pk=self.academy.pk):
+            program = Program.objects.create(academy=academy, title="Tennis")
+            Enrollment.objects.create(child=self.enrollment.child, program=program)
+
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(len(queries.captured_queries), before[url], url)
+
+        payments = response.context["payments"]
+        self.assertEqual(len(payments), 5)
+        self.assertEqual(payments[0]["amount"], Decimal("200.00"))
+
+
+class ChildReportTest(TestCase):
+    def setUp(self):
+        """Set up a parent with a player whose skills have been evaluated"""
+        from player.models import PlayerSkill
+
+        self.program = make_program()
+        self.enrollments = make_enrollments(self.program, 2)
+        self.parent = self.enrollments[0].child.parent
+        self.player = PlayerProfile.objects.create(child=self.enrollments[0].child, academy=self.program.academy)
+        self.passing = PlayerSkill.objects.create(player=self.player, name="Passing", current_level=90)
+        self.shooting = PlayerSkill.objects.create(player=self.player, name="Shooting", current_level=80)
+        self.defending = PlayerSkill.objects.create(player=self.player, name="Defending", current_level=30)
+        self.client.force_login(self.parent.user)
+
+    def evaluate(self, skill, skill_score):
+        from player.models import Evaluation
+
+        return Evaluation.objects.create(player=self.player, skill=skill, score=skill_score, skill_score=skill_score)
+
+    def test_strengths_and_improvements_come_from_skills(self):
+        """Test that strengths and improvement areas reflect skill levels and evaluations"""
+        self.evaluate(self.shooting, 40)
+
+        reports = reports_for_parent(self.parent)
+
+        data = reports[0].data
+        self.assertEqual([s["name"] for s in data["strengths"]], ["Passing"])
+        self.assertEqual([s["name"] for s in data["areas_for_improvement"]], ["Defending", "Shooting"])
+        self.assertEqual(data["evaluations_count"], 1)
+        self.assertEqual(data["academy_name"], "Seat Academy")
+        self.assertEqual(reports[1].data["strengths"], [])
+        self.assertIn("Passing", reports[0].html)
+
+    def test_evaluation_without_skill_score_is_ignored(self):
+        """Test that a score-less evaluation does not break the report or count as scored"""
+        from player.models import Evaluation
+
+        Evaluation.objects.create(player=self.player, skill=self.shooting, score=5, skill_score=None)
+
+        response = self.client.get(reverse("parents:reports"))
+        self.assertEqual(response.status_code, 200)
+        data = reports_for_parent(self.parent)[0].data
+        skills = {s["name"]: s for s in data["strengths"] + data["areas_for_improvement"]}
+        self.assertEqual(skills["Shooting"]["evaluations"], 0)
+        self.assertEqual(data["evaluations_count"], 1)
+
+    def test_fresh_reports_are_read_without_rebuilding(self):
+        """Test that the reports page is a single read once reports are rendered"""
+        reports_for_parent(self.parent)
+
+        with self.assertNumQueries(1):
+            reports = reports_for_parent(self.parent)
+        self.assertEqual(len(reports), 2)
+
+    def test_data_change_marks_report_stale(self):
+        """Test that a new evaluation is reflected on the next read"""
+        reports_for_parent(self.parent)
+
+        self.evaluate(self.defending, 95)
+
+        report = ChildReport.objects.get(child=self.player.child)
+        self.assertTrue(report.is_stale)
+        data = reports_for_parent(self.parent)[0].data
+        self.assertIn("Defending", [s["name"] for s in data["strengths"]])
+        self.assertFalse(ChildReport.objects.get(child=self.player.child).is_stale)
+
+    def test_reports_view_renders_stored_html(self):
+        """Test that the reports page shows each child's card"""
+        response = self.client.get(reverse("parents:reports"))
+
+        self.assertContains(response, "Child 0")
+        self.assertContains(response, "Child 1")
+        self.assertContains(response, "Defending")
+
+    def test_refresh_command_renders_stale_reports(self):
+        """Test that the periodic command pre-renders every report"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        call_command("refresh_child_reports", "--all-academies", "--stale-only", stdout=StringIO())
+
+        self.assertEqual(ChildReport.objects.filter(rendered_version=1).count(), 2)
+
+
+class IdempotentPaymentTest(TestCase):
+    def setUp(self):
+        """Set up an enrolled child whose academy has an active plan"""
+        self.program = make_program()
+        SubscriptionPlan.objects.create(academy=self.program.academy, title="Basic", price=Decimal("200.00"))
+        self.enrollment = make_enrollments(self.program, 1)[0]
+        self.client.force_login(self.enrollment.child.parent.user)
+        self.url = reverse("parents:process_payment")
+        self.data = {"enrollment_id": self.enrollment.pk, "payment_method": "card", "amount": "230.00"}
+
+    def pay(self, key, **overrides):
+        return self.client.post(self.url, {**self.data, **overrides}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        """Test that a retried payment returns the stored response without charging again"""
+        from communication.models import OutboxEmail
+        from player_payments.models import PaymentTransaction
+
+        first = self.pay("key-1")
+        with self.assertNumQueries(3):
+            # session, user and the key lookup
+            retry = self.pay("key-1")
+
+        self.assertTrue(first.json()["success"])
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(PaymentTransaction.objects.count(), 1)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+        self.pay("key-2")
+        self.assertEqual(PaymentTransaction.objects.count(), 2)
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        """Test that a key can't be reused with a different payload"""
+        self.pay("key-1")
+        response = self.pay("key-1", payment_method="transfer")
+        self.assertEqual(response.status_code, 422)
+
+    def test_failed_payment_releases_key(self):
+        """Test that a failed payment can be retried with the same key"""
+        from player_payments.models import IdempotencyKey
+
+        response = self.pay("key-1", amount="1.00")
+        self.assertFalse(response.json()["success"])
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_in_progress_key_is_rejected(self):
+        """Test that a request arriving while the first is still running gets a conflict"""
+        from player_payments.idempotency import request_hash
+        from player_payments.models import IdempotencyKey, PaymentTransaction
+        from django.test import RequestFactory
+
+        request = RequestFactory().post(self.url, self.data)
+        IdempotencyKey.objects.create(
+            user=self.enrollment.child.parent.user, key="key-1",
+            endpoint="parents:process_payment", request_hash=request_hash(request),
+        )
+        response = self.pay("key-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_abandoned_key_is_taken_over(self):
+        """Test that a key left in progress by a dead worker is reclaimed once its lease runs out"""
+        from player_payments.idempotency import CLAIM_LEASE, request_hash
+        from player_payments.models import IdempotencyKey, PaymentTransaction
+        from django.test import RequestFactory
+        from django.utils import timezone
+
+        request = RequestFactory().post(self.url, self.data)
+        IdempotencyKey.objects.create(
+            user=self.enrollment.child.parent.user, key="key-1",
+            endpoint="parents:process_payment", request_hash=request_hash(request),
+            claimed_at=timezone.now() - CLAIM_LEASE - timedelta(seconds=1),
+        )
+        self.assertEqual(self.pay("key-1", payment_method="transfer").status_code, 422)
+
+        response = self.pay("key-1")
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(PaymentTransaction.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status, IdempotencyKey.Status.COMPLETED)
+        self.assertEqual(self.pay("key-1")["Idempotent-Replayed"], "true")
+
+    def test_amount_checked_against_database_plan(self):
+        """Test that a stale cached plan price is not used to validate a payment"""
+        from payment.pricing import active_plans
+
+        active_plans([self.program.academy_id])
+        # QuerySet.update() skips the cache invalidation
+        SubscriptionPlan.objects.filter(academy=self.program.academy).update(price=Decimal("100.00"))
+
+        self.assertFalse(self.pay("key-1").json()["success"])
+        self.assertTrue(self.pay("key-2", amount="115.00").json()["success"])
@@ -1,18 +1,18 @@
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.conf import settings
+from communication.outbox import enqueue_email
 from datetime import datetime
 
 
 def send_payment_invoice_email(transaction, enrollment, parent_user):
     """
-    Send payment invoice email to parent after successful payment
+    Queue the payment invoice email to the parent after a successful payment
     """
     try:
   
-        total_amount = float(transaction.amount)
-        base_amount = total_amount / 1.15 
-        vat_amount = total_amount - base_amount
+        # stored when the transaction was created
+        total_amount = transaction.amount
+        base_amount = transaction.base_amount
+        vat_amount = transaction.vat_amount
         
   
         context = {
@@ -22,8 +22,8 @@ def send_payment_invoice_email(transaction, enrollment, parent_user):
             'program_title': enrollment.subscription.program.title if enrollment.subscription.program else enrollment.subscription.title,
             'sport_type': enrollment.subscription.program.sport_type.title() if enrollment.subscription.program else 'General',
             'amount': total_amount,
-            'base_amount': round(base_amount, 2),
-            'vat_amount': round(vat_amount, 2),
+            'base_amount': base_amount,
+            'vat_amount': vat_amount,
             'currency': transaction.currency,
             'payment_method': enrollment.payment_method.title(),
             'payment_date': transaction.processed_at.strftime('%B %d, %Y at %I:%M %p') if transaction.processed_at else 'N/A',
@@ -41,18 +41,8 @@ def send_payment_invoice_email(transaction, enrollment, parent_user):
        
         subject = f"Payment Invoice - {context['academy_name']} - Transaction #{context['transaction_id']}"
         
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[parent_user.email]
-        )
-        
-    
-        email.attach_alternative(html_content, "text/html")
-        
-       
-        email.send()
+        # queued here, delivered by the send_outbox_emails worker
+        enqueue_email(subject, text_content, [parent_user.email], html_body=html_content)
         
         return True
         
@@ -60,5 +50,5 @@ def send_payment_invoice_email(transaction, enrollment, parent_user):
      
         import logging
         logger = logging.getLogger(__name__)
-        logger.error(f"Error sending invoice email: {str(e)}")
+        logger.error(f"Error queueing invoice email: {str(e)}")
         return False
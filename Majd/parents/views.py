@@ -4,15 +4,23 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from datetime import date, datetime, timedelta
+from decimal import InvalidOperation
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, F, Window, Prefetch
+from django.db.models.functions import RowNumber
 from player_payments.models import PaymentTransaction, PlayerEnrollment
 from player.models import PlayerProfile
 from .models import Child, Enrollment
 from .forms import EnrollmentForm, ParentPaymentForm
+from .seats import leave_session
+from .reports import reports_for_parent
 from academies.models import Academy, Session, TrainingClass, Program
+from academies.scheduling import next_occurrence
 from accounts.models import ParentProfile
 from payment.models import SubscriptionPlan
+from payment.pricing import active_plans, current_plan, plan_price
+from player_payments.idempotency import idempotent
+from player_payments.billing import bill_from_base, money, CENT
 from django.db import transaction
 # Create your views here.
 
@@ -23,10 +31,18 @@ def parent_dashboard_view(request):
         messages.error(request, "Only parents can access this dashboard.")
         return redirect("home")
 
-    children = parent_profile.children.all()
-
-  
-    children_count = children.count()
+    # one query for the children, their player profiles and attendance
+    children = list(
+        parent_profile.children.with_age()
+        .select_related("player_profile")
+        .annotate(attendance=F("player_profile__attendance_rate"))
+        .prefetch_related(
+            Prefetch("parent_enrollments", Enrollment.objects.order_by("pk").prefetch_related("sessions"))
+        )
+        .order_by("pk")
+    )
+    child_ids = [c.pk for c in children]
+    children_count = len(children)
 
     today = timezone.localdate()
     week_start = today - timedelta(days=today.weekday())   
@@ -34,7 +50,7 @@ def parent_dashboard_view(request):
 
   
     sessions_this_week = Session.objects.filter(
-        enrollments__child__in=children,
+        enrollments__child__in=child_ids,
         start_datetime__date__gte=week_start,
         start_datetime__date__lte=week_end,
         enrollments__is_active=True
@@ -42,28 +58,23 @@ def parent_dashboard_view(request):
 
  
     avg_attendance = 0
-    if children.exists():
-        rates = [
-            c.player_profile.attendance_rate
-            for c in children
-            if hasattr(c, "player_profile")
-        ]
-        if rates:
-            avg_attendance = round(sum(rates) / len(rates), 1)
+    rates = [c.attendance for c in children if c.attendance is not None]
+    if rates:
+        avg_attendance = round(sum(rates) / len(rates), 1)
 
 
     month_start = today.replace(day=1)
     total_payments = PaymentTransaction.objects.filter(
-        enrollment__child__in=children,
+        enrollment__child__in=child_ids,
         status="completed",
         created_at__date__gte=month_start
     ).aggregate(total=Sum("amount"))["total"] or 0
 
   
     payment_due = PlayerEnrollment.objects.filter(
-        child__in=children,
+        child__in=child_ids,
         status="active"
-    ).order_by("end_date").first()  
+    ).select_related("child", "subscription").order_by("end_date").first()  
 
     due_days, due_days_abs = None, None
     if payment_due:
@@ -71,12 +82,17 @@ def parent_dashboard_view(request):
         due_days_abs = abs(due_days)
 
 
-    recent_activities = []
-    for child in children:
-
-        recent_activities += list(
-            Enrollment.objects.filter(child=child).order_by("-enrolled_at")[:3]
-        )
+    # latest 3 enrollments per child, in a single windowed query
+    recent_activities = list(
+        Enrollment.objects
+        .filter(child__in=child_ids)
+        .annotate(recent_rank=Window(
+            RowNumber(), partition_by=F("child_id"), order_by=F("enrolled_at").desc()
+        ))
+        .filter(recent_rank__lte=3)
+        .select_related("child", "program")
+        .order_by("child_id", "-enrolled_at")
+    )
 
     context = {
         "children": children,
@@ -205,42 +221,30 @@ def schedule_view(request):
         if selected_child_id:
             children = children.filter(id=selected_child_id)
 
-        for child in children:
-            for enrollment in child.parent_enrollments.filter(
-                is_active=True
-            ).prefetch_related("sessions__program__academy", "sessions__slots"):
-                for session in enrollment.sessions.all():
-                    next_occurrence = None
-                    if session.start_datetime and session.end_datetime:
-                        current_date = max(today, session.start_datetime.date())
-                        end_date = session.end_datetime.date()
-
-                        while current_date <= end_date:
-                            weekday = current_date.strftime("%a").lower()[:3]
-                            slot = session.slots.filter(weekday=weekday).first()
-                            if slot:
-                                next_occurrence = {
-                                    "date": current_date,
-                                    "start_time": slot.start_time,
-                                    "end_time": slot.end_time,
-                                }
-                                break
-                            current_date += timedelta(days=1)
-
-                    if next_occurrence:
-                        schedule_items.append({
-                            "child": child,
-                            "session": session,
-                            "academy": session.program.academy,
-                            "program": session.program,
-                            "next_occurrence": next_occurrence,
-                        })
+        enrollments = (
+            Enrollment.objects
+            .filter(child__in=children, is_active=True)
+            .select_related("child")
+            .prefetch_related("sessions__program__academy", "sessions__trainer__user", "sessions__slots")
+        )
+        for enrollment in enrollments:
+            for session in enrollment.sessions.all():
+                # computed from the prefetched slots, no per-day queries
+                occurrence = next_occurrence(session, after=today)
+                if occurrence:
+                    schedule_items.append({
+                        "child": enrollment.child,
+                        "session": session,
+                        "academy": session.program.academy,
+                        "program": session.program,
+                        "next_occurrence": occurrence,
+                    })
 
  
     schedule_items = list({(i["child"].id, i["session"].id): i for i in schedule_items}.values())
 
  
-    schedule_items.sort(key=lambda i: (i["next_occurrence"]["date"], i["next_occurrence"]["start_time"]))
+    schedule_items.sort(key=lambda i: (i["next_occurrence"].date, i["next_occurrence"].start_time))
 
     return render(
         request,
@@ -267,7 +271,8 @@ def unenroll_view(request, session_id, child_id):
         return redirect("academies:schedule_view")
 
   
-    enrollment.sessions.remove(session)
+    # frees the seat and promotes the next child on the waitlist
+    leave_session(enrollment, session)
 
  
     if enrollment.sessions.count() == 0:
@@ -305,48 +310,48 @@ def payments_view(request):
     outstanding = 0
     upcoming_payments = []
     
-    for child in parent_profile.children.all():
-        for enrollment in child.parent_enrollments.all():
-            if enrollment.is_active:
-   
-                from payment.models import SubscriptionPlan
-                subscription_plan = SubscriptionPlan.objects.filter(
-                    academy=enrollment.program.academy,
-                    is_active=True
-                ).first()
-                
-                price = subscription_plan.price if subscription_plan else 0
-                
+    enrollments = list(
+        Enrollment.objects
+        .filter(child__parent=parent_profile, is_active=True)
+        .select_related("child", "program__academy")
+        .order_by("child_id", "pk")
+    )
+    plans = active_plans(e.program.academy_id for e in enrollments)
+
+    for enrollment in enrollments:
+        child = enrollment.child
+        subscription_plan = plans[enrollment.program.academy_id]
+        price = plan_price(subscription_plan)
         
-                payment_status = "not_paid"  
-                payment_date = enrollment.enrolled_at.strftime("%Y-%m-%d")
-                
-                payments.append({
-                    "child": {"first_name": child.first_name, "last_name": child.last_name},
-                    "description": f"{enrollment.program.title} - {enrollment.program.academy.name}",
-                    "academy_name": enrollment.program.academy.name,
-                    "status": payment_status,
-                    "amount": price,
-                    "date": payment_date,
-                    "enrollment": enrollment,
-                    "subscription_plan": subscription_plan,
-                })
-                
-                if payment_status == "paid":
-                    total_paid += price
-                else:
-                    outstanding += price
-                
-          
-                from datetime import date, timedelta
-                next_month = date.today() + timedelta(days=30)
-                upcoming_payments.append({
-                    "amount": price,
-                    "date": next_month,
-                    "child": child.first_name,
-                    "academy": enrollment.program.academy.name,
-                    "program": enrollment.program.title,
-                })
+
+        payment_status = "not_paid"  
+        payment_date = enrollment.enrolled_at.strftime("%Y-%m-%d")
+        
+        payments.append({
+            "child": {"first_name": child.first_name, "last_name": child.last_name},
+            "description": f"{enrollment.program.title} - {enrollment.program.academy.name}",
+            "academy_name": enrollment.program.academy.name,
+            "status": payment_status,
+            "amount": price,
+            "date": payment_date,
+            "enrollment": enrollment,
+            "subscription_plan": subscription_plan,
+        })
+        
+        if payment_status == "paid":
+            total_paid += price
+        else:
+            outstanding += price
+        
+  
+        next_month = date.today() + timedelta(days=30)
+        upcoming_payments.append({
+            "amount": price,
+            "date": next_month,
+            "child": child.first_name,
+            "academy": enrollment.program.academy.name,
+            "program": enrollment.program.title,
+        })
     
   
     next_payment_amount = sum(p["amount"] for p in upcoming_payments)
@@ -383,26 +388,8 @@ def reports_view(request):
         return render(request, "reports/reports.html", {"reports": []})
 
 
-    children = Child.objects.filter(parent=parent)
-
-    reports = []
-    for child in children:
-     
-        player_profile = getattr(child, "player_profile", None)
-
-        reports.append({
-            "child": child,
-            "academy_name": (
-                player_profile.academy.name if player_profile and player_profile.academy else "Not Assigned"
-            ),
-            "grade": player_profile.current_grade if player_profile else None,
-            "overall_progress": player_profile.avg_progress if player_profile else 0,
-            "attendance_rate": player_profile.attendance_rate if player_profile else 0,
-
-            "strengths": ["Speed", "Team Work", "Leadership"] if child.first_name == "Alex" else ["Freestyle", "Butterfly"],
-            "areas_for_improvement": ["Ball Control", "Defensive Positioning"] if child.first_name == "Alex" else ["Endurance"],
-            "last_report": date.today(),
-        })
+    # stored, pre-rendered reports; only stale ones are rebuilt (in one batch)
+    reports = reports_for_parent(parent)
 
     return render(request, "main/reports.html", {"reports": reports})
 
@@ -411,16 +398,30 @@ def reports_view(request):
 @login_required
 def subscriptions_view(request):
   
+    academy_list = list(Academy.objects.prefetch_related("programs"))
+    parent_profile = getattr(request.user, "parent_profile", None)
+
+    active_enrollments = []
+    if parent_profile:
+        active_enrollments = list(
+            Enrollment.objects
+            .filter(child__parent=parent_profile, is_active=True)
+            .select_related("child", "program__academy")
+            .order_by("child_id", "pk")
+        )
+
+    # every price on the page comes from one cached lookup
+    plans = active_plans(
+        [academy.pk for academy in academy_list] + [e.program.academy_id for e in active_enrollments]
+    )
+
     academies = []
-    for academy in Academy.objects.all():
-        subscription_plan = SubscriptionPlan.objects.filter(
-            academy=academy,
-            is_active=True
-        ).first()
+    for academy in academy_list:
+        subscription_plan = plans[academy.pk]
         
         academies.append({
             "academy": academy,
-            "price": subscription_plan.price if subscription_plan else 0,
+            "price": plan_price(subscription_plan),
 
             "plan_type": (
                 subscription_plan.plan_type.name
@@ -432,38 +433,28 @@ def subscriptions_view(request):
     
     programs = Program.objects.filter(academy__isnull=False)
     
-
-    parent_profile = getattr(request.user, "parent_profile", None)
-    
   
     enrollment_form = EnrollmentForm(parent=parent_profile) if parent_profile else None
     
   
     enrollments = []
-    if parent_profile:
-        for child in parent_profile.children.all():
-            for enrollment in child.parent_enrollments.all():
-                if enrollment.is_active:
-                    subscription_plan = SubscriptionPlan.objects.filter(
-                        academy=enrollment.program.academy,
-                        is_active=True
-                    ).first()
-                    
-                    price = subscription_plan.price if subscription_plan else 0
-                    
-                    enrollments.append({
-                        "id": enrollment.id,
-                        "academy": enrollment.program.academy,
-                        "program": enrollment.program.title,
-                        "location": getattr(enrollment.program.academy, "city", "-"),
-                        "children": f"{child.first_name} {child.last_name}".strip(),
-                        "features": [enrollment.program.sport_type.title()],
-                        "status": "Active" if enrollment.is_active else "Inactive",
-                        "price": price,
-                        "next_payment": date.today(),
-                        "enrollment": enrollment,
-                        "child": child,
-                    })
+    for enrollment in active_enrollments:
+        child = enrollment.child
+        price = plan_price(plans[enrollment.program.academy_id])
+        
+        enrollments.append({
+            "id": enrollment.id,
+            "academy": enrollment.program.academy,
+            "program": enrollment.program.title,
+            "location": getattr(enrollment.program.academy, "city", "-"),
+            "children": f"{child.first_name} {child.last_name}".strip(),
+            "features": [enrollment.program.sport_type.title()],
+            "status": "Active" if enrollment.is_active else "Inactive",
+            "price": price,
+            "next_payment": date.today(),
+            "enrollment": enrollment,
+            "child": child,
+        })
     
 
     total_subscriptions = len(enrollments)
@@ -527,6 +518,7 @@ def enroll_child(request):
 
 @login_required
 @require_POST
+@idempotent("parents:process_payment")
 def process_payment(request):
     """Process payment for an enrollment"""
     if request.method == "POST":
@@ -546,86 +538,91 @@ def process_payment(request):
                 return JsonResponse({"success": False, "error": "Unauthorized"})
             
          
-            from payment.models import SubscriptionPlan
-            subscription_plan = SubscriptionPlan.objects.filter(
-                academy=enrollment.program.academy,
-                is_active=True
-            ).first()
+            # the amount is validated against the plan, so never take it from the cache
+            subscription_plan = current_plan(enrollment.program.academy_id)
             
             if not subscription_plan:
                 return JsonResponse({"success": False, "error": "No subscription plan found for this academy"})
             
           
-            base_price = float(subscription_plan.price)
-            vat_amount = round(base_price * 0.15, 2)  
-            expected_total = round(base_price + vat_amount, 2)  
+            bill = bill_from_base(subscription_plan.price)
+            try:
+                received = money(amount)
+            except InvalidOperation:
+                return JsonResponse({"success": False, "error": "Invalid payment amount"})
             
            
             import logging
             logger = logging.getLogger(__name__)
-            logger.info(f"Payment calculation - Base: {base_price}, VAT: {vat_amount}, Expected Total: {expected_total}, Received: {amount}")
+            logger.info(f"Payment calculation - Base: {bill.base}, VAT: {bill.vat}, Expected Total: {bill.total}, Received: {received}")
             
       
-            if abs(float(amount) - expected_total) > 0.01: 
-                return JsonResponse({"success": False, "error": f"Payment amount does not match expected total. Expected: SAR {expected_total:.2f}, Received: SAR {amount}"})
+            if abs(received - bill.total) > CENT: 
+                return JsonResponse({"success": False, "error": f"Payment amount does not match expected total. Expected: SAR {bill.total}, Received: SAR {amount}"})
+            amount = bill.total
             
           
-            from player_payments.models import PaymentTransaction, PlayerEnrollment
-            
- 
             from player_payments.models import PlayerSubscription
-            player_subscription, created = PlayerSubscription.objects.get_or_create(
-                academy=enrollment.program.academy,
-                defaults={
-                    'title': f"{enrollment.program.academy.name} Subscription",
-                    'price': subscription_plan.price,
-                    'billing_type': '3m',  
-                    'description': f"Subscription for {enrollment.program.academy.name}",
-                }
-            )
-            
-         
-            logger.info(f"PlayerSubscription {'created' if created else 'found'}: {player_subscription.id} for academy {enrollment.program.academy.name}")
-            
-          
-            player_enrollment, created = PlayerEnrollment.objects.get_or_create(
-                subscription=player_subscription,
-                child=enrollment.child,
-                parent=request.user,
-                start_date=date.today(),
-                defaults={
-                    'status': 'active',
-                    'payment_method': payment_method,
-                    'end_date': date.today() + timedelta(days=30),
-                    'amount_paid': amount,  
-                    'payment_date': timezone.now(),
-                }
-            )
             
+            with transaction.atomic():
+                # lock the enrollment so concurrent submissions for it run one at a time
+                enrollment = Enrollment.objects.select_for_update().select_related(
+                    'child', 'program__academy'
+                ).get(pk=enrollment.pk)
+                
+                player_subscription, created = PlayerSubscription.objects.get_or_create(
+                    academy=enrollment.program.academy,
+                    defaults={
+                        'title': f"{enrollment.program.academy.name} Subscription",
+                        'price': subscription_plan.price,
+                        'billing_type': '3m',  
+                        'description': f"Subscription for {enrollment.program.academy.name}",
+                    }
+                )
+                
+             
+                logger.info(f"PlayerSubscription {'created' if created else 'found'}: {player_subscription.id} for academy {enrollment.program.academy.name}")
+                
+              
+                player_enrollment, created = PlayerEnrollment.objects.get_or_create(
+                    subscription=player_subscription,
+                    child=enrollment.child,
+                    parent=request.user,
+                    start_date=date.today(),
+                    defaults={
+                        'status': 'active',
+                        'payment_method': payment_method,
+                        'end_date': date.today() + timedelta(days=30),
+                        'amount_paid': amount,  
+                        'payment_date': timezone.now(),
+                    }
+                )
+                
+                
+                logger.info(f"PlayerEnrollment {'created' if created else 'found'}: {player_enrollment.id} for child {enrollment.child.first_name}")
+                
             
-            logger.info(f"PlayerEnrollment {'created' if created else 'found'}: {player_enrollment.id} for child {enrollment.child.first_name}")
-            
-        
-            transaction = PaymentTransaction.objects.create(
-                enrollment=player_enrollment,
-                transaction_type='initial',
-                status='completed',
-                amount=amount,
-                currency='SAR',
-                processed_at=timezone.now(),
-                notes=f'Payment for {enrollment.program.title} at {enrollment.program.academy.name}'
-            )
-            
-         
-            enrollment.is_active = True 
-            
-  
-            from .utils import send_payment_invoice_email
-            email_sent = send_payment_invoice_email(transaction, player_enrollment, request.user)
+                payment = PaymentTransaction.objects.create(
+                    enrollment=player_enrollment,
+                    program=enrollment.program,
+                    transaction_type='initial',
+                    status='completed',
+                    amount=bill.total,
+                    base_amount=bill.base,
+                    vat_amount=bill.vat,
+                    currency='SAR',
+                    processed_at=timezone.now(),
+                    notes=f'Payment for {enrollment.program.title} at {enrollment.program.academy.name}'
+                )
+                
+             
+                enrollment.is_active = True 
+                
+      
+                from .utils import send_payment_invoice_email
+                email_sent = send_payment_invoice_email(payment, player_enrollment, request.user)
             
        
-            import logging
-            logger = logging.getLogger(__name__)
             logger.info(f"Payment processed for {enrollment.child.first_name}. Email sent: {email_sent}. Parent email: {request.user.email}")
             
             success_message = f"Payment of SAR {amount} processed successfully for {enrollment.child.first_name}"
@@ -635,7 +632,7 @@ def process_payment(request):
                 success_message += ". Note: Invoice email could not be sent."
             
             messages.success(request, success_message)
-            return JsonResponse({"success": True, "transaction_id": transaction.id, "email_sent": email_sent})
+            return JsonResponse({"success": True, "transaction_id": payment.id, "email_sent": email_sent})
             
         except Exception as e:
     
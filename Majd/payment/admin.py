@@ -1,8 +1,10 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.urls import reverse
 from django.utils import timezone
-from .models import PlanType, SubscriptionPlan, Subscription
+from django.db import transaction
+from .invoices import queue_invoices
+from .models import PlanType, SubscriptionPlan, Subscription, SubscriptionEvent
 
 
 @admin.register(PlanType)
@@ -47,11 +49,13 @@ class SubscriptionAdmin(admin.ModelAdmin):
     search_fields = [
         'academy_name', 'plan_type__name', 'contact_email', 'transaction_id'
     ]
-    readonly_fields = ['created_at', 'updated_at', 'notes']
+    readonly_fields = ['created_at', 'updated_at', 'notes', 'event_history']
+    list_select_related = ['plan_type']
+    raw_id_fields = ['academy']
     
     fieldsets = (
         ('Academy Information', {
-            'fields': ('academy_name', 'plan_type', 'contact_email', 'contact_phone', 'billing_address')
+            'fields': ('academy', 'academy_name', 'plan_type', 'contact_email', 'contact_phone', 'billing_address')
         }),
         ('Subscription Details', {
             'fields': ('price', 'duration_days', 'start_date', 'end_date')
@@ -59,46 +63,89 @@ class SubscriptionAdmin(admin.ModelAdmin):
         ('Payment Information', {
             'fields': ('payment_method', 'transaction_id', 'status', 'payment_date')
         }),
+        ('History', {
+            'fields': ('event_history',)
+        }),
         ('Additional Information', {
             'fields': ('notes', 'error_message', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
     
+    history_preview = 10
+    
+    def event_history(self, obj):
+        """Latest events, with a link to the full paginated history"""
+        if obj.pk is None:
+            return "-"
+        events = list(obj.events.all()[:self.history_preview])
+        if not events:
+            return "No events yet"
+        rows = format_html_join(
+            '', '<li>{} · {} · {}</li>',
+            ((timezone.localtime(e.created_at).strftime('%Y-%m-%d %H:%M'), e.get_kind_display(), e.message) for e in events),
+        )
+        url = reverse('admin:payment_subscriptionevent_changelist') + f'?subscription__id__exact={obj.pk}'
+        return format_html('<ul>{}</ul><a href="{}">View full history</a>', rows, url)
+    event_history.short_description = "Event history"
+    
     actions = ['send_invoice_email', 'mark_as_successful', 'mark_as_failed']
     
     def send_invoice_email(self, request, queryset):
-        """Admin action to send invoice emails"""
-        sent_count = 0
-        for subscription in queryset:
-            try:
-                subscription.send_invoice()
-                sent_count += 1
-            except Exception as e:
-                self.message_user(
-                    request, 
-                    f"Failed to send invoice for {subscription}: {str(e)}", 
-                    level='ERROR'
-                )
+        """Admin action to queue invoice emails in one batch"""
+        results = queue_invoices(queryset.select_related('plan_type'))
+        
+        failed = [(subscription, error) for subscription, error in results if error]
+        for subscription, error in failed:
+            self.message_user(
+                request, 
+                f"Failed to send invoice for {subscription}: {error}", 
+                level='ERROR'
+            )
         
+        sent_count = len(results) - len(failed)
         if sent_count > 0:
             self.message_user(
                 request, 
-                f"Successfully sent {sent_count} invoice email(s)"
+                f"Queued {sent_count} invoice email(s) for delivery"
             )
     send_invoice_email.short_description = "Send invoice emails"
     
     def mark_as_successful(self, request, queryset):
         """Admin action to mark subscriptions as successful"""
-        updated = queryset.update(
-            status=Subscription.Status.SUCCESSFUL,
-            payment_date=timezone.now()
-        )
+        updated = self._set_status(queryset, Subscription.Status.SUCCESSFUL, payment_date=timezone.now())
         self.message_user(request, f"Marked {updated} subscription(s) as successful")
     mark_as_successful.short_description = "Mark as successful"
     
     def mark_as_failed(self, request, queryset):
         """Admin action to mark subscriptions as failed"""
-        updated = queryset.update(status=Subscription.Status.FAILED)
+        updated = self._set_status(queryset, Subscription.Status.FAILED)
         self.message_user(request, f"Marked {updated} subscription(s) as failed")
     mark_as_failed.short_description = "Mark as failed"
+    
+    def _set_status(self, queryset, status, **fields):
+        """
+        Save each changed subscription so status notifications go out; the
+        change is detected from the loaded values, so this costs one read for
+        the whole queryset and only writes per subscription.
+        """
+        updated = 0
+        with transaction.atomic():
+            for subscription in queryset.exclude(status=status):
+                subscription.status = status
+                for name, value in fields.items():
+                    setattr(subscription, name, value)
+                subscription.save(update_fields=['status', 'updated_at', *fields])
+                updated += 1
+        return updated
+
+
+@admin.register(SubscriptionEvent)
+class SubscriptionEventAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'subscription', 'kind', 'success', 'message')
+    list_filter = ('kind', 'success', 'subscription')
+    search_fields = ('message', 'subscription__academy_name')
+    list_select_related = ('subscription__plan_type',)
+    readonly_fields = ('subscription', 'kind', 'message', 'success', 'created_at')
+    list_per_page = 50
+    date_hierarchy = 'created_at'
@@ -0,0 +1,68 @@
+# payment/invoices.py
+"""
+Invoice emails for platform subscriptions.
+
+queue_invoices() handles many subscriptions at once: each template is loaded
+once, every invoice is rendered from it, and the emails and their events are
+written with bulk inserts. The send_outbox_emails worker then delivers them in
+batches over a single SMTP connection.
+"""
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from communication.outbox import outbox_email, enqueue_emails
+
+
+INVOICE_HTML_TEMPLATE = 'payment/emails/invoice.html'
+INVOICE_TEXT_TEMPLATE = 'payment/emails/invoice.txt'
+
+
+def invoice_templates():
+    return get_template(INVOICE_HTML_TEMPLATE), get_template(INVOICE_TEXT_TEMPLATE)
+
+
+def render_invoice(subscription, templates=None):
+    """Return the unsaved outbox email carrying a subscription's invoice."""
+    html_template, text_template = templates or invoice_templates()
+    plan_name = subscription.plan_type.name if subscription.plan_type else "Basic Plan"
+    context = {
+        'subscription': subscription,
+        'academy': {'name': subscription.academy_name},  # Create dict-like object for template
+        'plan_type': subscription.plan_type,
+        'invoice_date': timezone.now().date(),
+    }
+    return outbox_email(
+        f"Invoice for {plan_name} - {subscription.academy_name}",
+        text_template.render(context),
+        [subscription.contact_email],
+        html_body=html_template.render(context),
+    )
+
+
+def queue_invoices(subscriptions):
+    """
+    Queue invoice emails for many subscriptions. Returns a list of
+    (subscription, error) pairs; error is None for queued invoices.
+    """
+    from .models import SubscriptionEvent
+
+    templates = invoice_templates()
+    emails, events, results = [], [], []
+    for subscription in subscriptions:
+        try:
+            emails.append(render_invoice(subscription, templates))
+        except Exception as e:
+            message, error = f"Failed to queue invoice email: {str(e)}", str(e)
+        else:
+            message, error = f"Invoice email queued for {subscription.contact_email}", None
+        events.append(SubscriptionEvent(
+            subscription=subscription, kind=SubscriptionEvent.Kind.INVOICE,
+            message=message[:500], success=error is None,
+        ))
+        results.append((subscription, error))
+
+    with transaction.atomic():
+        enqueue_emails(emails)
+        SubscriptionEvent.objects.bulk_create(events, batch_size=500)
+    return results
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0008_plantype_yearly_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('status', 'Status change'), ('notification', 'Status notification'), ('invoice', 'Invoice')], max_length=20)),
+                ('message', models.CharField(max_length=500)),
+                ('success', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='payment.subscription')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['subscription', 'created_at'], name='subscription_event_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_academy(apps, schema_editor):
+    """Link existing subscriptions to the academy whose name they were checked out with."""
+    Academy = apps.get_model('academies', 'Academy')
+    Subscription = apps.get_model('payment', 'Subscription')
+
+    names = Subscription.objects.filter(academy__isnull=True).values_list('academy_name', flat=True).distinct()
+    academies = {
+        name.strip().lower(): pk
+        for pk, name in Academy.objects.values_list('pk', 'name')
+    }
+    for name in names:
+        academy_id = academies.get(name.strip().lower())
+        if academy_id is not None:
+            Subscription.objects.filter(academy__isnull=True, academy_name=name).update(academy_id=academy_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academies', '0016_exportjob'),
+        ('payment', '0009_subscriptionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='academy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='platform_subscriptions', to='academies.academy'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['academy', '-created_at'], name='subscription_academy_idx'),
+        ),
+        migrations.RunPython(backfill_academy, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
-from django.core.mail import send_mail
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from communication.outbox import outbox_email
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
+from .tracking import TrackedFieldsMixin
 
 
 class PlanType(models.Model):
@@ -61,20 +64,30 @@ class SubscriptionPlan(models.Model):
         unique_together = ("academy", "title")
 
 
-class Subscription(models.Model):
+class Subscription(TrackedFieldsMixin, models.Model):
     """Track individual subscription attempts and their status"""
     
+    tracked_fields = ('status',)
+    
     class Status(models.TextChoices):
         PENDING = "pending", "Pending"
         SUCCESSFUL = "successful", "Successful"
         FAILED = "failed", "Failed"
         CANCELLED = "cancelled", "Cancelled"
+        EXPIRED = "expired", "Expired"
     
     class PaymentMethod(models.TextChoices):
         CARD = "card", "Credit/Debit Card"
         TRANSFER = "transfer", "Bank Transfer"
     
     # Academy and plan information
+    academy = models.ForeignKey(
+        "academies.Academy",
+        on_delete=models.SET_NULL,
+        related_name="platform_subscriptions",
+        null=True,
+        blank=True,
+    )
     academy_name = models.CharField(max_length=200)  # Academy name from checkout form
     plan_type = models.ForeignKey(
         PlanType,
@@ -120,110 +133,115 @@ class Subscription(models.Model):
         return f"{self.academy_name} - {plan_name} ({self.status})"
     
     def save(self, *args, **kwargs):
-        """Override save to send notifications on status changes"""
-        is_new = self.pk is None
-        old_status = None
-        
-        if not is_new:
-            try:
-                old_instance = Subscription.objects.get(pk=self.pk)
-                old_status = old_instance.status
-            except Subscription.DoesNotExist:
-                pass
+        """Log status changes and send a notification, after commit, for them"""
+        update_fields = kwargs.get('update_fields')
+        status_changed = self.has_changed('status') and (update_fields is None or 'status' in update_fields)
+        old_status = self.previous_value('status')
         
         super().save(*args, **kwargs)
         
-        # Send notifications for status changes
-        if not is_new and old_status != self.status:
-            self.send_status_notification()
+        if status_changed:
+            self.log_event(SubscriptionEvent.Kind.STATUS, f"Status changed from {old_status} to {self.status}")
+            transaction.on_commit(self.send_status_notification)
+    
+    def log_event(self, kind, message, success=True):
+        """Record an entry in the subscription's event history"""
+        return SubscriptionEvent.objects.create(subscription=self, kind=kind, message=message[:500], success=success)
+    
+    def status_notification_email(self):
+        """Build the unsaved outbox email announcing the current status"""
+        subject = f"Subscription {self.get_status_display()} - {self.academy_name}"
+        
+        # Render email template
+        context = {
+            'subscription': self,
+            'academy': {'name': self.academy_name},  # Create dict-like object for template
+            'plan_type': self.plan_type,
+            'status_display': self.get_status_display(),
+            'payment_method_display': self.get_payment_method_display(),
+        }
+        
+        html_message = render_to_string(
+            'payment/emails/subscription_status.html',
+            context
+        )
+        
+        plain_message = render_to_string(
+            'payment/emails/subscription_status.txt',
+            context
+        )
+        
+        return outbox_email(subject, plain_message, [self.contact_email], html_body=html_message)
     
     def send_status_notification(self):
         """Send email notification about subscription status"""
         try:
-            subject = f"Subscription {self.get_status_display()} - {self.academy_name}"
-            
-            # Render email template
-            context = {
-                'subscription': self,
-                'academy': {'name': self.academy_name},  # Create dict-like object for template
-                'plan_type': self.plan_type,
-                'status_display': self.get_status_display(),
-                'payment_method_display': self.get_payment_method_display(),
-            }
-            
-            html_message = render_to_string(
-                'payment/emails/subscription_status.html',
-                context
-            )
-            
-            plain_message = render_to_string(
-                'payment/emails/subscription_status.txt',
-                context
-            )
-            
-            # Send email to academy contact email
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.contact_email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            # Queue email to academy contact email (delivered by send_outbox_emails)
+            self.status_notification_email().save()
             
             # Log successful email
-            self.notes += f"\n[{timezone.now()}] Status notification email sent to {self.contact_email}"
-            self.save(update_fields=['notes'])
+            self.log_event(SubscriptionEvent.Kind.NOTIFICATION, f"Status notification email queued for {self.contact_email}")
             
         except Exception as e:
             # Log email failure
-            self.notes += f"\n[{timezone.now()}] Failed to send notification email: {str(e)}"
-            self.save(update_fields=['notes'])
+            self.log_event(SubscriptionEvent.Kind.NOTIFICATION, f"Failed to queue notification email: {str(e)}", success=False)
     
     def send_invoice(self):
         """Send invoice email to academy"""
-        try:
-            plan_name = self.plan_type.name if self.plan_type else "Basic Plan"
-            subject = f"Invoice for {plan_name} - {self.academy_name}"
-            
-            # Render invoice template
-            context = {
-                'subscription': self,
-                'academy': {'name': self.academy_name},  # Create dict-like object for template
-                'plan_type': self.plan_type,
-                'invoice_date': timezone.now().date(),
-            }
-            
-            html_message = render_to_string(
-                'payment/emails/invoice.html',
-                context
-            )
-            
-            plain_message = render_to_string(
-                'payment/emails/invoice.txt',
-                context
-            )
-            
-            # Send email to academy contact email
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.contact_email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            
-            # Log successful invoice email
-            self.notes += f"\n[{timezone.now()}] Invoice email sent to {self.contact_email}"
-            self.save(update_fields=['notes'])
-            
-        except Exception as e:
-            # Log email failure
-            self.notes += f"\n[{timezone.now()}] Failed to send invoice email: {str(e)}"
-            self.save(update_fields=['notes'])
+        from .invoices import queue_invoices
+        
+        queue_invoices([self])
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['academy', '-created_at'], name='subscription_academy_idx'),
+            models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ]
         verbose_name = "Subscription"
         verbose_name_plural = "Subscriptions"
+
+
+class SubscriptionEvent(models.Model):
+    """Append-only history of a subscription: status changes and emails"""
+    
+    class Kind(models.TextChoices):
+        STATUS = "status", "Status change"
+        NOTIFICATION = "notification", "Status notification"
+        INVOICE = "invoice", "Invoice"
+    
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    message = models.CharField(max_length=500)
+    success = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.subscription_id} {self.get_kind_display()}: {self.message}"
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['subscription', 'created_at'], name='subscription_event_idx'),
+        ]
+
+
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def forget_cached_plan(sender, instance, **kwargs):
+    from .pricing import forget_plans
+
+    forget_plans([instance.academy_id])
+
+
+@receiver(post_save, sender=PlanType)
+def forget_cached_plans_of_type(sender, instance, **kwargs):
+    from .pricing import forget_plans
+
+    forget_plans(instance.subscription_plans.values_list("academy_id", flat=True))
+
+
+@receiver(post_save, sender="academies.Academy")
+def link_platform_subscriptions(sender, instance, created, **kwargs):
+    """Checkout can happen before the academy exists; link those subscriptions by name once it does."""
+    if created:
+        Subscription.objects.filter(academy__isnull=True, academy_name=instance.name).update(academy=instance)
@@ -0,0 +1,81 @@
+# payment/pricing.py
+"""
+Academy -> active SubscriptionPlan resolution.
+
+Pages that show prices for many academies resolve them through active_plans(),
+which reads a per-academy cache entry and loads every miss in a single query.
+Entries are dropped whenever a plan (or its plan type) is saved or deleted.
+
+That invalidation reaches other workers only with a shared cache (REDIS_URL);
+with the per-process default they can show the old price until the entry
+expires, and QuerySet.update() skips it altogether. So the cache is for
+display only: anything that charges or validates an amount must read the plan
+from the database with current_plan().
+"""
+from django.core.cache import cache
+
+
+# bounds how long a missed invalidation can show an old price
+PLAN_CACHE_TIMEOUT = 5 * 60
+NO_PLAN = "none"
+
+
+def plan_cache_key(academy_id):
+    return f"payment:active-plan:{academy_id}"
+
+
+def active_plans(academy_ids):
+    """
+    Return {academy_id: SubscriptionPlan or None} with each academy's first
+    (lowest pk) active plan, plan_type loaded.
+    """
+    from .models import SubscriptionPlan
+
+    academy_ids = set(academy_ids)
+    if not academy_ids:
+        return {}
+
+    keys = {plan_cache_key(pk): pk for pk in academy_ids}
+    cached = cache.get_many(keys)
+    plans = {keys[key]: (None if value == NO_PLAN else value) for key, value in cached.items()}
+
+    missing = academy_ids - plans.keys()
+    if missing:
+        loaded = dict.fromkeys(missing)
+        rows = (
+            SubscriptionPlan.objects
+            .filter(academy_id__in=missing, is_active=True)
+            .select_related("plan_type")
+            .order_by("-pk")
+        )
+        for plan in rows:
+            # descending pk, so the lowest pk wins
+            loaded[plan.academy_id] = plan
+        cache.set_many(
+            {plan_cache_key(pk): (plan if plan is not None else NO_PLAN) for pk, plan in loaded.items()},
+            PLAN_CACHE_TIMEOUT,
+        )
+        plans.update(loaded)
+
+    return plans
+
+
+def current_plan(academy_id):
+    """The academy's first active plan read from the database, bypassing the cache."""
+    from .models import SubscriptionPlan
+
+    return (
+        SubscriptionPlan.objects
+        .filter(academy_id=academy_id, is_active=True)
+        .select_related("plan_type")
+        .order_by("pk")
+        .first()
+    )
+
+
+def plan_price(plan):
+    return plan.price if plan else 0
+
+
+def forget_plans(academy_ids):
+    cache.delete_many([plan_cache_key(pk) for pk in set(academy_ids)])
@@ -2,9 +2,18 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core import mail
+from accounts.models import AcademyAdminProfile
+from academies.models import Academy
+from communication.outbox import deliver_all
 from .models import PlanType, Subscription
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
+
+
+def make_academy(name="Test Academy"):
+    user = User.objects.create(username=f"admin-{name}")
+    owner = AcademyAdminProfile.objects.create(user=user)
+    return Academy.objects.create(name=name, description="Test", city="Riyadh", owner=owner)
 
 
 class SubscriptionNotificationTest(TestCase):
@@ -44,7 +53,12 @@ class SubscriptionNotificationTest(TestCase):
         
         # Change status to trigger notification
         self.subscription.status = Subscription.Status.SUCCESSFUL
-        self.subscription.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.save()
+        
+        # Email is only queued until the outbox worker runs
+        self.assertEqual(len(mail.outbox), 0)
+        deliver_all()
         
         # Check that email was sent
         self.assertEqual(len(mail.outbox), 1)
@@ -58,12 +72,96 @@ class SubscriptionNotificationTest(TestCase):
         
         # Send invoice
         self.subscription.send_invoice()
+        deliver_all()
         
         # Check that email was sent
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to[0], 'test@academy.com')
         self.assertIn('Invoice for', mail.outbox[0].subject)
 
+    def test_status_change_is_tracked_without_extra_read(self):
+        """Test that saving a status change needs no read and notifies only after commit"""
+        from communication.models import OutboxEmail
+
+        subscription = Subscription.objects.get(pk=self.subscription.pk)
+        subscription.status = Subscription.Status.FAILED
+        with self.captureOnCommitCallbacks() as callbacks:
+            # the UPDATE and the status event insert, no SELECT
+            with self.assertNumQueries(2):
+                subscription.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+        # saving again without a change does not notify twice
+        with self.captureOnCommitCallbacks() as callbacks:
+            subscription.save()
+        self.assertEqual(callbacks, [])
+
+    def test_bulk_status_action_scales_linearly(self):
+        """Test that the admin action reads once and only writes per subscription"""
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        from communication.models import OutboxEmail
+
+        for i in range(2):
+            Subscription.objects.create(
+                academy_name=f'Academy {i}', plan_type=self.plan_type, price=100.00, duration_days=30,
+                start_date=timezone.now().date(), end_date=timezone.now().date(),
+                contact_email=f'{i}@academy.com', billing_address='Street',
+            )
+        model_admin = site._registry[Subscription]
+        model_admin.message_user = lambda *args, **kwargs: None
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # one SELECT, then SAVEPOINT, an UPDATE and an event insert per row, and RELEASE
+            with self.assertNumQueries(9):
+                model_admin.mark_as_successful(RequestFactory().get('/'), Subscription.objects.all())
+
+        self.assertEqual(Subscription.objects.filter(status=Subscription.Status.SUCCESSFUL).count(), 3)
+        self.assertEqual(OutboxEmail.objects.count(), 3)
+
+    def test_events_are_logged_as_rows(self):
+        """Test that status changes and emails are recorded as events, not appended to notes"""
+        from .models import SubscriptionEvent
+
+        self.subscription.status = Subscription.Status.SUCCESSFUL
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.save()
+        with self.assertNumQueries(4):
+            # outbox insert and event insert in a savepoint
+            self.subscription.send_invoice()
+
+        kinds = list(self.subscription.events.order_by('id').values_list('kind', flat=True))
+        self.assertEqual(kinds, [
+            SubscriptionEvent.Kind.STATUS, SubscriptionEvent.Kind.NOTIFICATION, SubscriptionEvent.Kind.INVOICE,
+        ])
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.notes, '')
+
+    def test_bulk_invoices_are_batched(self):
+        """Test that invoicing many subscriptions costs a fixed number of queries and one connection"""
+        from unittest import mock
+        from .invoices import queue_invoices
+
+        for i in range(20):
+            Subscription.objects.create(
+                academy_name=f'Academy {i}', plan_type=self.plan_type, price=100.00, duration_days=30,
+                start_date=timezone.now().date(), end_date=timezone.now().date(),
+                contact_email=f'{i}@academy.com', billing_address='Street',
+            )
+        subscriptions = Subscription.objects.select_related('plan_type')
+
+        with self.assertNumQueries(5):
+            # subscriptions, then both bulk inserts in a savepoint
+            results = queue_invoices(subscriptions)
+        self.assertEqual(len(results), 21)
+        self.assertTrue(all(error is None for _, error in results))
+
+        with mock.patch("communication.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            deliver_all(batch_size=100)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 21)
+
     def test_subscription_str_representation(self):
         """Test subscription string representation"""
         expected = f"Test Academy - Test Plan (pending)"
@@ -185,3 +283,48 @@ class EmailTemplateTest(TestCase):
         self.assertIn('INVOICE', text_content)
         self.assertIn('Premium Academy', text_content)
         self.assertIn('Premium Plan', text_content)
+
+
+class SubscriptionDashboardTest(TestCase):
+    def setUp(self):
+        """Set up an academy with platform subscriptions"""
+        self.academy = make_academy()
+        self.plan_type = PlanType.objects.create(name="Pro", monthly_price=100)
+        self.client.force_login(self.academy.owner.user)
+
+    def subscribe(self, academy_name, **kwargs):
+        return Subscription.objects.create(
+            academy_name=academy_name, plan_type=self.plan_type, price=100, duration_days=30,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 31),
+            contact_email="owner@academy.com", billing_address="Street", **kwargs,
+        )
+
+    def test_history_follows_academy_renames(self):
+        """Test that subscriptions are found through the academy FK, not the checkout name"""
+        self.subscribe("Test Academy", academy=self.academy)
+        self.subscribe("Test Academy")  # another academy's checkout with the same typed name
+
+        self.academy.name = "Renamed Academy"
+        self.academy.save()
+        response = self.client.get(reverse("academies:subscription_dashboard"))
+
+        self.assertEqual(len(response.context["subscriptions"]), 1)
+
+    def test_checkout_before_setup_is_linked(self):
+        """Test that a subscription bought before the academy existed is linked when it is created"""
+        subscription = self.subscribe("New Academy")
+        academy = make_academy("New Academy")
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.academy, academy)
+
+    def test_history_is_paginated(self):
+        """Test that the subscription history is shown a page at a time"""
+        for _ in range(7):
+            self.subscribe("Test Academy", academy=self.academy)
+
+        response = self.client.get(reverse("academies:subscription_dashboard"), {"history_page": 2})
+
+        page = response.context["subscriptions"]
+        self.assertEqual(page.number, 2)
+        self.assertEqual(len(page), 2)
@@ -0,0 +1,49 @@
+# payment/tracking.py
+"""
+In-memory change tracking for model fields.
+
+Values are captured when a row is loaded (from_db) and after every save, so a
+model can tell what changed without re-reading its own row.
+"""
+
+
+class TrackedFieldsMixin:
+    """
+    Mixin for models. List field attnames in `tracked_fields`; then
+    has_changed(), changed_fields() and previous_value() compare against the
+    values last loaded from or saved to the database.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_tracked_fields()
+        return instance
+
+    def remember_tracked_fields(self, fields=None):
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, "_tracked_values", {})
+        for name in fields if fields is not None else self.tracked_fields:
+            if name in self.tracked_fields and name not in deferred:
+                loaded[name] = getattr(self, name)
+        self._tracked_values = loaded
+
+    def changed_fields(self):
+        """Tracked fields whose value differs from the stored one (empty for unsaved instances)."""
+        loaded = getattr(self, "_tracked_values", {})
+        return {name for name, value in loaded.items() if getattr(self, name) != value}
+
+    def has_changed(self, name):
+        return name in self.changed_fields()
+
+    def previous_value(self, name):
+        return getattr(self, "_tracked_values", {}).get(name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self.remember_tracked_fields(None if update_fields is None else [
+            self._meta.get_field(name).attname for name in update_fields
+        ])
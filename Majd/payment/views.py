@@ -54,7 +54,10 @@ class CheckoutView(FormView):
 
         from django.utils import timezone
         from datetime import timedelta
+        profile = getattr(self.request.user, "academy_admin_profile", None)
+        academy = getattr(profile, "academy", None) if profile else None
         subscription = Subscription.objects.create(
+            academy=academy,
             academy_name=form.cleaned_data["academy_name"],
             plan_type=plan_type,
             price=plan_type.monthly_price,
@@ -1,10 +1,10 @@
 from django.db import models
 from django.utils import timezone
-from django.db.models import Avg
+from django.db.models import Avg, F
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from accounts.models import TrainerProfile
-from parents.models import Child
+from parents.models import Child, ChildReport
 from academies.models import Academy, Session, TrainingClass, Position, SessionSkill
 
 
@@ -195,4 +195,16 @@ def assign_skills_on_session_join(sender, instance, created, **kwargs):
                 "target_level": s_skill.target_level,
                 "current_level": 0
             }
-        )
\ No newline at end of file
+        )
+
+
+
+@receiver([post_save, post_delete], sender=Evaluation)
+@receiver([post_save, post_delete], sender=PlayerSkill)
+def mark_report_stale_after_skill_change(sender, instance, **kwargs):
+    ChildReport.objects.filter(child__player_profile=instance.player_id).update(version=F("version") + 1)
+
+
+@receiver(post_save, sender=PlayerProfile)
+def mark_report_stale_after_profile_change(sender, instance, **kwargs):
+    ChildReport.objects.filter(child_id=instance.child_id).update(version=F("version") + 1)
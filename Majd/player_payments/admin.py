@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PlayerSubscription, PlayerEnrollment, PaymentTransaction
+from .models import PlayerSubscription, PlayerEnrollment, PaymentTransaction, RevenueRollup, IdempotencyKey, WebhookEvent
 
 
 @admin.register(PlayerSubscription)
@@ -69,7 +69,7 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Transaction Details', {
-            'fields': ('enrollment', 'transaction_type', 'status', 'amount', 'currency')
+            'fields': ('enrollment', 'program', 'transaction_type', 'status', 'amount', 'currency')
         }),
         ('Gateway Information', {
             'fields': ('gateway_transaction_id', 'gateway_response'),
@@ -90,6 +90,31 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
 
 
 
+@admin.register(RevenueRollup)
+class RevenueRollupAdmin(admin.ModelAdmin):
+    list_display = ['academy', 'program', 'month', 'gross', 'vat', 'refunds', 'transactions']
+    list_filter = ['academy', 'month']
+    list_select_related = ['academy', 'program']
+    readonly_fields = ['academy', 'program', 'month', 'gross', 'vat', 'refunds', 'transactions']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'endpoint', 'status', 'response_status', 'created_at']
+    list_filter = ['status', 'endpoint']
+    search_fields = ['key', 'user__username']
+    list_select_related = ['user']
+    readonly_fields = ['created_at', 'completed_at']
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'reference', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_id', 'reference']
+    readonly_fields = ['received_at', 'processed_at', 'claim_token']
+
+
 admin.site.site_header = "Majd Player Payments Administration"
 admin.site.site_title = "Majd Player Payments Admin"
 admin.site.index_title = "Welcome to Majd Player Payments Administration"
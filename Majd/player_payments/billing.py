@@ -0,0 +1,61 @@
+# player_payments/billing.py
+"""
+Billing arithmetic.
+
+All money is Decimal, rounded half-up to the halala. A Bill splits an amount
+into base + VAT = total; payment transactions store all three when they are
+created, so invoices, revenue rollups and exports read them back instead of
+recomputing.
+"""
+import calendar
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+
+VAT_RATE = Decimal("0.15")
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+Bill = namedtuple("Bill", "base vat total")
+
+# PlayerSubscription.billing_type -> length of a billing period in calendar months
+BILLING_MONTHS = {"3m": 3, "6m": 6, "12m": 12}
+
+
+def money(value):
+    """Decimal rounded to two places (accepts Decimal, int, float or str)."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def bill_from_base(base, rate=VAT_RATE):
+    """VAT added on top of a net price."""
+    base = money(base)
+    vat = money(base * rate)
+    return Bill(base, vat, base + vat)
+
+
+def bill_from_total(total, rate=VAT_RATE):
+    """Split a VAT-inclusive amount into base and VAT."""
+    total = money(total)
+    vat = money(total * rate / (1 + rate))
+    return Bill(total - vat, vat, total)
+
+
+def vat_included(amount):
+    """VAT portion of a VAT-inclusive amount."""
+    return bill_from_total(amount).vat
+
+
+def add_months(day, months):
+    """Same day `months` calendar months later, clamped to the end of shorter months."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def period_end(start, billing_type):
+    """Last day of the billing period of `billing_type` starting on `start`."""
+    return add_months(start, BILLING_MONTHS[billing_type]) - timedelta(days=1)
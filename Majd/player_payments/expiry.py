@@ -0,0 +1,152 @@
+# player_payments/expiry.py
+"""
+Expiry sweeper.
+
+Moves rows whose end date has passed to their expired state with chunked
+UPDATEs, so hot queries can filter on the (indexed) status column instead of
+comparing dates row by row. Player enrollments with auto_renewal get a pending
+renewal enrollment for the next period before they expire; academies whose
+platform subscription lapses get the usual status email.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from communication.outbox import enqueue_emails
+from .billing import BILLING_MONTHS, period_end
+
+
+EXPIRY_CHUNK_SIZE = 500
+
+
+def _sweep(queryset, chunk_size, expire, before_expire=None):
+    """
+    Expire `queryset` chunk by chunk: fetch a chunk of ids, lock the rows that
+    still match (a row renewed or cancelled meanwhile is skipped) and update
+    them. Returns the number of rows expired.
+    """
+    expired = 0
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return expired
+        with transaction.atomic():
+            ids = list(queryset.filter(pk__in=ids).select_for_update().values_list("pk", flat=True))
+            if before_expire is not None:
+                before_expire(ids)
+            expired += queryset.filter(pk__in=ids).update(**expire)
+
+
+def renewal_for(enrollment):
+    """
+    Unsaved pending enrollment covering the billing period after `enrollment`,
+    in calendar months of its subscription's billing type.
+    """
+    from .models import PlayerEnrollment
+
+    start = enrollment.end_date + timedelta(days=1)
+    billing_type = enrollment.subscription.billing_type
+    if billing_type in BILLING_MONTHS:
+        end = period_end(start, billing_type)
+    else:
+        end = start + (enrollment.end_date - enrollment.start_date)
+    return PlayerEnrollment(
+        subscription_id=enrollment.subscription_id,
+        child_id=enrollment.child_id,
+        parent_id=enrollment.parent_id,
+        status="pending",
+        payment_method=enrollment.payment_method,
+        start_date=start,
+        end_date=end,
+        auto_renewal=True,
+        amount_paid=enrollment.subscription.price,
+        notes=f"Automatic renewal of enrollment #{enrollment.pk}",
+    )
+
+
+def queue_renewals(enrollment_ids):
+    """Create pending renewals for the auto-renewing enrollments among `enrollment_ids`."""
+    from .models import PlayerEnrollment
+
+    enrollments = PlayerEnrollment.objects.filter(pk__in=enrollment_ids, auto_renewal=True).select_related("subscription")
+    renewals = [renewal_for(enrollment) for enrollment in enrollments if enrollment.subscription.is_active]
+    # an existing enrollment for the next period wins (unique subscription/child/start_date)
+    PlayerEnrollment.objects.bulk_create(renewals, ignore_conflicts=True)
+    return len(renewals)
+
+
+def expire_player_enrollments(today=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    from .models import PlayerEnrollment
+
+    today = today or timezone.localdate()
+    renewed = []
+
+    def renew(ids):
+        renewed.append(queue_renewals(ids))
+
+    expired = _sweep(
+        PlayerEnrollment.objects.filter(status="active", end_date__lt=today),
+        chunk_size,
+        dict(status="expired", updated_at=timezone.now()),
+        before_expire=renew,
+    )
+    return expired, sum(renewed)
+
+
+def expire_parent_subscriptions(now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    from parents.models import ParentSubscription
+
+    now = now or timezone.now()
+    return _sweep(
+        ParentSubscription.objects.filter(is_active=True, end_date__lt=now),
+        chunk_size,
+        dict(is_active=False),
+    )
+
+
+def expire_platform_subscriptions(today=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    from payment.models import Subscription, SubscriptionEvent
+
+    today = today or timezone.localdate()
+
+    def notify(ids):
+        # the UPDATE bypasses Subscription.save(), so log the change and queue
+        # the status email it would have sent, in the chunk's transaction
+        emails, events = [], []
+        for subscription in Subscription.objects.filter(pk__in=ids).select_related("plan_type"):
+            subscription.status = Subscription.Status.EXPIRED
+            events.append(SubscriptionEvent(
+                subscription=subscription, kind=SubscriptionEvent.Kind.STATUS,
+                message=f"Status changed from {Subscription.Status.SUCCESSFUL} to {Subscription.Status.EXPIRED}",
+            ))
+            try:
+                emails.append(subscription.status_notification_email())
+            except Exception as e:
+                message, success = f"Failed to queue notification email: {str(e)}", False
+            else:
+                message, success = f"Status notification email queued for {subscription.contact_email}", True
+            events.append(SubscriptionEvent(
+                subscription=subscription, kind=SubscriptionEvent.Kind.NOTIFICATION,
+                message=message[:500], success=success,
+            ))
+        enqueue_emails(emails)
+        SubscriptionEvent.objects.bulk_create(events, batch_size=500)
+
+    return _sweep(
+        Subscription.objects.filter(status=Subscription.Status.SUCCESSFUL, end_date__lt=today),
+        chunk_size,
+        dict(status=Subscription.Status.EXPIRED, updated_at=timezone.now()),
+        before_expire=notify,
+    )
+
+
+def sweep_expired(chunk_size=EXPIRY_CHUNK_SIZE):
+    """Run every sweep. Returns a dict of counts."""
+    enrollments, renewals = expire_player_enrollments(chunk_size=chunk_size)
+    return {
+        "enrollments": enrollments,
+        "renewals": renewals,
+        "parent_subscriptions": expire_parent_subscriptions(chunk_size=chunk_size),
+        "subscriptions": expire_platform_subscriptions(chunk_size=chunk_size),
+    }
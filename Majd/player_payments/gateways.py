@@ -0,0 +1,136 @@
+# player_payments/gateways.py
+"""
+Pluggable payment gateways.
+
+settings.PAYMENT_GATEWAY["BACKEND"] names the gateway class. A gateway starts
+a charge for a pending PaymentTransaction and later reports the outcome
+through a signed webhook (see player_payments.webhooks), which is the only
+place transactions are completed or failed.
+
+SimulatorGateway is a local backend for development and load tests: it
+approves or declines charges at random (FAILURE_RATE) and emits the webhook
+after LATENCY seconds, without any network access.
+
+An empty WEBHOOK_SECRET (the production default when PAYMENT_WEBHOOK_SECRET
+is unset) makes every webhook fail verification.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Gateway-Signature"
+
+DEFAULTS = {
+    "BACKEND": "player_payments.gateways.SimulatorGateway",
+    "WEBHOOK_SECRET": "",
+    "LATENCY": 0.0,
+    "FAILURE_RATE": 0.0,
+}
+
+
+def gateway_settings():
+    return {**DEFAULTS, **getattr(settings, "PAYMENT_GATEWAY", {})}
+
+
+def sign(body, secret=None):
+    """HMAC-SHA256 signature of a webhook body (bytes)."""
+    secret = secret or gateway_settings()["WEBHOOK_SECRET"]
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify(body, signature, secret=None):
+    secret = secret or gateway_settings()["WEBHOOK_SECRET"]
+    if not secret:
+        logger.error("PAYMENT_WEBHOOK_SECRET is not set; rejecting webhook")
+        return False
+    return bool(signature) and hmac.compare_digest(sign(body, secret), signature)
+
+
+class BaseGateway:
+    """Interface every gateway backend implements."""
+
+    name = "base"
+
+    def __init__(self, **options):
+        self.options = {**gateway_settings(), **options}
+
+    def charge(self, transaction):
+        """
+        Start charging a pending transaction. Returns the gateway reference,
+        which is stored on the transaction; the result arrives as a webhook.
+        """
+        raise NotImplementedError
+
+    def verify_webhook(self, body, signature):
+        return verify(body, signature, self.options["WEBHOOK_SECRET"])
+
+
+class SimulatorGateway(BaseGateway):
+    """Offline gateway that answers every charge with a signed webhook."""
+
+    name = "simulator"
+
+    def __init__(self, deliver=None, **options):
+        super().__init__(**options)
+        self.deliver = deliver or self.deliver_locally
+        self.rng = random.Random(self.options.get("SEED"))
+
+    def charge(self, transaction):
+        reference = f"sim_{uuid.uuid4().hex}"
+        succeeded = self.rng.random() >= self.options["FAILURE_RATE"]
+        event = {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "type": "payment.succeeded" if succeeded else "payment.failed",
+            "created": timezone.now().isoformat(),
+            "data": {
+                "reference": reference,
+                "amount": str(transaction.amount),
+                "currency": transaction.currency,
+                "gateway": self.name,
+                "failure_reason": "" if succeeded else "Card declined (simulated)",
+            },
+        }
+        self.emit(event)
+        return reference
+
+    def emit(self, event):
+        body = json.dumps(event).encode()
+        signature = sign(body, self.options["WEBHOOK_SECRET"])
+        latency = self.options["LATENCY"]
+        if latency:
+            timer = threading.Timer(latency, self._deliver_in_thread, args=(body, signature))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.deliver(body, signature)
+
+    def _deliver_in_thread(self, body, signature):
+        try:
+            self.deliver(body, signature)
+        finally:
+            # timer threads get their own database connection
+            connection.close()
+
+    @staticmethod
+    def deliver_locally(body, signature):
+        """Hand the webhook to the same ingestion code the HTTP endpoint uses."""
+        from .webhooks import ingest
+
+        ingest(body, signature)
+
+
+def get_gateway(**options):
+    backend = options.pop("BACKEND", None) or gateway_settings()["BACKEND"]
+    return import_string(backend)(**options)
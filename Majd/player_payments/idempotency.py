@@ -0,0 +1,152 @@
+# player_payments/idempotency.py
+"""
+Idempotency keys for payment endpoints.
+
+A client sends an `Idempotency-Key` header (or `idempotency_key` form field)
+that stays the same across retries of one payment. The first request claims
+the key by inserting a row (unique per user); its successful response is
+stored and replayed for every retry, so a double-click or a retried request
+costs one indexed lookup and never charges twice.
+
+A claim is a lease: if the worker holding a key dies before finishing, a
+retry arriving after CLAIM_LEASE takes the key over instead of getting 409
+forever. A worker that lost its key that way leaves the record alone.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_FIELD = "idempotency_key"
+# form fields that may legitimately differ between retries
+IGNORED_FIELDS = {IDEMPOTENCY_FIELD, "csrfmiddlewaretoken"}
+# a request still in progress after this long is assumed to have died with its worker
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def request_key(request):
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+    return key.strip()[:64] if key else None
+
+
+def request_hash(request):
+    """Fingerprint of the request path and body, ignoring the key itself."""
+    items = sorted(
+        (name, value)
+        for name, values in request.POST.lists() if name not in IGNORED_FIELDS
+        for value in values
+    )
+    payload = repr((request.path, items)).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def replay(record):
+    response = HttpResponse(
+        record.response_body,
+        status=record.response_status,
+        content_type=record.response_content_type or None,
+    )
+    if record.response_location:
+        response["Location"] = record.response_location
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _existing_response(record, fingerprint):
+    if record.request_hash != fingerprint:
+        return JsonResponse(
+            {"success": False, "error": "This idempotency key was already used for a different request"},
+            status=422,
+        )
+    if record.status == IdempotencyKey.Status.COMPLETED:
+        return replay(record)
+    return JsonResponse(
+        {"success": False, "error": "This payment is already being processed"},
+        status=409,
+    )
+
+
+def _take_over(record, now):
+    """Claim an in-progress key whose lease has run out (one conditional UPDATE)."""
+    claimed_at = record.claimed_at or record.created_at
+    if record.status != IdempotencyKey.Status.IN_PROGRESS or claimed_at >= now - CLAIM_LEASE:
+        return False
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk, status=IdempotencyKey.Status.IN_PROGRESS, claimed_at=record.claimed_at,
+    ).update(claimed_at=now)
+    record.claimed_at = now
+    return bool(taken)
+
+
+def _succeeded(response):
+    if response.status_code >= 400:
+        return False
+    if isinstance(response, JsonResponse):
+        try:
+            return json.loads(response.content).get("success", True) is not False
+        except ValueError:
+            return False
+    return True
+
+
+def idempotent(endpoint):
+    """
+    Make a POST view idempotent per (user, key). Requests without a key run as
+    before. Failed responses release the key so the client can retry them.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request_key(request)
+            if request.method != "POST" or key is None:
+                return view(request, *args, **kwargs)
+
+            fingerprint = request_hash(request)
+            now = timezone.now()
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is not None:
+                if record.request_hash != fingerprint or not _take_over(record, now):
+                    return _existing_response(record, fingerprint)
+            else:
+                try:
+                    with transaction.atomic():
+                        record = IdempotencyKey.objects.create(
+                            user=request.user, key=key, endpoint=endpoint, request_hash=fingerprint,
+                            claimed_at=now,
+                        )
+                except IntegrityError:
+                    # a concurrent request claimed the key first
+                    record = IdempotencyKey.objects.get(user=request.user, key=key)
+                    return _existing_response(record, fingerprint)
+
+            # only touch the key while this request still holds the claim
+            claim = IdempotencyKey.objects.filter(pk=record.pk, claimed_at=record.claimed_at)
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                claim.delete()
+                raise
+
+            if not _succeeded(response):
+                claim.delete()
+                return response
+
+            claim.update(
+                status=IdempotencyKey.Status.COMPLETED,
+                response_status=response.status_code,
+                response_body=response.content.decode(response.charset),
+                response_content_type=response.get("Content-Type", ""),
+                response_location=response.get("Location", ""),
+                completed_at=timezone.now(),
+            )
+            return response
+
+        return wrapper
+    return decorator
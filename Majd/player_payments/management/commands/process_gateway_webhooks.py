@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from player_payments.webhooks import process_events, WEBHOOK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Apply queued payment gateway webhooks in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling for new events',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=WEBHOOK_BATCH_SIZE,
+            help='Events claimed and applied per batch',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'processed': 0, 'retrying': 0, 'failed': 0}
+        while True:
+            result = process_events(options['batch_size'])
+            for key in totals:
+                totals[key] += result[key]
+            if result['processed'] or result['failed']:
+                self.stdout.write(
+                    f"  Batch: {result['processed']} processed, {result['retrying']} retrying, {result['failed']} failed"
+                )
+                continue
+
+            # empty queue, or only events waiting for their transaction
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nCompleted! Processed {totals['processed']} webhook events ({totals['failed']} failed)."
+        ))
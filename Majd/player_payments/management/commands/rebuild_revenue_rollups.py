@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from academies.models import Academy
+from player_payments.revenue import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the revenue rollup table from payment transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--academy-slug',
+            type=str,
+            help='Rebuild rollups for a specific academy (by slug)',
+        )
+        parser.add_argument(
+            '--all-academies',
+            action='store_true',
+            help='Rebuild rollups for every academy on the platform',
+        )
+
+    def handle(self, *args, **options):
+        if options['academy_slug']:
+            try:
+                academy = Academy.objects.get(slug=options['academy_slug'])
+            except Academy.DoesNotExist:
+                self.stdout.write(
+                    self.style.ERROR(f'Academy with slug "{options["academy_slug"]}" not found.')
+                )
+                return
+            rows = rebuild_rollups(academy)
+        elif options['all_academies']:
+            rows = rebuild_rollups()
+        else:
+            self.stdout.write(
+                self.style.ERROR('Use --academy-slug or --all-academies.')
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'\nCompleted! Wrote {rows} revenue rollup rows.'))
@@ -0,0 +1,57 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from player_payments.reconciliation import reconcile, read_settlement, RECONCILE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Reconcile payment transactions against a gateway settlement CSV (reference,status,amount,currency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('settlement_file', help='Path to the settlement CSV')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=RECONCILE_CHUNK_SIZE,
+            help='Settlement rows matched per database query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report mismatches without correcting any transaction',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write every mismatch to this CSV file',
+        )
+
+    def handle(self, *args, **options):
+        report = writer = None
+        if options['report']:
+            report = open(options['report'], 'w', newline='', encoding='utf-8')
+            writer = csv.writer(report)
+            writer.writerow(['reference', 'issue', 'detail'])
+
+        try:
+            totals = reconcile(
+                read_settlement(options['settlement_file']),
+                chunk_size=options['chunk_size'],
+                apply=not options['dry_run'],
+                on_issue=writer.writerow if writer else None,
+            )
+        except FileNotFoundError:
+            raise CommandError(f'Settlement file "{options["settlement_file"]}" not found.')
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if report is not None:
+                report.close()
+
+        for kind, count in sorted(totals.items()):
+            if kind not in ('rows', 'corrected'):
+                self.stdout.write(f'  {kind.replace("_", " ").capitalize()}: {count}')
+
+        action = 'would be corrected' if options['dry_run'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(
+            f"\nCompleted! Reconciled {totals['rows']} settlement rows, {totals['corrected']} transactions {action}."
+        ))
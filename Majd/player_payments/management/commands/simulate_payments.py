@@ -0,0 +1,138 @@
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from accounts.models import AcademyAdminProfile, ParentProfile
+from academies.models import Academy
+from parents.models import Child
+from player_payments.gateways import SimulatorGateway
+from player_payments.models import PlayerEnrollment, PlayerSubscription, PaymentTransaction, WebhookEvent
+from player_payments.webhooks import process_events, WEBHOOK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test: run payment lifecycles through the gateway simulator and webhook queue offline. '
+        'Payments are charged to a throwaway academy, subscription and enrollment that are removed afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1000,
+            help='Number of payments to simulate',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds before the simulator sends each webhook',
+        )
+        parser.add_argument(
+            '--failure-rate',
+            type=float,
+            default=0.0,
+            help='Share of charges the simulator declines (0-1)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed for reproducible approvals/declines',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=WEBHOOK_BATCH_SIZE,
+            help='Webhook events processed per batch',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=300.0,
+            help='Give up waiting for webhooks after this many seconds',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the throwaway enrollment, transactions and events instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        academy, enrollment, users = self._fixtures(uuid.uuid4().hex[:8])
+        try:
+            elapsed, count = self._simulate(enrollment, options)
+        finally:
+            if not options['keep']:
+                references = enrollment.transactions.values('gateway_transaction_id')
+                WebhookEvent.objects.filter(reference__in=references).delete()
+                # the academy takes the subscription, enrollment, transactions and rollups with it
+                academy.delete()
+                User.objects.filter(pk__in=users).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nCompleted! {count} payment lifecycles in {elapsed:.2f}s '
+            f'({count / elapsed if elapsed else 0:.1f} payments/s).'
+        ))
+
+    def _fixtures(self, tag):
+        admin = User.objects.create(username=f'payment-load-admin-{tag}')
+        academy = Academy.objects.create(
+            name=f'Payment load test {tag}', description='Load test', city='Riyadh',
+            owner=AcademyAdminProfile.objects.create(user=admin),
+        )
+        subscription = PlayerSubscription.objects.create(
+            title='Load test', academy=academy, price=Decimal('115.00'), billing_type='3m',
+        )
+        parent = User.objects.create(username=f'payment-load-parent-{tag}')
+        child = Child.objects.create(parent=ParentProfile.objects.create(user=parent), first_name='Load test')
+        today = date.today()
+        enrollment = PlayerEnrollment.objects.create(
+            subscription=subscription, child=child, parent=parent, amount_paid=subscription.price,
+            start_date=today, end_date=today + timedelta(days=90),
+        )
+        return academy, enrollment, [admin.pk, parent.pk]
+
+    def _simulate(self, enrollment, options):
+        gateway = SimulatorGateway(
+            LATENCY=options['latency'], FAILURE_RATE=options['failure_rate'], SEED=options['seed'],
+        )
+        count = options['count']
+        started = time.perf_counter()
+
+        references = []
+        for _ in range(count):
+            payment = PaymentTransaction.objects.create(
+                enrollment=enrollment,
+                program=enrollment.subscription.program,
+                transaction_type='renewal',
+                amount=enrollment.subscription.price,
+                notes='Simulated load test payment',
+            )
+            payment.gateway_transaction_id = gateway.charge(payment)
+            payment.save(update_fields=['gateway_transaction_id'])
+            references.append(payment.gateway_transaction_id)
+        charged = time.perf_counter()
+        self.stdout.write(f'  Started {count} charges in {charged - started:.2f}s')
+
+        settled = PaymentTransaction.objects.filter(gateway_transaction_id__in=references).exclude(status='pending')
+        deadline = charged + options['timeout']
+        while time.perf_counter() < deadline:
+            result = process_events(options['batch_size'])
+            if not any(result.values()):
+                if settled.count() >= count:
+                    break
+                time.sleep(0.05)
+        finished = time.perf_counter()
+
+        completed = settled.filter(status='completed').count()
+        failed = settled.filter(status='failed').count()
+        self.stdout.write(
+            f'  Settled {completed + failed}/{count} payments ({completed} completed, {failed} failed) '
+            f'in {finished - charged:.2f}s after charging'
+        )
+        return finished - started, count
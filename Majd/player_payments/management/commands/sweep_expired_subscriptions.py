@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from player_payments.expiry import sweep_expired, EXPIRY_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Expire player enrollments, parent subscriptions and academy subscriptions past their end date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single sweep and exit instead of sweeping periodically',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=3600.0,
+            help='Seconds to wait between sweeps',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPIRY_CHUNK_SIZE,
+            help='Rows expired per UPDATE',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            counts = sweep_expired(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"  Expired {counts['enrollments']} enrollments ({counts['renewals']} renewals queued), "
+                f"{counts['parent_subscriptions']} parent subscriptions, "
+                f"{counts['subscriptions']} academy subscriptions"
+            )
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('\nCompleted! Expiry sweep finished.'))
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+# Frozen copy of the rollup rules as of this migration; later changes to
+# player_payments.revenue must not change what this backfill computes.
+SNAPSHOT_FIELDS = ("enrollment_id", "program_id", "transaction_type", "status", "amount", "created_at", "processed_at")
+VAT_RATE = Decimal("0.15")
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def vat_included(amount):
+    total = amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    return (total * VAT_RATE / (1 + VAT_RATE)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def month_start(value):
+    return timezone.localtime(value).date().replace(day=1) if timezone.is_aware(value) else value.date().replace(day=1)
+
+
+def contribution(data, academy_id):
+    """(key, (gross, vat, refunds, transactions)) for a sale that counts, else None."""
+    if data["amount"] is None or data["transaction_type"] == "refund":
+        return None
+    if data["status"] not in ("completed", "refunded"):
+        return None
+
+    amount = Decimal(data["amount"])
+    refunds = amount if data["status"] == "refunded" else ZERO
+    when = data["processed_at"] or data["created_at"] or timezone.now()
+    return (academy_id, data["program_id"], month_start(when)), (amount, vat_included(amount), refunds, 1)
+
+
+def backfill_program_and_rollups(apps, schema_editor):
+    PaymentTransaction = apps.get_model("player_payments", "PaymentTransaction")
+    PlayerEnrollment = apps.get_model("player_payments", "PlayerEnrollment")
+    RevenueRollup = apps.get_model("player_payments", "RevenueRollup")
+
+    PaymentTransaction.objects.filter(program__isnull=True).update(
+        program=Subquery(
+            PlayerEnrollment.objects.filter(pk=OuterRef("enrollment_id")).values("subscription__program")[:1]
+        )
+    )
+
+    totals = defaultdict(lambda: [ZERO, ZERO, ZERO, 0])
+    values = PaymentTransaction.objects.values_list("enrollment__subscription__academy_id", *SNAPSHOT_FIELDS)
+    for academy_id, *fields in values.iterator(chunk_size=2000):
+        result = contribution(dict(zip(SNAPSHOT_FIELDS, fields)), academy_id)
+        if result is None or academy_id is None:
+            continue
+        key, amounts = result
+        for i, value in enumerate(amounts):
+            totals[key][i] += value
+
+    RevenueRollup.objects.bulk_create(
+        [
+            RevenueRollup(
+                academy_id=academy_id, program_id=program_id, month=month,
+                gross=gross, vat=vat, refunds=refunds, transactions=count,
+            )
+            for (academy_id, program_id, month), (gross, vat, refunds, count) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academies', '0016_exportjob'),
+        ('player_payments', '0002_alter_playerenrollment_child'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='program',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_transactions', to='academies.program'),
+        ),
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('gross', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('vat', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('refunds', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('transactions', models.PositiveIntegerField(default=0)),
+                ('academy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='academies.academy')),
+                ('program', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='academies.program')),
+            ],
+            options={
+                'ordering': ['academy', '-month'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('program__isnull', False)), fields=('academy', 'program', 'month'), name='unique_revenue_rollup'), models.UniqueConstraint(condition=models.Q(('program__isnull', True)), fields=('academy', 'month'), name='unique_unassigned_revenue_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_program_and_rollups, migrations.RunPython.noop),
+    ]
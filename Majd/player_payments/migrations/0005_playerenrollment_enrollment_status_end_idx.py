@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('player_payments', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playerenrollment',
+            index=models.Index(fields=['status', 'end_date'], name='enrollment_status_end_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:21
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+# frozen copy of player_payments.billing.bill_from_total as of this migration
+VAT_RATE = Decimal("0.15")
+CENT = Decimal("0.01")
+
+
+def split_total(total):
+    """(base, vat) of a VAT-inclusive amount, rounded half-up to the halala."""
+    total = Decimal(str(total)).quantize(CENT, rounding=ROUND_HALF_UP)
+    vat = (total * VAT_RATE / (1 + VAT_RATE)).quantize(CENT, rounding=ROUND_HALF_UP)
+    return total - vat, vat
+
+
+def backfill_amounts(apps, schema_editor):
+    """Store the base/VAT split of every existing transaction amount."""
+    PaymentTransaction = apps.get_model("player_payments", "PaymentTransaction")
+    pending = []
+    for txn in PaymentTransaction.objects.filter(amount__isnull=False).only("id", "amount").iterator(chunk_size=2000):
+        txn.base_amount, txn.vat_amount = split_total(txn.amount)
+        pending.append(txn)
+        if len(pending) >= 2000:
+            PaymentTransaction.objects.bulk_update(pending, ["base_amount", "vat_amount"])
+            pending = []
+    PaymentTransaction.objects.bulk_update(pending, ["base_amount", "vat_amount"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('player_payments', '0006_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='base_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='vat_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(backfill_amounts, migrations.RunPython.noop),
+    ]
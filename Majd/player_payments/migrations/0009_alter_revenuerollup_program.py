@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academies', '0017_exportjob_claimed_at'),
+        ('player_payments', '0008_webhookevent_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='revenuerollup',
+            name='program',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revenue_rollups', to='academies.program'),
+        ),
+    ]
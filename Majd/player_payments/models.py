@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from academies.models import Academy, Program
 from parents.models import Child
@@ -125,6 +128,9 @@ class PlayerEnrollment(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['subscription', 'child', 'start_date']
+        indexes = [
+            models.Index(fields=['status', 'end_date'], name='enrollment_status_end_idx'),
+        ]
 
 
 class PaymentTransaction(models.Model):
@@ -144,14 +150,17 @@ class PaymentTransaction(models.Model):
     ]
 
     enrollment = models.ForeignKey(PlayerEnrollment, on_delete=models.CASCADE, related_name="transactions")
+    program = models.ForeignKey(Program, on_delete=models.SET_NULL, related_name="payment_transactions", null=True, blank=True)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPE_CHOICES, default="initial")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
 
-    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    amount = models.DecimalField(max_digits=8, decimal_places=2)  # VAT-inclusive total
+    base_amount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    vat_amount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     currency = models.CharField(max_length=3, default="SAR")
     
  
-    gateway_transaction_id = models.CharField(max_length=200, blank=True, null=True)
+    gateway_transaction_id = models.CharField(max_length=200, blank=True, null=True, db_index=True)
     gateway_response = models.JSONField(default=dict, blank=True)
     
  
@@ -165,5 +174,165 @@ class PaymentTransaction(models.Model):
     def __str__(self):
         return f"{self.enrollment.child.first_name} - {self.amount} {self.currency} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        """Store the base/VAT split of amount whenever it is missing or out of date"""
+        if self.amount is not None:
+            from .billing import bill_from_total, money
+
+            self.amount = money(self.amount)
+            if self.base_amount is None or self.vat_amount is None or self.base_amount + self.vat_amount != self.amount:
+                bill = bill_from_total(self.amount)
+                self.base_amount, self.vat_amount = bill.base, bill.vat
+                update_fields = kwargs.get("update_fields")
+                if update_fields is not None:
+                    kwargs["update_fields"] = {*update_fields, "base_amount", "vat_amount"}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # what this row currently contributes to the revenue rollups
+        from .revenue import SNAPSHOT_FIELDS, snapshot
+        if all(name in instance.__dict__ for name in SNAPSHOT_FIELDS):
+            instance._revenue_snapshot = snapshot(instance)
+        return instance
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class RevenueRollup(models.Model):
+    """Completed payment totals per academy, program and month (amounts are VAT-inclusive)."""
+
+    academy = models.ForeignKey(Academy, on_delete=models.CASCADE, related_name="revenue_rollups")
+    program = models.ForeignKey(Program, on_delete=models.SET_NULL, related_name="revenue_rollups", null=True, blank=True)
+    month = models.DateField()
+
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    vat = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transactions = models.PositiveIntegerField(default=0)
+
+    @property
+    def net(self):
+        return self.gross - self.refunds
+
+    def __str__(self):
+        return f"{self.academy} / {self.program or 'Unassigned'} / {self.month:%Y-%m}: {self.gross}"
+
+    class Meta:
+        ordering = ['academy', '-month']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['academy', 'program', 'month'],
+                condition=Q(program__isnull=False),
+                name='unique_revenue_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['academy', 'month'],
+                condition=Q(program__isnull=True),
+                name='unique_unassigned_revenue_rollup',
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Client-supplied key for a payment request. The first request with a key
+    stores its response; retries with the same key get that response back
+    instead of running the payment again.
+    """
+
+    class Status(models.TextChoices):
+        IN_PROGRESS = 'in_progress', 'In progress'
+        COMPLETED = 'completed', 'Completed'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=64)
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.IN_PROGRESS)
+
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    response_content_type = models.CharField(max_length=100, blank=True)
+    response_location = models.CharField(max_length=500, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # when the request currently running under this key started; see idempotency.CLAIM_LEASE
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user} {self.endpoint} {self.key} ({self.status})"
+
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+
+class WebhookEvent(models.Model):
+    """
+    Gateway webhook as received. The endpoint only verifies and stores it;
+    the process_gateway_webhooks worker applies events in batches.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        PROCESSING = 'processing', 'Processing'
+        PROCESSED = 'processed', 'Processed'
+        FAILED = 'failed', 'Failed'
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50)
+    reference = models.CharField(max_length=200, db_index=True)
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_type} {self.reference} ({self.status})"
+
+    class Meta:
+        ordering = ['received_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'received_at'], name='webhook_queue_idx'),
+            models.Index(fields=['claim_token'], name='webhook_claim_idx'),
+        ]
+
+
+@receiver(post_save, sender=PaymentTransaction)
+def update_revenue_on_save(sender, instance, **kwargs):
+    from .revenue import record_change, snapshot
+
+    before = getattr(instance, "_revenue_snapshot", None)
+    if before is None and not kwargs.get("created"):
+        # loaded with deferred fields; fall back to a full rebuild of the bucket's academy
+        from .revenue import rebuild_rollups
+        rebuild_rollups(instance.enrollment.subscription.academy)
+    else:
+        record_change(before, snapshot(instance))
+    instance._revenue_snapshot = snapshot(instance)
+
+
+@receiver(post_delete, sender=PaymentTransaction)
+def update_revenue_on_delete(sender, instance, **kwargs):
+    from .revenue import record_change
+
+    record_change(getattr(instance, "_revenue_snapshot", None), None)
+
+
+@receiver(pre_delete, sender=Program)
+def merge_program_revenue(sender, instance, **kwargs):
+    from .revenue import merge_into_unassigned
+
+    merge_into_unassigned(instance)
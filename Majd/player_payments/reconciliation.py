@@ -0,0 +1,147 @@
+# player_payments/reconciliation.py
+"""
+Reconcile PaymentTransaction rows against a gateway settlement report.
+
+The report is a CSV with `reference,status,amount,currency` columns (reference
+is our gateway_transaction_id). It is streamed in chunks: each chunk is
+indexed by reference, matched against the transactions loaded (and locked) in
+one query, and status corrections are written with one bulk_update in the
+same transaction. Memory use depends on the chunk size, not the file size.
+A reference that appears more than once in a chunk is reported as a
+duplicate and left alone.
+"""
+import csv
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaymentTransaction
+from .revenue import record_change, snapshot
+
+
+RECONCILE_CHUNK_SIZE = 5000
+
+# settlement statuses -> PaymentTransaction.status
+SETTLEMENT_STATUSES = {
+    "settled": "completed",
+    "succeeded": "completed",
+    "completed": "completed",
+    "failed": "failed",
+    "declined": "failed",
+    "refunded": "refunded",
+}
+
+MISSING = "missing"
+AMOUNT_MISMATCH = "amount_mismatch"
+CURRENCY_MISMATCH = "currency_mismatch"
+UNKNOWN_STATUS = "unknown_status"
+DUPLICATE = "duplicate"
+STATUS_CORRECTED = "status_corrected"
+
+
+def settlement_chunks(rows, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Yield lists of at most chunk_size rows from an iterable of CSV dicts."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _amount(value):
+    try:
+        return Decimal(value).quantize(Decimal("0.01"))
+    except (InvalidOperation, TypeError):
+        return None
+
+
+def reconcile_chunk(chunk, apply=True):
+    """
+    Match one chunk of settlement rows. Returns (issues, corrected): issues is
+    a list of (reference, kind, detail) tuples.
+    """
+    issues, index = [], {}
+    for row in chunk:
+        reference = (row.get("reference") or "").strip()
+        if not reference:
+            continue
+        if reference in index:
+            issues.append((reference, DUPLICATE, "Reference appears more than once in the settlement"))
+            index[reference] = None
+        else:
+            index[reference] = row
+
+    with transaction.atomic():
+        payments = PaymentTransaction.objects.select_related("enrollment").filter(gateway_transaction_id__in=index.keys())
+        if apply:
+            # no webhook or refund may change these rows between matching and writing
+            payments = payments.select_for_update(of=("self",))
+        found = {payment.gateway_transaction_id: payment for payment in payments}
+
+        corrections = []
+        now = timezone.now()
+        for reference, row in index.items():
+            if row is None:
+                continue
+            payment = found.get(reference)
+            if payment is None:
+                issues.append((reference, MISSING, "No transaction with this reference"))
+                continue
+
+            amount = _amount(row.get("amount"))
+            if amount is not None and amount != payment.amount:
+                issues.append((reference, AMOUNT_MISMATCH, f"Settled {amount}, recorded {payment.amount}"))
+            currency = (row.get("currency") or "").strip().upper()
+            if currency and currency != payment.currency:
+                issues.append((reference, CURRENCY_MISMATCH, f"Settled {currency}, recorded {payment.currency}"))
+
+            settled = (row.get("status") or "").strip().lower()
+            status = SETTLEMENT_STATUSES.get(settled)
+            if status is None:
+                issues.append((reference, UNKNOWN_STATUS, f"Unknown settlement status {settled!r}"))
+            elif status != payment.status:
+                issues.append((reference, STATUS_CORRECTED, f"{payment.status} -> {status}"))
+                before = snapshot(payment)
+                payment.status = status
+                payment.processed_at = payment.processed_at or now
+                corrections.append((payment, before))
+
+        if apply and corrections:
+            PaymentTransaction.objects.bulk_update(
+                [payment for payment, _ in corrections], ["status", "processed_at"],
+            )
+            # bulk_update skips the save signals; move the revenue contributions by hand
+            for payment, before in corrections:
+                record_change(before, snapshot(payment))
+    return issues, len(corrections)
+
+
+def reconcile(rows, chunk_size=RECONCILE_CHUNK_SIZE, apply=True, on_issue=None):
+    """
+    Reconcile an iterable of settlement rows (dicts). `on_issue` is called
+    with every (reference, kind, detail). Returns a Counter of results.
+    """
+    totals = Counter()
+    for chunk in settlement_chunks(rows, chunk_size):
+        issues, corrected = reconcile_chunk(chunk, apply=apply)
+        totals["rows"] += len(chunk)
+        totals["corrected"] += corrected
+        for issue in issues:
+            totals[issue[1]] += 1
+            if on_issue is not None:
+                on_issue(issue)
+    return totals
+
+
+def read_settlement(path):
+    """Stream settlement rows from a CSV file."""
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        reader = csv.DictReader(handle)
+        missing = {"reference", "status"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Settlement file is missing the {', '.join(sorted(missing))} column(s)")
+        yield from reader
@@ -0,0 +1,199 @@
+# player_payments/revenue.py
+"""
+Incrementally maintained revenue rollups.
+
+Every save/delete of a PaymentTransaction moves its contribution from the
+bucket it used to count towards (the snapshot taken when it was loaded) to the
+bucket it counts towards now. Dashboards read RevenueRollup rows, whose number
+grows with academies x programs x months, never with transactions.
+
+A refund is counted in exactly one place: on the sale, once its status is
+`refunded` (which is what the gateway, reconciliation and the admin set).
+`refund` transactions only record the money going back and add nothing, so a
+refunded sale with its refund transaction is not counted twice.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .billing import ZERO, vat_included
+
+
+# transaction fields a rollup contribution depends on
+SNAPSHOT_FIELDS = ("enrollment_id", "program_id", "transaction_type", "status", "amount", "vat_amount", "created_at", "processed_at")
+
+
+def month_start(value):
+    return timezone.localtime(value).date().replace(day=1) if timezone.is_aware(value) else value.date().replace(day=1)
+
+
+def snapshot(txn):
+    return {name: getattr(txn, name) for name in SNAPSHOT_FIELDS}
+
+
+def contribution(data, academy_id):
+    """
+    Return (key, amounts) for a transaction snapshot, or None if it does not
+    count towards revenue. key is (academy_id, program_id, month); amounts is
+    (gross, vat, refunds, transactions).
+    """
+    if data is None or data["amount"] is None:
+        return None
+
+    amount = Decimal(data["amount"])
+    status, kind = data["status"], data["transaction_type"]
+    if kind == "refund":
+        # counted on the refunded sale
+        return None
+    if status in ("completed", "refunded"):
+        # stored on the transaction; rows predating the column are split on the fly
+        vat = data.get("vat_amount")
+        vat = Decimal(vat) if vat is not None else vat_included(amount)
+        amounts = (amount, vat, amount if status == "refunded" else ZERO, 1)
+    else:
+        return None
+
+    when = data["processed_at"] or data["created_at"] or timezone.now()
+    return (academy_id, data["program_id"], month_start(when)), amounts
+
+
+def _academy_ids(enrollment_ids):
+    from .models import PlayerEnrollment
+
+    return dict(
+        PlayerEnrollment.objects
+        .filter(pk__in=[pk for pk in enrollment_ids if pk is not None])
+        .values_list("pk", "subscription__academy_id")
+    )
+
+
+def apply_delta(key, gross, vat, refunds, transactions, create=True):
+    from .models import RevenueRollup
+
+    academy_id, program_id, month = key
+    rows = RevenueRollup.objects.filter(academy_id=academy_id, program_id=program_id, month=month)
+    changes = dict(
+        gross=F("gross") + gross,
+        vat=F("vat") + vat,
+        refunds=F("refunds") + refunds,
+        transactions=F("transactions") + transactions,
+    )
+    if rows.update(**changes) or not create:
+        return
+    try:
+        with transaction.atomic():
+            RevenueRollup.objects.create(
+                academy_id=academy_id, program_id=program_id, month=month,
+                gross=gross, vat=vat, refunds=refunds, transactions=transactions,
+            )
+    except IntegrityError:
+        # another writer created the bucket first
+        rows.update(**changes)
+
+
+def record_change(before, after):
+    """
+    Move a transaction's contribution from the `before` snapshot to the `after`
+    snapshot (either may be None for create/delete).
+    """
+    academies = _academy_ids({s["enrollment_id"] for s in (before, after) if s})
+    old = contribution(before, academies.get(before["enrollment_id"])) if before else None
+    new = contribution(after, academies.get(after["enrollment_id"])) if after else None
+    if old == new:
+        return
+
+    with transaction.atomic():
+        if old and old[0][0] is not None:
+            # a missing bucket was already cleared (rebuild or cascade delete)
+            apply_delta(old[0], *(-v for v in old[1]), create=False)
+        if new and new[0][0] is not None:
+            apply_delta(new[0], *new[1])
+
+
+def merge_into_unassigned(program):
+    """
+    Fold a program's rollups into its academy's unassigned (program=None)
+    buckets. Called before the program is deleted: its transactions survive
+    with program=NULL, so their revenue has to follow them.
+    """
+    from .models import RevenueRollup
+
+    with transaction.atomic():
+        for rollup in RevenueRollup.objects.select_for_update().filter(program=program):
+            apply_delta(
+                (rollup.academy_id, None, rollup.month),
+                rollup.gross, rollup.vat, rollup.refunds, rollup.transactions,
+            )
+            rollup.delete()
+
+
+def rebuild_rollups(academy=None):
+    """
+    Recompute rollups from scratch (for one academy, or all of them) with a
+    single aggregate query over the stored amounts. Used to seed the table and
+    to repair it after bulk updates that bypass save().
+    Returns the number of rollup rows written.
+    """
+    from .models import PaymentTransaction, RevenueRollup
+
+    transactions = PaymentTransaction.objects.filter(enrollment__subscription__academy__isnull=False)
+    rollups = RevenueRollup.objects.all()
+    if academy is not None:
+        transactions = transactions.filter(enrollment__subscription__academy=academy)
+        rollups = rollups.filter(academy=academy)
+
+    sale = ~Q(transaction_type="refund") & Q(status__in=["completed", "refunded"])
+    rows = (
+        transactions.filter(sale, amount__isnull=False)
+        .annotate(month=TruncMonth(Coalesce("processed_at", "created_at"), output_field=DateField()))
+        .values("enrollment__subscription__academy_id", "program_id", "month")
+        .annotate(
+            gross=Coalesce(Sum("amount"), ZERO),
+            vat=Coalesce(Sum("vat_amount"), ZERO),
+            refunds=Coalesce(Sum("amount", filter=Q(status="refunded")), ZERO),
+            count=Count("pk"),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+        created = RevenueRollup.objects.bulk_create(
+            [
+                RevenueRollup(
+                    academy_id=row["enrollment__subscription__academy_id"], program_id=row["program_id"],
+                    month=row["month"], gross=row["gross"], vat=row["vat"], refunds=row["refunds"],
+                    transactions=row["count"],
+                )
+                for row in rows
+            ],
+            batch_size=500,
+        )
+    return len(created)
+
+
+def revenue_summary(rollups, months=12):
+    """
+    Totals, per-program and per-month (most recent `months`) breakdowns from a
+    RevenueRollup queryset.
+    """
+    sums = dict(gross=Sum("gross"), vat=Sum("vat"), refunds=Sum("refunds"))
+
+    totals = rollups.aggregate(**sums)
+    totals = {k: v or ZERO for k, v in totals.items()}
+    totals["net"] = totals["gross"] - totals["refunds"]
+
+    by_program = list(
+        rollups.values("program_id", "program__title").annotate(**sums).order_by("-gross")
+    )
+    by_month = list(
+        rollups.values("month").annotate(**sums).order_by("-month")[:months]
+    )
+    for row in by_program + by_month:
+        row["net"] = row["gross"] - row["refunds"]
+    by_month.reverse()
+
+    return {"totals": totals, "by_program": by_program, "by_month": by_month}
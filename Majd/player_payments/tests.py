@@ -0,0 +1,344 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import AcademyAdminProfile, ParentProfile
+from academies.models import Academy
+from communication.models import OutboxEmail
+from parents.models import Child
+from player.models import PlayerProfile
+
+
+def make_academy(name="Test Academy"):
+    user = User.objects.create(username=f"admin-{name}")
+    owner = AcademyAdminProfile.objects.create(user=user)
+    return Academy.objects.create(name=name, description="Test", city="Riyadh", owner=owner)
+
+
+def make_player(academy, first_name):
+    parent = ParentProfile.objects.create(user=User.objects.create(username=f"parent-{first_name}"))
+    child = Child.objects.create(parent=parent, first_name=first_name, date_of_birth=date(2015, 5, 1))
+    return PlayerProfile.objects.create(child=child, academy=academy)
+
+
+class ExpirySweepTest(TestCase):
+    def setUp(self):
+        """Set up an academy with a player enrollment subscription"""
+        from decimal import Decimal
+        from player_payments.models import PlayerSubscription
+
+        self.academy = make_academy()
+        self.player = make_player(self.academy, "Sara")
+        self.subscription = PlayerSubscription.objects.create(
+            title="Monthly", academy=self.academy, price=Decimal("115.00"), billing_type="3m"
+        )
+
+    def enroll(self, start, end, **kwargs):
+        from player_payments.models import PlayerEnrollment
+
+        return PlayerEnrollment.objects.create(
+            subscription=self.subscription, child=self.player.child, parent=self.player.child.parent.user,
+            start_date=start, end_date=end, amount_paid=100, status="active", **kwargs,
+        )
+
+    def test_expired_enrollments_are_swept_in_chunks(self):
+        """Test that enrollments past their end date are expired, auto-renewals queued once"""
+        from player_payments.expiry import expire_player_enrollments
+        from player_payments.models import PlayerEnrollment
+
+        today = date(2025, 6, 1)
+        renewing = self.enroll(date(2025, 1, 1), date(2025, 3, 31), auto_renewal=True)
+        lapsed = self.enroll(date(2025, 2, 1), date(2025, 4, 30))
+        current = self.enroll(date(2025, 5, 1), date(2025, 7, 31))
+
+        self.assertEqual(expire_player_enrollments(today, chunk_size=1), (2, 1))
+        self.assertEqual(expire_player_enrollments(today), (0, 0))
+
+        statuses = dict(PlayerEnrollment.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[renewing.pk], "expired")
+        self.assertEqual(statuses[lapsed.pk], "expired")
+        self.assertEqual(statuses[current.pk], "active")
+
+        renewal = PlayerEnrollment.objects.get(status="pending")
+        # a 3m period in calendar months, not the previous period's day count
+        self.assertEqual((renewal.start_date, renewal.end_date), (date(2025, 4, 1), date(2025, 6, 30)))
+        self.assertEqual(renewal.amount_paid, self.subscription.price)
+
+    def test_parent_and_platform_subscriptions_expire(self):
+        """Test that parent and academy subscriptions past their end date are switched off"""
+        from datetime import timedelta
+        from parents.models import ParentSubscription
+        from payment.models import PlanType, Subscription
+        from player_payments.expiry import sweep_expired
+
+        parent_sub = ParentSubscription.objects.create(
+            parent=self.player.child.parent, academy=self.academy, end_date=timezone.now() - timedelta(days=1),
+        )
+        platform_sub = Subscription.objects.create(
+            academy=self.academy, academy_name=self.academy.name,
+            plan_type=PlanType.objects.create(name="Pro", monthly_price=100),
+            price=100, duration_days=30, start_date=date(2025, 1, 1), end_date=date(2025, 1, 31),
+            contact_email="owner@academy.com", billing_address="Street", status=Subscription.Status.SUCCESSFUL,
+        )
+
+        counts = sweep_expired()
+
+        self.assertEqual(counts["parent_subscriptions"], 1)
+        self.assertEqual(counts["subscriptions"], 1)
+        parent_sub.refresh_from_db()
+        platform_sub.refresh_from_db()
+        self.assertFalse(parent_sub.is_active)
+        self.assertEqual(platform_sub.status, Subscription.Status.EXPIRED)
+        self.assertTrue(platform_sub.events.filter(message__contains="expired").exists())
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.to, ["owner@academy.com"])
+        self.assertIn("Expired", email.subject)
+        self.assertTrue(platform_sub.events.filter(kind="notification", success=True).exists())
+
+    def test_billing_periods_follow_the_calendar(self):
+        """Test that billing periods are whole calendar months, clamped at month ends"""
+        from player_payments.billing import add_months, period_end
+
+        self.assertEqual(add_months(date(2025, 1, 31), 1), date(2025, 2, 28))
+        self.assertEqual(add_months(date(2024, 11, 30), 3), date(2025, 2, 28))
+        self.assertEqual(period_end(date(2025, 2, 1), "3m"), date(2025, 4, 30))
+        self.assertEqual(period_end(date(2025, 2, 1), "12m"), date(2026, 1, 31))
+
+
+class GatewayWebhookTest(TestCase):
+    def setUp(self):
+        """Set up a pending player enrollment"""
+        from decimal import Decimal
+        from player_payments.models import PlayerSubscription, PlayerEnrollment
+
+        self.academy = make_academy()
+        player = make_player(self.academy, "Sara")
+        subscription = PlayerSubscription.objects.create(
+            title="Monthly", academy=self.academy, price=Decimal("115.00"), billing_type="3m"
+        )
+        self.enrollment = PlayerEnrollment.objects.create(
+            subscription=subscription, child=player.child, parent=player.child.parent.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 4, 1), amount_paid=Decimal("115.00"),
+        )
+        self.client.force_login(self.enrollment.parent)
+
+    def test_payment_completes_through_webhook(self):
+        """Test that a charge stays pending until its webhook is processed by the worker"""
+        from player_payments.models import WebhookEvent
+        from player_payments.webhooks import process_events
+
+        self.client.post(reverse("player_payments:complete_payment", args=[self.enrollment.pk]), {"payment_method": "card"})
+
+        payment = self.enrollment.transactions.get()
+        self.assertEqual(payment.status, "pending")
+        self.assertTrue(payment.gateway_transaction_id.startswith("sim_"))
+        self.assertEqual(WebhookEvent.objects.get().reference, payment.gateway_transaction_id)
+
+        self.assertEqual(process_events(), {"processed": 1, "retrying": 0, "failed": 0})
+
+        payment.refresh_from_db()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(payment.status, "completed")
+        self.assertEqual(payment.gateway_response["type"], "payment.succeeded")
+        self.assertEqual(self.enrollment.status, "active")
+
+    def test_webhook_endpoint_verifies_and_deduplicates(self):
+        """Test that the endpoint rejects bad signatures and queues each event once"""
+        import json
+        from player_payments.gateways import sign
+        from player_payments.models import WebhookEvent
+
+        url = reverse("player_payments:gateway_webhook")
+        body = json.dumps({"id": "evt_1", "type": "payment.failed", "data": {"reference": "sim_1"}}).encode()
+
+        response = self.client.post(url, body, content_type="application/json", HTTP_X_GATEWAY_SIGNATURE="bad")
+        self.assertEqual(response.status_code, 400)
+
+        for _ in range(2):
+            response = self.client.post(url, body, content_type="application/json", HTTP_X_GATEWAY_SIGNATURE=sign(body))
+            self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["duplicate"])
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_simulated_load_settles_every_payment(self):
+        """Test that the load test drives declined and approved payments to completion on throwaway data"""
+        from io import StringIO
+        from django.core.management import call_command
+        from player_payments.models import PaymentTransaction, PlayerEnrollment, WebhookEvent
+
+        out = StringIO()
+        call_command("simulate_payments", count=20, failure_rate=0.5, seed=1, keep=True, stdout=out)
+
+        statuses = set(PaymentTransaction.objects.values_list("status", flat=True))
+        self.assertEqual(statuses, {"completed", "failed"})
+        self.assertIn("Settled 20/20", out.getvalue())
+        self.assertFalse(self.enrollment.transactions.exists())
+
+        call_command("simulate_payments", count=5, stdout=StringIO())
+        self.assertEqual(PaymentTransaction.objects.count(), 20)
+        self.assertEqual(WebhookEvent.objects.count(), 20)
+        self.assertEqual(PlayerEnrollment.objects.count(), 2)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, "pending")
+
+    def test_stale_claim_is_taken_over(self):
+        """Test that events left processing by a dead worker are claimed again after the lease"""
+        from datetime import timedelta
+        from player_payments.models import WebhookEvent
+        from player_payments.webhooks import CLAIM_LEASE, claim_events, process_events
+
+        self.client.post(reverse("player_payments:complete_payment", args=[self.enrollment.pk]), {"payment_method": "card"})
+        self.assertEqual(len(claim_events()), 1)
+        self.assertEqual(claim_events(), [])
+
+        WebhookEvent.objects.update(claimed_at=timezone.now() - CLAIM_LEASE - timedelta(seconds=1))
+        self.assertEqual(process_events(), {"processed": 1, "retrying": 0, "failed": 0})
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, "active")
+
+    def test_webhooks_rejected_without_secret(self):
+        """Test that no webhook verifies when the webhook secret is not configured"""
+        import json
+        from player_payments.gateways import sign
+        from player_payments.models import WebhookEvent
+
+        body = json.dumps({"id": "evt_1", "type": "payment.failed", "data": {"reference": "sim_1"}}).encode()
+        with self.settings(PAYMENT_GATEWAY={"WEBHOOK_SECRET": ""}), self.assertLogs("player_payments.gateways", "ERROR"):
+            response = self.client.post(
+                reverse("player_payments:gateway_webhook"), body, content_type="application/json",
+                HTTP_X_GATEWAY_SIGNATURE=sign(body, "dev-webhook-secret"),
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class ReconciliationTest(TestCase):
+    def setUp(self):
+        """Set up an enrollment with gateway-charged transactions"""
+        from decimal import Decimal
+        from player_payments.models import PlayerSubscription, PlayerEnrollment, PaymentTransaction
+
+        self.academy = make_academy()
+        player = make_player(self.academy, "Sara")
+        subscription = PlayerSubscription.objects.create(
+            title="Monthly", academy=self.academy, price=Decimal("115.00"), billing_type="3m"
+        )
+        enrollment = PlayerEnrollment.objects.create(
+            subscription=subscription, child=player.child, parent=player.child.parent.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 4, 1), amount_paid=Decimal("115.00"),
+        )
+        for i, status in enumerate(["pending", "completed", "completed"]):
+            PaymentTransaction.objects.create(
+                enrollment=enrollment, amount=Decimal("115.00"), status=status,
+                gateway_transaction_id=f"ref_{i}", processed_at=timezone.now(),
+            )
+
+    def write_settlement(self, rows):
+        import csv
+        import os
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="")
+        with handle:
+            writer = csv.writer(handle)
+            writer.writerow(["reference", "status", "amount", "currency"])
+            writer.writerows(rows)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_mismatches_are_flagged_and_statuses_corrected(self):
+        """Test that settlement rows are matched in chunks, mismatches reported and statuses fixed"""
+        from io import StringIO
+        from django.core.management import call_command
+        from player_payments.models import PaymentTransaction, RevenueRollup
+
+        path = self.write_settlement([
+            ["ref_0", "settled", "115.00", "SAR"],
+            ["ref_1", "refunded", "115.00", "SAR"],
+            ["ref_2", "settled", "100.00", "SAR"],
+            ["ref_9", "settled", "115.00", "SAR"],
+        ])
+        out = StringIO()
+        call_command("reconcile_payments", path, chunk_size=2, stdout=out)
+
+        statuses = dict(PaymentTransaction.objects.values_list("gateway_transaction_id", "status"))
+        self.assertEqual(statuses, {"ref_0": "completed", "ref_1": "refunded", "ref_2": "completed"})
+        self.assertIn("Amount mismatch: 1", out.getvalue())
+        self.assertIn("Missing: 1", out.getvalue())
+        self.assertIn("4 settlement rows, 2 transactions corrected", out.getvalue())
+
+        rollup = RevenueRollup.objects.get(academy=self.academy)
+        self.assertEqual((rollup.transactions, rollup.refunds), (3, 115))
+
+    def test_dry_run_changes_nothing(self):
+        """Test that a dry run only reports"""
+        from io import StringIO
+        from django.core.management import call_command
+        from player_payments.models import PaymentTransaction
+
+        path = self.write_settlement([["ref_0", "failed", "115.00", "SAR"]])
+        call_command("reconcile_payments", path, dry_run=True, stdout=StringIO())
+
+        self.assertEqual(PaymentTransaction.objects.get(gateway_transaction_id="ref_0").status, "pending")
+
+    def test_duplicate_references_are_reported(self):
+        """Test that a reference repeated within a chunk is flagged and not applied"""
+        from player_payments.models import PaymentTransaction
+        from player_payments.reconciliation import DUPLICATE, reconcile
+
+        issues = []
+        totals = reconcile(
+            [
+                {"reference": "ref_0", "status": "settled", "amount": "115.00"},
+                {"reference": "ref_0", "status": "failed", "amount": "115.00"},
+                {"reference": "ref_1", "status": "settled", "amount": "115.00"},
+            ],
+            on_issue=issues.append,
+        )
+
+        self.assertEqual(issues, [("ref_0", DUPLICATE, "Reference appears more than once in the settlement")])
+        self.assertEqual((totals["rows"], totals["corrected"]), (3, 0))
+        self.assertEqual(PaymentTransaction.objects.get(gateway_transaction_id="ref_0").status, "pending")
+
+
+class BillingTest(TestCase):
+    def test_bills_are_decimal_exact(self):
+        """Test that base, VAT and total always add up to the halala"""
+        from decimal import Decimal
+        from player_payments.billing import bill_from_base, bill_from_total
+
+        self.assertEqual(bill_from_base("199.99"), (Decimal("199.99"), Decimal("30.00"), Decimal("229.99")))
+        for total in ["115.00", "229.99", "0.01", "1000.03"]:
+            bill = bill_from_total(total)
+            self.assertEqual(bill.base + bill.vat, bill.total)
+        self.assertEqual(bill_from_total("115.00").vat, Decimal("15.00"))
+
+    def test_transaction_stores_split_amounts(self):
+        """Test that transactions store base and VAT on save and rollups sum the stored VAT"""
+        from decimal import Decimal
+        from player_payments.models import PlayerSubscription, PlayerEnrollment, PaymentTransaction, RevenueRollup
+        from player_payments.revenue import rebuild_rollups
+
+        academy = make_academy()
+        player = make_player(academy, "Sara")
+        subscription = PlayerSubscription.objects.create(title="Monthly", academy=academy, price=100, billing_type="3m")
+        enrollment = PlayerEnrollment.objects.create(
+            subscription=subscription, child=player.child, parent=player.child.parent.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 4, 1), amount_paid=115,
+        )
+        payment = PaymentTransaction.objects.create(enrollment=enrollment, amount="115", status="completed")
+
+        self.assertEqual((payment.base_amount, payment.vat_amount), (Decimal("100.00"), Decimal("15.00")))
+        payment.amount = Decimal("230.00")
+        payment.save(update_fields=["amount"])
+        payment.refresh_from_db()
+        self.assertEqual(payment.vat_amount, Decimal("30.00"))
+
+        incremental = list(RevenueRollup.objects.values_list("gross", "vat", "transactions"))
+        rebuild_rollups()
+        self.assertEqual(list(RevenueRollup.objects.values_list("gross", "vat", "transactions")), incremental)
+        self.assertEqual(incremental, [(Decimal("230.00"), Decimal("30.00"), 1)])
@@ -16,5 +16,8 @@ urlpatterns = [
     
     # Payment completion
     path('payment/<int:enrollment_id>/complete/', views.complete_payment_view, name='complete_payment'),
+    
+    # Gateway callbacks
+    path('webhooks/gateway/', views.gateway_webhook, name='gateway_webhook'),
 ]
 
@@ -1,11 +1,18 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView
 from django.utils.decorators import method_decorator
 from django.utils import timezone
+from django.db import transaction as db_transaction
 from datetime import timedelta
 from .models import PlayerSubscription, PlayerEnrollment, PaymentTransaction
+from .idempotency import idempotent
+from .gateways import get_gateway, SIGNATURE_HEADER
+from .webhooks import ingest, InvalidWebhook
 from academies.models import Academy, Program
 from parents.models import Child
 
@@ -153,6 +160,7 @@ class EnrollmentView(DetailView):
      
         transaction = PaymentTransaction.objects.create(
             enrollment=enrollment,
+            program=subscription.program,
             transaction_type='initial',
             amount=subscription.price,
         )
@@ -196,6 +204,7 @@ def my_enrollments_view(request):
 
 
 @login_required
+@idempotent("player_payments:complete_payment")
 def complete_payment_view(request, enrollment_id):
     """Handle payment completion for an enrollment"""
     enrollment = get_object_or_404(
@@ -209,23 +218,36 @@ def complete_payment_view(request, enrollment_id):
  
         
         payment_method = request.POST.get('payment_method', enrollment.payment_method)
-        transaction_id = request.POST.get('transaction_id', '')
         
-     
-        enrollment.status = 'active'
-        enrollment.payment_date = timezone.now()
-        enrollment.transaction_id = transaction_id
-        enrollment.save()
+        with db_transaction.atomic():
+            # re-check under a row lock so a double submit opens one transaction
+            enrollment = PlayerEnrollment.objects.select_for_update().filter(pk=enrollment.pk, status='pending').first()
+            if enrollment is None:
+                return redirect('player_payments:enrollment_detail', pk=enrollment_id)
+            
+            enrollment.payment_method = payment_method
+            enrollment.save(update_fields=['payment_method', 'updated_at'])
+            
+       
+            transaction = enrollment.transactions.filter(status='pending').first()
+            if transaction is None:
+                transaction = PaymentTransaction.objects.create(
+                    enrollment=enrollment,
+                    program=enrollment.subscription.program,
+                    transaction_type='initial',
+                    amount=enrollment.amount_paid,
+                    notes=f'Payment for {enrollment.subscription.title}',
+                )
         
-   
-        transaction = enrollment.transactions.filter(status='pending').first()
-        if transaction:
-            transaction.status = 'completed'
-            transaction.processed_at = timezone.now()
-            transaction.gateway_transaction_id = transaction_id
-            transaction.save()
+        if not transaction.gateway_transaction_id:
+            # charge only once the pending transaction is committed and the lock
+            # is released; the gateway confirms (or declines) it through its webhook
+            reference = get_gateway().charge(transaction)
+            PaymentTransaction.objects.filter(
+                pk=transaction.pk, gateway_transaction_id=transaction.gateway_transaction_id,
+            ).update(gateway_transaction_id=reference)
         
-        messages.success(request, f"Payment completed! {enrollment.child.first_name} is now enrolled.")
+        messages.success(request, f"Payment submitted! {enrollment.child.first_name} will be enrolled as soon as it is confirmed.")
         return redirect('player_payments:enrollment_detail', pk=enrollment.pk)
     
     context = {
@@ -251,3 +273,14 @@ def academy_subscriptions_view(request, academy_id):
     
     return render(request, 'player_payments/academy_subscriptions.html', context)
 
+
+@csrf_exempt
+@require_POST
+def gateway_webhook(request):
+    """Receive a signed gateway webhook and queue it for the webhook worker"""
+    try:
+        event, created = ingest(request.body, request.headers.get(SIGNATURE_HEADER))
+    except InvalidWebhook as e:
+        return JsonResponse({"received": False, "error": str(e)}, status=400)
+    
+    return JsonResponse({"received": True, "duplicate": not created})
@@ -0,0 +1,155 @@
+# player_payments/webhooks.py
+"""
+Gateway webhook queue.
+
+ingest() verifies a webhook's signature and stores it (duplicates are
+dropped by event id), so the HTTP endpoint answers quickly. process_events()
+claims a batch of queued events, loads all their transactions in one query
+and completes or fails them, activating the enrollments that were paid for.
+
+Each payment is settled together with its enrollment in one transaction, and
+a claim is a lease: events left in PROCESSING by a worker that died are
+claimed again once CLAIM_LEASE has passed.
+"""
+import json
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .gateways import get_gateway
+from .models import PaymentTransaction, WebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = 200
+MAX_ATTEMPTS = 5
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+def ingest(body, signature, gateway=None):
+    """Verify and queue a webhook. Returns (event, created)."""
+    gateway = gateway or get_gateway()
+    if not gateway.verify_webhook(body, signature):
+        raise InvalidWebhook("Invalid signature")
+    try:
+        event = json.loads(body)
+        event_id, event_type = event["id"], event["type"]
+        reference = event["data"]["reference"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidWebhook("Malformed event")
+
+    return WebhookEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={"event_type": event_type, "reference": reference, "payload": event},
+    )
+
+
+def claim_events(limit=WEBHOOK_BATCH_SIZE):
+    """
+    Claim up to `limit` queued events for this worker (one conditional UPDATE).
+    Events whose claim is older than CLAIM_LEASE are taken over as well.
+    """
+    now = timezone.now()
+    claimable = (
+        Q(status=WebhookEvent.Status.QUEUED)
+        | Q(status=WebhookEvent.Status.PROCESSING, claimed_at__lt=now - CLAIM_LEASE)
+    )
+    ids = list(
+        WebhookEvent.objects.filter(claimable)
+        .order_by("received_at", "id").values_list("pk", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    WebhookEvent.objects.filter(claimable, pk__in=ids).update(
+        status=WebhookEvent.Status.PROCESSING, claim_token=token, claimed_at=now,
+    )
+    return list(WebhookEvent.objects.filter(claim_token=token, status=WebhookEvent.Status.PROCESSING).order_by("received_at", "id"))
+
+
+def apply_event(event, payment, now):
+    """
+    Apply one event to its transaction, activating the enrollment it paid for.
+    Call inside transaction.atomic() so both rows are saved together.
+    """
+    data = event.payload.get("data", {})
+    if payment.status != "pending":
+        # already settled by an earlier event for the same charge
+        return
+
+    payment.gateway_response = event.payload
+    payment.processed_at = now
+    if event.event_type == "payment.succeeded":
+        payment.status = "completed"
+        payment.save()
+        enrollment = payment.enrollment
+        if enrollment.status == "pending":
+            enrollment.status = "active"
+            enrollment.payment_date = now
+            enrollment.updated_at = now
+            enrollment.transaction_id = payment.gateway_transaction_id
+            enrollment.save(update_fields=["status", "payment_date", "transaction_id", "updated_at"])
+    elif event.event_type == "payment.failed":
+        payment.status = "failed"
+        payment.failure_reason = data.get("failure_reason", "")
+        payment.save()
+    else:
+        raise ValueError(f"Unknown event type {event.event_type}")
+
+
+def process_events(batch_size=WEBHOOK_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Process one batch of queued events.
+    Returns {"processed": n, "retrying": n, "failed": n}.
+    """
+    events = claim_events(batch_size)
+    result = {"processed": 0, "retrying": 0, "failed": 0}
+    if not events:
+        return result
+
+    payments = {
+        payment.gateway_transaction_id: payment
+        for payment in PaymentTransaction.objects.select_related("enrollment").filter(
+            gateway_transaction_id__in={event.reference for event in events}
+        )
+    }
+    now = timezone.now()
+    for event in events:
+        event.claim_token = ""
+        event.claimed_at = None
+        event.attempts += 1
+        try:
+            payment = payments.get(event.reference)
+            if payment is None:
+                # the charge may not be committed yet; retry on a later batch
+                raise LookupError(f"No transaction for reference {event.reference}")
+            with transaction.atomic():
+                apply_event(event, payment, now)
+        except Exception as e:
+            logger.warning(f"Webhook {event.event_id} failed: {e}")
+            event.error_message = str(e)
+            if event.attempts >= max_attempts:
+                event.status = WebhookEvent.Status.FAILED
+                result["failed"] += 1
+            else:
+                event.status = WebhookEvent.Status.QUEUED
+                result["retrying"] += 1
+            continue
+
+        event.status = WebhookEvent.Status.PROCESSED
+        event.processed_at = now
+        result["processed"] += 1
+
+    WebhookEvent.objects.bulk_update(
+        events, ["status", "attempts", "error_message", "claim_token", "claimed_at", "processed_at"],
+    )
+    return result